@@ -12,6 +12,8 @@ from utils import *
 
 
 class AstNode(Equality):
+    __slots__ = ("id",)
+
     def __str__(self):
         buf = StringIO.StringIO()
         printer = AstPrinter(buf)
@@ -26,6 +28,8 @@ class AstNode(Equality):
 
 
 class AstModule(AstNode):
+    __slots__ = ("definitions",)
+
     def __init__(self, definitions):
         self.definitions = definitions
 
@@ -40,6 +44,8 @@ class AstModule(AstNode):
 
 
 class AstAttribute(AstNode):
+    __slots__ = ("name",)
+
     def __init__(self, name):
         self.name = name
 
@@ -54,11 +60,15 @@ class AstAttribute(AstNode):
 
 
 class AstDefinition(AstNode):
+    __slots__ = ("attribs",)
+
     def __init__(self, attribs):
         self.attribs = attribs
 
 
 class AstVariableDefinition(AstDefinition):
+    __slots__ = ("pattern", "expression")
+
     def __init__(self, attribs, pattern, expression):
         super(AstVariableDefinition, self).__init__(attribs)
         self.pattern = pattern
@@ -75,6 +85,8 @@ class AstVariableDefinition(AstDefinition):
 
 
 class AstFunctionDefinition(AstDefinition):
+    __slots__ = ("name", "typeParameters", "parameters", "returnType", "body")
+
     def __init__(self, attribs, name, typeParameters, parameters, returnType, body):
         super(AstFunctionDefinition, self).__init__(attribs)
         self.name = name
@@ -103,6 +115,8 @@ class AstFunctionDefinition(AstDefinition):
 
 
 class AstClassDefinition(AstDefinition):
+    __slots__ = ("name", "typeParameters", "constructor", "supertypes", "members")
+
     def __init__(self, attribs, name, typeParameters, constructor, supertypes, members):
         super(AstClassDefinition, self).__init__(attribs)
         self.name = name
@@ -136,6 +150,8 @@ class AstClassDefinition(AstDefinition):
 
 
 class AstPrimaryConstructorDefinition(AstDefinition):
+    __slots__ = ("parameters",)
+
     def __init__(self, attribs, parameters):
         super(AstPrimaryConstructorDefinition, self).__init__(attribs)
         self.parameters = parameters
@@ -151,6 +167,8 @@ class AstPrimaryConstructorDefinition(AstDefinition):
 
 
 class AstTypeParameter(AstDefinition):
+    __slots__ = ("name", "upperBound", "lowerBound")
+
     def __init__(self, attribs, name, upperBound, lowerBound):
         super(AstTypeParameter, self).__init__(attribs)
         self.name = name
@@ -172,6 +190,8 @@ class AstTypeParameter(AstDefinition):
 
 
 class AstParameter(AstDefinition):
+    __slots__ = ("pattern",)
+
     def __init__(self, attribs, pattern):
         super(AstParameter, self).__init__(attribs)
         self.pattern = pattern
@@ -187,10 +207,12 @@ class AstParameter(AstDefinition):
 
 
 class AstPattern(AstNode):
-    pass
+    __slots__ = ()
 
 
 class AstVariablePattern(AstNode):
+    __slots__ = ("name", "ty")
+
     def __init__(self, name, ty):
         self.name = name
         self.ty = ty
@@ -209,10 +231,12 @@ class AstVariablePattern(AstNode):
 
 
 class AstType(AstNode):
-    pass
+    __slots__ = ()
 
 
 class AstUnitType(AstType):
+    __slots__ = ()
+
     def __repr__(self):
         return "AstUnitType"
 
@@ -221,6 +245,8 @@ class AstUnitType(AstType):
 
 
 class AstI8Type(AstType):
+    __slots__ = ()
+
     def __repr__(self):
         return "AstI8Type"
 
@@ -229,6 +255,8 @@ class AstI8Type(AstType):
 
 
 class AstI16Type(AstType):
+    __slots__ = ()
+
     def __repr__(self):
         return "AstI16Type"
 
@@ -237,6 +265,8 @@ class AstI16Type(AstType):
 
 
 class AstI32Type(AstType):
+    __slots__ = ()
+
     def __repr__(self):
         return "AstI32Type"
 
@@ -245,6 +275,8 @@ class AstI32Type(AstType):
 
 
 class AstI64Type(AstType):
+    __slots__ = ()
+
     def __repr__(self):
         return "AstI64Type"
 
@@ -253,6 +285,8 @@ class AstI64Type(AstType):
 
 
 class AstF32Type(AstType):
+    __slots__ = ()
+
     def __repr__(self):
         return "AstF32Type"
 
@@ -261,6 +295,8 @@ class AstF32Type(AstType):
 
 
 class AstF64Type(AstType):
+    __slots__ = ()
+
     def __repr__(self):
         return "AstF64Type"
 
@@ -269,6 +305,8 @@ class AstF64Type(AstType):
 
 
 class AstBooleanType(AstType):
+    __slots__ = ()
+
     def __repr__(self):
         return "AstBooleanType"
 
@@ -277,6 +315,8 @@ class AstBooleanType(AstType):
 
 
 class AstClassType(AstType):
+    __slots__ = ("name", "typeArguments", "flags")
+
     def __init__(self, name, typeArguments, flags=None):
         if flags is None:
             flags = set()
@@ -300,10 +340,12 @@ class AstClassType(AstType):
 
 
 class AstExpression(AstNode):
-    pass
+    __slots__ = ()
 
 
 class AstLiteralExpression(AstExpression):
+    __slots__ = ("literal",)
+
     def __init__(self, literal):
         self.literal = literal
 
@@ -318,6 +360,8 @@ class AstLiteralExpression(AstExpression):
 
 
 class AstVariableExpression(AstExpression):
+    __slots__ = ("name",)
+
     def __init__(self, name):
         self.name = name
 
@@ -332,6 +376,8 @@ class AstVariableExpression(AstExpression):
 
 
 class AstThisExpression(AstExpression):
+    __slots__ = ()
+
     def __repr__(self):
         return "AstThisExpression"
 
@@ -340,6 +386,8 @@ class AstThisExpression(AstExpression):
 
 
 class AstSuperExpression(AstExpression):
+    __slots__ = ()
+
     def __repr__(self):
         return "AstSuperExpression"
 
@@ -348,6 +396,8 @@ class AstSuperExpression(AstExpression):
 
 
 class AstBlockExpression(AstExpression):
+    __slots__ = ("statements",)
+
     def __init__(self, statements):
         self.statements = statements
 
@@ -362,6 +412,8 @@ class AstBlockExpression(AstExpression):
 
 
 class AstAssignExpression(AstExpression):
+    __slots__ = ("left", "right")
+
     def __init__(self, left, right):
         self.left = left
         self.right = right
@@ -377,6 +429,8 @@ class AstAssignExpression(AstExpression):
 
 
 class AstPropertyExpression(AstExpression):
+    __slots__ = ("receiver", "propertyName")
+
     def __init__(self, receiver, propertyName):
         self.receiver = receiver
         self.propertyName = propertyName
@@ -395,6 +449,8 @@ class AstPropertyExpression(AstExpression):
 
 
 class AstCallExpression(AstExpression):
+    __slots__ = ("callee", "typeArguments", "arguments")
+
     def __init__(self, callee, typeArguments, arguments):
         self.callee = callee
         self.typeArguments = typeArguments
@@ -412,6 +468,8 @@ class AstCallExpression(AstExpression):
 
 
 class AstUnaryExpression(AstExpression):
+    __slots__ = ("operator", "expr")
+
     def __init__(self, operator, expr):
         self.operator = operator
         self.expr = expr
@@ -430,6 +488,8 @@ class AstUnaryExpression(AstExpression):
 
 
 class AstBinaryExpression(AstExpression):
+    __slots__ = ("operator", "left", "right")
+
     def __init__(self, operator, left, right):
         self.operator = operator
         self.left = left
@@ -449,6 +509,8 @@ class AstBinaryExpression(AstExpression):
 
 
 class AstFunctionValueExpression(AstExpression):
+    __slots__ = ("expr",)
+
     def __init__(self, expr):
         self.expr = expr
 
@@ -463,6 +525,8 @@ class AstFunctionValueExpression(AstExpression):
 
 
 class AstIfExpression(AstExpression):
+    __slots__ = ("condition", "trueExpr", "falseExpr")
+
     def __init__(self, condition, trueExpr, falseExpr):
         self.condition = condition
         self.trueExpr = trueExpr
@@ -480,6 +544,8 @@ class AstIfExpression(AstExpression):
 
 
 class AstWhileExpression(AstExpression):
+    __slots__ = ("condition", "body")
+
     def __init__(self, condition, body):
         self.condition = condition
         self.body = body
@@ -496,6 +562,8 @@ class AstWhileExpression(AstExpression):
 
 
 class AstBreakExpression(AstExpression):
+    __slots__ = ()
+
     def __repr__(self):
         return "AstBreakExpression"
 
@@ -504,6 +572,8 @@ class AstBreakExpression(AstExpression):
 
 
 class AstContinueExpression(AstExpression):
+    __slots__ = ()
+
     def __repr__(self):
         return "AstContinueExpression"
 
@@ -512,6 +582,8 @@ class AstContinueExpression(AstExpression):
 
 
 class AstPartialFunctionExpression(AstExpression):
+    __slots__ = ("cases",)
+
     def __init__(self, cases):
         self.cases = cases
 
@@ -526,6 +598,8 @@ class AstPartialFunctionExpression(AstExpression):
 
 
 class AstPartialFunctionCase(AstNode):
+    __slots__ = ("pattern", "condition", "expression")
+
     def __init__(self, pattern, condition, expression):
         self.pattern = pattern
         self.condition = condition
@@ -543,6 +617,8 @@ class AstPartialFunctionCase(AstNode):
 
 
 class AstMatchExpression(AstExpression):
+    __slots__ = ("expression", "matcher")
+
     def __init__(self, expression, matcher):
         self.expression = expression
         self.matcher = matcher
@@ -559,6 +635,8 @@ class AstMatchExpression(AstExpression):
 
 
 class AstThrowExpression(AstExpression):
+    __slots__ = ("exception",)
+
     def __init__(self, exception):
         self.exception = exception
 
@@ -573,6 +651,8 @@ class AstThrowExpression(AstExpression):
 
 
 class AstTryCatchExpression(AstExpression):
+    __slots__ = ("expression", "catchHandler", "finallyHandler")
+
     def __init__(self, expression, catchHandler, finallyHandler):
         self.expression = expression
         self.catchHandler = catchHandler
@@ -590,6 +670,8 @@ class AstTryCatchExpression(AstExpression):
 
 
 class AstLambdaExpression(AstExpression):
+    __slots__ = ("name", "typeParameters", "parameters", "body")
+
     def __init__(self, name, typeParameters, parameters, body):
         self.name = name
         self.typeParameters = typeParameters
@@ -611,6 +693,8 @@ class AstLambdaExpression(AstExpression):
 
 
 class AstReturnExpression(AstExpression):
+    __slots__ = ("expression",)
+
     def __init__(self, expression):
         self.expression = expression
 
@@ -625,10 +709,12 @@ class AstReturnExpression(AstExpression):
 
 
 class AstLiteral(AstNode):
-    pass
+    __slots__ = ()
 
 
 class AstIntegerLiteral(AstLiteral):
+    __slots__ = ("value", "width")
+
     def __init__(self, value, width=64):
         self.value = value
         self.width = width
@@ -644,6 +730,8 @@ class AstIntegerLiteral(AstLiteral):
 
 
 class AstFloatLiteral(AstLiteral):
+    __slots__ = ("value", "width")
+
     def __init__(self, value, width=64):
         self.value = value
         self.width = width
@@ -659,6 +747,8 @@ class AstFloatLiteral(AstLiteral):
 
 
 class AstBooleanLiteral(AstLiteral):
+    __slots__ = ("value",)
+
     def __init__(self, value):
         self.value = value
 
@@ -673,6 +763,8 @@ class AstBooleanLiteral(AstLiteral):
 
 
 class AstNullLiteral(AstLiteral):
+    __slots__ = ()
+
     def __repr__(self):
         return "AstNullLiteral"
 
@@ -681,6 +773,8 @@ class AstNullLiteral(AstLiteral):
 
 
 class AstStringLiteral(AstLiteral):
+    __slots__ = ("value",)
+
     def __init__(self, value):
         self.value = value
 
@@ -720,8 +814,8 @@ class AstPrinter(AstNodeVisitor):
 
 
 class AstEnumerator(AstNodeVisitor):
-    def __init__(self):
-        self.counter = Counter()
+    def __init__(self, counter=None):
+        self.counter = counter if counter is not None else Counter()
 
     def visitDefault(self, node):
         node.id = self.counter()
@@ -730,6 +824,10 @@ class AstEnumerator(AstNodeVisitor):
         self.visitChildren(node)
 
 
-def addNodeIds(ast):
-    enumerator = AstEnumerator()
+def addNodeIds(ast, counter=None):
+    """Assigns an id to each node in ast in preorder.
+
+    Ids are taken from counter, which starts at 0 by default. Returns the next unused id."""
+    enumerator = AstEnumerator(counter)
     enumerator.visit(ast)
+    return enumerator.counter.value()
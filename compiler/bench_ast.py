@@ -0,0 +1,85 @@
+# Copyright 2014, Jay Conrod. All rights reserved.
+#
+# This file is part of Gypsum. Use of this source code is governed by
+# the GPL license that can be found in the LICENSE.txt file.
+
+
+# Measures the memory used by the AST of a large synthetic program.
+#
+# The program is built by concatenating the sources until it has at least --lines lines. It is
+# lexed first, then parsed, and the growth in peak RSS during the parse is reported along with
+# the size of the node objects themselves (including each node's __dict__, if it has one; lists
+# and strings referenced by nodes are not counted).
+#
+# Usage: python bench_ast.py [--lines n] [file.gy ...]
+# With no files, the examples directory is used.
+
+
+import argparse
+import glob
+import os.path
+import sys
+
+from layout import layout
+from lexer import lex
+from parser import parse
+from stats import CompileStats
+
+
+def countNodeBytes(node):
+    count = 0
+    size = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        size += sys.getsizeof(node)
+        if hasattr(node, "__dict__"):
+            size += sys.getsizeof(node.__dict__)
+        stack.extend(child for child in node.children() if child is not None)
+    return count, size
+
+
+def buildProgram(filenames, lineCount):
+    sources = []
+    for filename in filenames:
+        with open(filename) as f:
+            sources.append(f.read())
+    text = "".join(sources)
+    copies = -(-lineCount // text.count("\n"))
+    return text * copies
+
+
+def main():
+    sys.setrecursionlimit(10000)
+    cmdline = argparse.ArgumentParser(description="Benchmarks AST memory use")
+    cmdline.add_argument("--lines", type=int, default=50000,
+                         help="minimum number of lines in the synthetic program")
+    cmdline.add_argument("sources", metavar="source", nargs="*",
+                         help="source files to parse")
+    args = cmdline.parse_args()
+
+    filenames = args.sources
+    if not filenames:
+        examplesDir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   os.pardir, "examples")
+        filenames = sorted(glob.glob(os.path.join(examplesDir, "*.gy")))
+    text = buildProgram(filenames, args.lines)
+
+    stats = CompileStats("synthetic.gy")
+    tokens = layout(lex("synthetic.gy", text))
+    with stats.phase("parse"):
+        ast = parse("synthetic.gy", tokens)
+    phase = stats.phases[0]
+    nodeCount, nodeBytes = countNodeBytes(ast)
+
+    print "lines:            %d" % text.count("\n")
+    print "nodes:            %d" % nodeCount
+    print "node bytes:       %d (%.1f per node)" % (nodeBytes, float(nodeBytes) / nodeCount)
+    print "parse time:       %.2f s" % phase.wallTime
+    print "peak RSS growth:  %d KB (%.1f bytes per node)" % \
+        (phase.peakRssDelta // 1024, float(phase.peakRssDelta) / nodeCount)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# Copyright 2014, Jay Conrod. All rights reserved.
+#
+# This file is part of Gypsum. Use of this source code is governed by
+# the GPL license that can be found in the LICENSE.txt file.
+
+
+# Compares reading a whole package with reading one function through a lazy view.
+#
+# A synthetic program with --functions functions is compiled into a temporary package. The
+# package is then read with deserialize and with LazyPackage. For each, the time taken and
+# the number of objects left alive are printed.
+#
+# Usage: python bench_package.py [--functions n]
+
+
+import argparse
+import gc
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import time
+
+from compile_info import CompileInfo
+from compiler import compile
+from deserialize import deserialize, LazyPackage
+from layout import layout
+from lexer import lex
+from parser import parse
+from scope_analysis import analyzeDeclarations, analyzeInheritance, convertClosures, \
+                           flattenClasses
+from serialize import serialize
+from type_analysis import analyzeTypes
+
+
+def buildProgram(functionCount):
+    lines = []
+    for index in xrange(functionCount):
+        lines.append("def fn%d(x: i64) =\n" % index)
+        lines.append("  var y = x * %d + 1\n" % index)
+        lines.append("  print(\"s%d\")\n" % index)
+        lines.append("  if (y > 100) y - x else y + x\n")
+    return "".join(lines)
+
+
+def compileProgram(source, fileName):
+    tokens = layout(lex("package.gy", source))
+    info = CompileInfo(parse("package.gy", tokens))
+    for fn in (analyzeDeclarations, analyzeInheritance, analyzeTypes, convertClosures,
+               flattenClasses, compile):
+        fn(info)
+    serialize(info.package, fileName)
+
+
+def measure(name, fn):
+    gc.collect()
+    objectCount = len(gc.get_objects())
+    start = time.time()
+    result = fn()
+    elapsed = time.time() - start
+    gc.collect()
+    print "%-28s %9.2f ms %9d objects" % \
+        (name, 1000 * elapsed, len(gc.get_objects()) - objectCount)
+    return result
+
+
+def main():
+    sys.setrecursionlimit(10000)
+    cmdline = argparse.ArgumentParser(description="Benchmarks lazy package loading")
+    cmdline.add_argument("--functions", type=int, default=5000,
+                         help="number of functions in the package")
+    args = cmdline.parse_args()
+
+    tempDir = tempfile.mkdtemp()
+    try:
+        fileName = os.path.join(tempDir, "package.csp")
+        compileProgram(buildProgram(args.functions), fileName)
+        print "%d functions, %d bytes" % (args.functions, os.path.getsize(fileName))
+        target = args.functions // 2
+
+        package = measure("deserialize", lambda: deserialize(fileName))
+        del package
+        lazyPackage = measure("LazyPackage", lambda: LazyPackage(fileName))
+        measure("first getFunction", lambda: lazyPackage.getFunction(target))
+        measure("second getFunction", lambda: lazyPackage.getFunction(target + 1))
+        lazyPackage.close()
+    finally:
+        shutil.rmtree(tempDir)
+
+
+if __name__ == "__main__":
+    main()
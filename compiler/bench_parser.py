@@ -0,0 +1,176 @@
+# Copyright 2014, Jay Conrod. All rights reserved.
+#
+# This file is part of Gypsum. Use of this source code is governed by
+# the GPL license that can be found in the LICENSE.txt file.
+
+
+# Measures how much of the time spent parsing each file goes to building the grammar.
+# "rebuilt" discards the cached grammar before every file, which is what parse used to do.
+# "cached" builds it once and shares it between files.
+#
+# With --allocations, counts the readers, results, and locations created while parsing
+# instead. With --reparse, compares a full parse with reparse after renaming one symbol in
+# the middle of each file. --scale concatenates the sources into one large synthetic file.
+#
+# Usage: python bench_parser.py [-n iterations] [--scale n] [--allocations | --reparse]
+#                               [file.gy ...]
+# With no files, the examples directory is used.
+
+
+import argparse
+import glob
+import os.path
+import sys
+import time
+
+import combinators
+import token
+from layout import layout
+from lexer import lex
+from parser import clearGrammarCache, module, parse, parseDefinitions, reparse
+
+
+def readSources(filenames):
+    sources = []
+    for filename in filenames:
+        with open(filename) as f:
+            sources.append((filename, f.read()))
+    return sources
+
+
+def scaleSources(sources, scale):
+    text = "".join(source for _, source in sources)
+    return [("synthetic.gy", text * scale)]
+
+
+def countAllocations(sources, iterations):
+    """Parses each source and returns the number of instances created of each class."""
+    classes = [("readers", combinators.Reader),
+               ("successes", combinators.Success),
+               ("failures", combinators.Failure),
+               ("locations", token.Location)]
+    counts = dict((name, 0) for name, _ in classes)
+    def makeCountingInit(name, init):
+        def countingInit(self, *args, **kwargs):
+            counts[name] += 1
+            init(self, *args, **kwargs)
+        return countingInit
+
+    originalInits = []
+    for name, cls in classes:
+        init = cls.__dict__["__init__"]
+        originalInits.append((cls, init))
+        cls.__init__ = makeCountingInit(name, init)
+
+    try:
+        tokenLists = [(filename, layout(lex(filename, source))) for filename, source in sources]
+        for name in counts:
+            counts[name] = 0
+        for _ in xrange(iterations):
+            for filename, tokens in tokenLists:
+                parse(filename, tokens)
+    finally:
+        for cls, init in originalInits:
+            cls.__init__ = init
+    tokenCount = iterations * sum(len(tokens) for _, tokens in tokenLists)
+    return counts, tokenCount
+
+
+def timeParses(sources, iterations, rebuild):
+    tokenLists = [(filename, layout(lex(filename, source))) for filename, source in sources]
+    start = time.time()
+    for _ in xrange(iterations):
+        for filename, tokens in tokenLists:
+            if rebuild:
+                clearGrammarCache()
+            parse(filename, tokens)
+    return time.time() - start
+
+
+def renameMiddleSymbol(tokens):
+    """Returns a copy of tokens with the symbol nearest the middle renamed."""
+    index = len(tokens) // 2
+    while index < len(tokens) and tokens[index].tag is not token.SYMBOL:
+        index += 1
+    edited = list(tokens)
+    if index < len(tokens):
+        old = tokens[index]
+        edited[index] = token.Token(old.text + "_", old.tag, old.location)
+    return edited
+
+
+def timeReparses(sources, iterations):
+    parses = []
+    for filename, source in sources:
+        tokens = layout(lex(filename, source))
+        parses.append((filename, parseDefinitions(filename, tokens), renameMiddleSymbol(tokens)))
+    fullTime = 0.0
+    reparseTime = 0.0
+    for _ in xrange(iterations):
+        for filename, previous, edited in parses:
+            start = time.time()
+            parse(filename, edited)
+            fullTime += time.time() - start
+            start = time.time()
+            reparse(filename, edited, previous)
+            reparseTime += time.time() - start
+    return fullTime, reparseTime
+
+
+def timeSetup(iterations, rebuild):
+    start = time.time()
+    for _ in xrange(iterations):
+        if rebuild:
+            clearGrammarCache()
+        module()
+    return time.time() - start
+
+
+def main():
+    sys.setrecursionlimit(10000)
+    cmdline = argparse.ArgumentParser(description="Benchmarks per-file parser setup")
+    cmdline.add_argument("-n", "--iterations", type=int, default=20,
+                         help="number of times each file is parsed")
+    cmdline.add_argument("--scale", type=int, default=1,
+                         help="concatenate the sources this many times into one file")
+    cmdline.add_argument("--allocations", action="store_true",
+                         help="count objects created instead of measuring time")
+    cmdline.add_argument("--reparse", action="store_true",
+                         help="measure reparsing after an edit instead of setup")
+    cmdline.add_argument("sources", metavar="source", nargs="*",
+                         help="source files to parse")
+    args = cmdline.parse_args()
+
+    filenames = args.sources
+    if not filenames:
+        examplesDir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   os.pardir, "examples")
+        filenames = sorted(glob.glob(os.path.join(examplesDir, "*.gy")))
+    sources = readSources(filenames)
+    if args.scale > 1:
+        sources = scaleSources(sources, args.scale)
+
+    if args.allocations:
+        counts, tokenCount = countAllocations(sources, args.iterations)
+        for name in sorted(counts):
+            print "%-10s %10d  %6.2f per token" % \
+                (name, counts[name], float(counts[name]) / tokenCount)
+        return
+
+    fileCount = len(sources) * args.iterations
+
+    if args.reparse:
+        fullTime, reparseTime = timeReparses(sources, args.iterations)
+        print "full parse %8.3f ms/file   reparse %8.3f ms/file" % \
+            (1000 * fullTime / fileCount, 1000 * reparseTime / fileCount)
+        return
+
+    for name, rebuild in [("rebuilt", True), ("cached", False)]:
+        setupTime = timeSetup(fileCount, rebuild)
+        parseTime = timeParses(sources, args.iterations, rebuild)
+        print "%-8s setup %8.3f ms/file   parse %8.3f ms/file" % \
+            (name, 1000 * setupTime / fileCount, 1000 * parseTime / fileCount)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# Copyright 2014, Jay Conrod. All rights reserved.
+#
+# This file is part of Gypsum. Use of this source code is governed by
+# the GPL license that can be found in the LICENSE.txt file.
+
+
+# Measures the cost of string literals in code generation and serialization.
+#
+# A synthetic program is generated with --literals string literals, spread over functions with
+# --per-function literals each. Every literal appears twice, so half of the lookups in the
+# package's string table find an existing string. The program is compiled once, and the time
+# taken by each phase is printed.
+#
+# Usage: python bench_strings.py [--literals n] [--per-function n]
+
+
+import argparse
+import os
+import sys
+import time
+
+from compile_info import CompileInfo
+from compiler import compile
+from layout import layout
+from lexer import lex
+from parser import parse
+from scope_analysis import analyzeDeclarations, analyzeInheritance, convertClosures, \
+                           flattenClasses
+from serialize import serialize
+from type_analysis import analyzeTypes
+
+
+def buildProgram(literalCount, perFunction):
+    distinctCount = max(1, literalCount // 2)
+    lines = []
+    for index in xrange(literalCount):
+        if index % perFunction == 0:
+            lines.append("def fn%d =\n" % (index // perFunction))
+        lines.append("  \"literal %d\"\n" % (index % distinctCount))
+    return "".join(lines)
+
+
+class Timer(object):
+    def __init__(self):
+        self.times = []
+
+    def time(self, name, fn, *args):
+        start = time.time()
+        result = fn(*args)
+        self.times.append((name, time.time() - start))
+        return result
+
+
+def main():
+    sys.setrecursionlimit(10000)
+    cmdline = argparse.ArgumentParser(description="Benchmarks string literals")
+    cmdline.add_argument("--literals", type=int, default=100000,
+                         help="number of string literals in the program")
+    cmdline.add_argument("--per-function", type=int, default=100,
+                         help="number of string literals in each function")
+    args = cmdline.parse_args()
+
+    filename = "strings.gy"
+    source = buildProgram(args.literals, args.per_function)
+    timer = Timer()
+    tokens = timer.time("lex", lambda: list(lex(filename, source)))
+    tokens = timer.time("layout", layout, tokens)
+    ast = timer.time("parse", parse, filename, tokens)
+    info = CompileInfo(ast)
+    for name, fn in [("analyzeDeclarations", analyzeDeclarations),
+                     ("analyzeInheritance", analyzeInheritance),
+                     ("analyzeTypes", analyzeTypes),
+                     ("convertClosures", convertClosures),
+                     ("flattenClasses", flattenClasses),
+                     ("compile", compile)]:
+        timer.time(name, fn, info)
+    timer.time("serialize", serialize, info.package, os.devnull)
+
+    print "%d literals, %d distinct strings, %d functions" % \
+        (args.literals, len(info.package.strings), len(info.package.functions))
+    for name, elapsed in timer.times:
+        print "%-20s %9.2f ms" % (name, 1000 * elapsed)
+
+
+if __name__ == "__main__":
+    main()
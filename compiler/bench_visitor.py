@@ -0,0 +1,132 @@
+# Copyright 2014, Jay Conrod. All rights reserved.
+#
+# This file is part of Gypsum. Use of this source code is governed by
+# the GPL license that can be found in the LICENSE.txt file.
+
+
+# Measures the cost of visiting AST nodes with each visitor.
+#
+# The walks visit every node of one large synthetic module, built by concatenating the sources
+# --scale times, with a visitor which does nothing but visit children, and with AstPrinter and
+# AstEnumerator. The analysis visitors need a consistent program, so each source is compiled
+# separately and the passes driving DeclarationVisitor, InheritanceVisitor, TypeVisitor, and
+# CompileVisitor are timed as a whole. Times are per AST node visited.
+#
+# Usage: python bench_visitor.py [-n iterations] [--scale n] [file.gy ...]
+# With no files, the examples directory is used.
+
+
+import argparse
+import glob
+import os
+import os.path
+import sys
+import time
+
+from ast import AstEnumerator, AstNodeVisitor, AstPrinter
+from compile_info import CompileInfo
+from compiler import compile
+from layout import layout
+from lexer import lex
+from parser import parse
+from scope_analysis import analyzeDeclarations, analyzeInheritance, convertClosures, \
+                           flattenClasses
+from type_analysis import analyzeTypes
+
+
+class WalkVisitor(AstNodeVisitor):
+    def visitDefault(self, node):
+        self.visitChildren(node)
+
+
+def countNodes(node):
+    return 1 + sum(countNodes(child) for child in node.children() if child is not None)
+
+
+def readSources(filenames):
+    sources = []
+    for filename in filenames:
+        with open(filename) as f:
+            sources.append((filename, f.read()))
+    return sources
+
+
+def bestTime(fn, iterations):
+    best = None
+    for _ in xrange(iterations):
+        start = time.time()
+        fn()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def timeWalks(sources, scale, iterations):
+    text = "".join(source for _, source in sources) * scale
+    ast = parse("synthetic.gy", layout(lex("synthetic.gy", text)))
+    nodeCount = countNodes(ast)
+    devNull = open(os.devnull, "w")
+    walkers = [("WalkVisitor", lambda: WalkVisitor().visit(ast)),
+               ("AstPrinter", lambda: AstPrinter(devNull).visit(ast)),
+               ("AstEnumerator", lambda: AstEnumerator().visit(ast))]
+    results = []
+    for name, walk in walkers:
+        results.append((name, bestTime(walk, iterations), nodeCount))
+    devNull.close()
+    return results
+
+
+def timePasses(sources, iterations):
+    asts = [(filename, parse(filename, layout(lex(filename, source))))
+            for filename, source in sources]
+    nodeCount = sum(countNodes(ast) for _, ast in asts)
+    passes = [("DeclarationVisitor", analyzeDeclarations),
+              ("InheritanceVisitor", analyzeInheritance),
+              ("TypeVisitor", analyzeTypes),
+              ("CompileVisitor", compile)]
+    totals = dict((name, None) for name, _ in passes)
+    for _ in xrange(iterations):
+        times = dict((name, 0.) for name, _ in passes)
+        for filename, ast in asts:
+            info = CompileInfo(ast)
+            for name, fn in passes:
+                start = time.time()
+                fn(info)
+                times[name] += time.time() - start
+                if fn is analyzeTypes:
+                    convertClosures(info)
+                    flattenClasses(info)
+        for name in times:
+            if totals[name] is None or times[name] < totals[name]:
+                totals[name] = times[name]
+    return [(name, totals[name], nodeCount) for name, _ in passes]
+
+
+def main():
+    sys.setrecursionlimit(10000)
+    cmdline = argparse.ArgumentParser(description="Benchmarks AST visitors")
+    cmdline.add_argument("-n", "--iterations", type=int, default=10,
+                         help="number of times each visitor is run; the best time is shown")
+    cmdline.add_argument("--scale", type=int, default=20,
+                         help="number of copies of the sources in the synthetic module")
+    cmdline.add_argument("sources", metavar="source", nargs="*",
+                         help="source files to visit")
+    args = cmdline.parse_args()
+
+    filenames = args.sources
+    if not filenames:
+        examplesDir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   os.pardir, "examples")
+        filenames = sorted(glob.glob(os.path.join(examplesDir, "*.gy")))
+    sources = readSources(filenames)
+
+    results = timeWalks(sources, args.scale, args.iterations) + \
+              timePasses(sources, args.iterations)
+    for name, elapsed, nodeCount in results:
+        print "%-20s %8.2f ms  %6.2f us/node  (%d nodes)" % \
+            (name, 1000 * elapsed, 1e6 * elapsed / nodeCount, nodeCount)
+
+
+if __name__ == "__main__":
+    main()
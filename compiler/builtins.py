@@ -58,10 +58,21 @@ def getBuiltinClassFromType(ty):
     return _builtinClassTypeMap.get(ty)
 
 
+def getBuiltinClassById(id):
+    _initialize()
+    return _builtinClassIdMap.get(id)
+
+
 def getBuiltinFunctions():
     return _builtinFunctionNameMap.values()
 
 
+def getBuiltinFunctionById(id):
+    """Returns a builtin function, constructor, or method with the given id."""
+    _initialize()
+    return _builtinFunctionIdMap.get(id)
+
+
 def isBuiltinId(id):
     return id < 0
 
@@ -69,6 +80,8 @@ def isBuiltinId(id):
 _builtinClassNameMap = {}
 _builtinClassTypeMap = {}
 _builtinFunctionNameMap = {}
+_builtinClassIdMap = {}
+_builtinFunctionIdMap = {}
 
 _initialized = False
 
@@ -109,6 +122,7 @@ def _initialize():
                             map(buildType, functionData["parameterTypes"]),
                             [], [], frozenset())
         function.id = globals()[functionData["id"]]
+        _builtinFunctionIdMap[function.id] = function
         if "insts" in functionData:
             function.insts = functionData["insts"]
         return function
@@ -125,6 +139,7 @@ def _initialize():
     def defineClass(classData):
         clas = _builtinClassNameMap[classData["name"]]
         clas.id = globals()[classData["id"]]
+        _builtinClassIdMap[clas.id] = clas
         if not classData["isPrimitive"]:
             if classData["supertype"] is not None:
                 superclass = _builtinClassNameMap[classData["supertype"]]
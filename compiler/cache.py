@@ -0,0 +1,137 @@
+# Copyright 2014, Jay Conrod. All rights reserved.
+#
+# This file is part of Gypsum. Use of this source code is governed by
+# the GPL license that can be found in the LICENSE.txt file.
+
+
+import errno
+import glob
+import hashlib
+import os
+import os.path
+import shutil
+import tempfile
+import time
+
+
+_compilerDir = os.path.dirname(os.path.abspath(__file__))
+_commonDir = os.path.join(_compilerDir, os.pardir, "common")
+
+# Files which determine what a package looks like, other than its source. The compiler's
+# modules stand in for a version number.
+_commonFiles = ["opcodes.yaml", "builtins.yaml", "flags.yaml"]
+
+_compilerVersion = None
+
+def compilerVersion():
+    """Returns a hash of the compiler's modules and the shared YAML files it is built from.
+
+    Packages built by compilers with different versions may be different."""
+    global _compilerVersion
+    if _compilerVersion is None:
+        paths = [os.path.join(_commonDir, name) for name in _commonFiles]
+        paths += sorted(path for path in glob.glob(os.path.join(_compilerDir, "*.py"))
+                        if not os.path.basename(path).startswith(("test_", "bench_")))
+        digest = hashlib.sha1()
+        for path in paths:
+            with open(path, "rb") as f:
+                contents = f.read()
+            digest.update("%s %d\n" % (os.path.basename(path), len(contents)))
+            digest.update(contents)
+        _compilerVersion = digest.hexdigest()
+    return _compilerVersion
+
+
+class CompileCache(object):
+    """A directory of compiled packages, keyed by a hash of everything that affects them.
+
+    The key covers the source text, the options which change the package, and the compiler
+    version. Each entry is a .csp file named by its key. Entries are written to a temporary
+    file and renamed, so several compiler processes may share a directory. Using an entry
+    updates its modification time, which evict uses to find old entries.
+
+    hits and misses count lookups made through this object."""
+
+    def __init__(self, directory, maxSize=None, maxAge=None):
+        self.directory = directory
+        self.maxSize = maxSize
+        self.maxAge = maxAge
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, source, options):
+        digest = hashlib.sha1()
+        digest.update(compilerVersion())
+        digest.update("no_layout=%s\n" % bool(options.no_layout))
+        digest.update("peephole=%s\n" % ",".join(sorted(options.peephole)))
+        digest.update(source)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".csp")
+
+    def fetch(self, key, outputFilename):
+        """Copies the package stored under key to outputFilename.
+
+        Returns True if the package was found, False otherwise."""
+        path = self.path(key)
+        try:
+            os.utime(path, None)
+            shutil.copyfile(path, outputFilename)
+        except (IOError, OSError), err:
+            # The entry may not exist, or another process may have evicted it.
+            if err.errno != errno.ENOENT:
+                raise
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, key, filename):
+        """Copies the package in filename into the cache under key."""
+        path = self.path(key)
+        entryDir = os.path.dirname(path)
+        try:
+            os.makedirs(entryDir)
+        except OSError, err:
+            if err.errno != errno.EEXIST:
+                raise
+        fd, tempPath = tempfile.mkstemp(dir=entryDir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tempFile, open(filename, "rb") as f:
+                shutil.copyfileobj(f, tempFile)
+            os.rename(tempPath, path)
+        except:
+            os.remove(tempPath)
+            raise
+
+    def evict(self, now=None):
+        """Removes entries which haven't been used for maxAge seconds, then removes the least
+        recently used entries until the total size is at most maxSize bytes.
+
+        Returns the number of entries removed."""
+        if now is None:
+            now = time.time()
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, "*", "*.csp")):
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            entries.append((info.st_mtime, info.st_size, path))
+        entries.sort()
+
+        removed = 0
+        totalSize = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            isOld = self.maxAge is not None and now - mtime > self.maxAge
+            isOverSize = self.maxSize is not None and totalSize > self.maxSize
+            if not isOld and not isOverSize:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            totalSize -= size
+            removed += 1
+        return removed
@@ -7,10 +7,20 @@
 from token import Location
 
 class Reader(object):
-    def __init__(self, filename, tokens, pos=0):
+    """A position in a list of tokens.
+
+    Each reader remembers the reader returned by next and the result of matching its token,
+    so parsers which try several alternatives at the same position share them."""
+
+    __slots__ = ("filename", "tokens", "pos", "memo", "nextReader", "tokenResult")
+
+    def __init__(self, filename, tokens, pos=0, memo=None):
         self.filename = filename
         self.tokens = tokens
         self.pos = pos
+        self.memo = memo
+        self.nextReader = None
+        self.tokenResult = None
 
     def isEmpty(self):
         return self.pos == len(self.tokens)
@@ -28,16 +38,163 @@ class Reader(object):
             return Location(self.filename, 1, 1, 1, 1)
 
     def next(self):
-        assert not self.isEmpty()
-        return Reader(self.filename, self.tokens, self.pos + 1)
+        nextReader = self.nextReader
+        if nextReader is None:
+            assert not self.isEmpty()
+            nextReader = type(self)(self.filename, self.tokens, self.pos + 1, self.memo)
+            self.nextReader = nextReader
+        return nextReader
+
+    def matchToken(self):
+        """Returns a Success whose value is the text of the current token."""
+        result = self.tokenResult
+        if result is None:
+            token = self.token()
+            result = Success(token.location, token.text, self.next())
+            self.tokenResult = result
+        return result
+
+    def release(self):
+        pass
+
+
+class TokenWindow(object):
+    """A buffered window over a stream of tokens.
+
+    Tokens are pulled from the stream only when a reader needs them, and they are kept until
+    they are released. Positions are absolute indices into the stream. The window also holds
+    the reader and token result for each position (see StreamReader), so they are released
+    along with the tokens."""
+
+    def __init__(self, tokens):
+        self.stream = iter(tokens)
+        self.buffer = []
+        self.offset = 0
+        self.lastToken = None
+        self.exhausted = False
+        self.readers = {}
+        self.tokenResults = {}
+
+    def isEnd(self, pos):
+        while not self.exhausted and pos >= self.offset + len(self.buffer):
+            try:
+                self.lastToken = next(self.stream)
+                self.buffer.append(self.lastToken)
+            except StopIteration:
+                self.exhausted = True
+        return pos >= self.offset + len(self.buffer)
+
+    def get(self, pos):
+        assert pos >= self.offset, "token was already released"
+        assert not self.isEnd(pos)
+        return self.buffer[pos - self.offset]
+
+    def release(self, pos):
+        """Discards buffered tokens before pos. Readers before pos may no longer be used."""
+        if pos > self.offset:
+            del self.buffer[:pos - self.offset]
+            for releasedPos in xrange(self.offset, pos):
+                self.readers.pop(releasedPos, None)
+                self.tokenResults.pop(releasedPos, None)
+            self.offset = pos
+
+
+class StreamReader(Reader):
+    """A reader over a TokenWindow instead of a list.
+
+    Readers and token results are shared through the window instead of being cached in the
+    previous reader. A chain of cached readers would start at the first reader, which the
+    caller holds for the whole parse, so nothing read from the stream could be collected."""
+
+    __slots__ = ()
+
+    def next(self):
+        readers = self.tokens.readers
+        pos = self.pos + 1
+        nextReader = readers.get(pos)
+        if nextReader is None:
+            assert not self.isEmpty()
+            nextReader = StreamReader(self.filename, self.tokens, pos, self.memo)
+            readers[pos] = nextReader
+        return nextReader
+
+    def matchToken(self):
+        tokenResults = self.tokens.tokenResults
+        result = tokenResults.get(self.pos)
+        if result is None:
+            token = self.token()
+            result = Success(token.location, token.text, self.next())
+            tokenResults[self.pos] = result
+        return result
+
+    def isEmpty(self):
+        return self.tokens.isEnd(self.pos)
+
+    def token(self):
+        return self.tokens.get(self.pos)
+
+    def location(self):
+        if not self.isEmpty():
+            return self.tokens.get(self.pos).location
+        elif self.tokens.lastToken is not None:
+            return self.tokens.lastToken.location
+        else:
+            return Location(self.filename, 1, 1, 1, 1)
+
+    def release(self):
+        self.tokens.release(self.pos)
+
+
+class MemoTable(object):
+    """Caches parse results for packrat parsing.
+
+    Results are keyed on a parser (or the function a Lazy parser is built from) and a reader
+    position. Parse results must not be modified after they are returned, since they may be
+    returned again. Entries before a position are flushed when a Commit succeeds there, which
+    bounds memory to roughly one definition's worth of entries."""
+
+    def __init__(self):
+        self.entries = {}
+        self.minPos = 0
+        self.hits = 0
+        self.misses = 0
+
+    def parse(self, key, parser, reader):
+        pos = reader.pos
+        entriesAtPos = self.entries.get(pos)
+        if entriesAtPos is None:
+            entriesAtPos = {}
+            if pos >= self.minPos:
+                self.entries[pos] = entriesAtPos
+        else:
+            result = entriesAtPos.get(key)
+            if result is not None:
+                self.hits += 1
+                return result
+        self.misses += 1
+        result = parser(reader)
+        entriesAtPos[key] = result
+        return result
+
+    def flushBefore(self, pos):
+        for p in xrange(self.minPos, pos):
+            self.entries.pop(p, None)
+        self.minPos = max(self.minPos, pos)
+
+    def __len__(self):
+        return sum(len(entriesAtPos) for entriesAtPos in self.entries.itervalues())
 
 
 class ParseResult(object):
+    __slots__ = ("location",)
+
     def __init__(self, location):
         self.location = location
 
 
 class Success(ParseResult):
+    __slots__ = ("value", "next")
+
     def __init__(self, location, value, next):
         super(Success, self).__init__(location)
         self.value = value;
@@ -52,10 +209,25 @@ class Success(ParseResult):
 
 
 class Failure(ParseResult):
-    def __init__(self, location, message):
+    """The result of a parser that didn't match.
+
+    Most failures are discarded by an enclosing Alternate or Opt, so if messageArgs is given,
+    the message is only formatted when it's read."""
+
+    __slots__ = ("messageFormat", "messageArgs", "retry")
+
+    def __init__(self, location, message, messageArgs=None, retry=True):
         super(Failure, self).__init__(location)
-        self.message = message
-        self.retry = True
+        self.messageFormat = message
+        self.messageArgs = messageArgs
+        self.retry = retry
+
+    @property
+    def message(self):
+        if self.messageArgs is None:
+            return self.messageFormat
+        else:
+            return self.messageFormat % self.messageArgs
 
     def __nonzero__(self):
         return False
@@ -65,10 +237,64 @@ class Failure(ParseResult):
 
 
 class FailValue(object):
+    __slots__ = ("message",)
+
     def __init__(self, message="syntax error"):
         self.message = message
 
 
+class FirstSet(object):
+    """The tokens which can begin a successful parse, used by Alternate to skip alternatives.
+
+    keys holds (tag, text) pairs; text is None if any token with the tag may match. If the
+    parser is nullable, it may succeed without reading a token. If the set is unknown, the
+    parser must be tried on every token, since it may match anything or may fail without
+    allowing a retry (as Commit does)."""
+
+    __slots__ = ("keys", "nullable", "unknown", "textsByTag")
+
+    def __init__(self, keys=frozenset(), nullable=False, unknown=False):
+        self.keys = keys
+        self.nullable = nullable
+        self.unknown = unknown
+        self.textsByTag = None
+
+    def mayMatch(self, reader):
+        """Returns False if a parser with this set would fail at reader, allowing a retry."""
+        if self.unknown or self.nullable:
+            return True
+        if reader.isEmpty():
+            return False
+        if self.textsByTag is None:
+            textsByTag = {}
+            for tag, text in self.keys:
+                if text is None:
+                    textsByTag[tag] = True
+                elif textsByTag.get(tag) is not True:
+                    textsByTag.setdefault(tag, set()).add(text)
+            self.textsByTag = textsByTag
+        token = reader.token()
+        texts = self.textsByTag.get(token.tag)
+        return texts is True or (texts is not None and token.text in texts)
+
+    def union(self, other):
+        return FirstSet(self.keys | other.keys,
+                        self.nullable or other.nullable,
+                        self.unknown or other.unknown)
+
+    def then(self, other):
+        """Returns the set for this parser followed by other."""
+        if self.unknown or not self.nullable:
+            return self
+        return FirstSet(self.keys | other.keys, other.nullable, other.unknown)
+
+    def withNullable(self):
+        return FirstSet(self.keys, True, self.unknown)
+
+
+UNKNOWN_FIRST_SET = FirstSet(unknown=True)
+
+
 class Parser(object):
     def __xor__(self, other):
         return Process(self, other)
@@ -79,6 +305,27 @@ class Parser(object):
     def __or__(self, other):
         return Alternate(self, other)
 
+    def firstSet(self, visiting=None):
+        """Returns the FirstSet of this parser.
+
+        visiting holds parsers whose sets are being computed. A parser reached again through a
+        cycle has an unknown set."""
+        first = self.__dict__.get("cachedFirstSet")
+        if first is not None:
+            return first
+        if visiting is None:
+            visiting = set()
+        if self in visiting:
+            return UNKNOWN_FIRST_SET
+        visiting.add(self)
+        first = self.computeFirstSet(visiting)
+        visiting.remove(self)
+        self.cachedFirstSet = first
+        return first
+
+    def computeFirstSet(self, visiting):
+        return UNKNOWN_FIRST_SET
+
 
 class Reserved(Parser):
     def __init__(self, tag, text):
@@ -90,9 +337,12 @@ class Reserved(Parser):
             return Failure(reader.location(), "unexpected end of file")
         token = reader.token()
         if token.tag is not self.tag or token.text != self.text:
-            return Failure(token.location, "expected %s but found %s" % (self.text, token.text))
+            return Failure(token.location, "expected %s but found %s", (self.text, token.text))
         else:
-            return Success(token.location, token.text, reader.next())
+            return reader.matchToken()
+
+    def computeFirstSet(self, visiting):
+        return FirstSet(frozenset([(self.tag, self.text)]))
 
         
 class Tag(Parser):
@@ -104,9 +354,12 @@ class Tag(Parser):
             return Failure(reader.location(), "unexpected end of file")
         token = reader.token()
         if token.tag is not self.tag:
-            return Failure(token.location, "expected %s but found %s" % (self.tag, token.tag))
+            return Failure(token.location, "expected %s but found %s", (self.tag, token.tag))
         else:
-            return Success(token.location, token.text, reader.next())
+            return reader.matchToken()
+
+    def computeFirstSet(self, visiting):
+        return FirstSet(frozenset([(self.tag, None)]))
 
 
 class Commit(Parser):
@@ -117,7 +370,11 @@ class Commit(Parser):
     def __call__(self, reader):
         result = self.parser(reader)
         if not result:
-            result.retry = False
+            if result.retry:
+                result = Failure(result.location, result.messageFormat, result.messageArgs,
+                                 retry=False)
+        elif reader.memo is not None:
+            reader.memo.flushBefore(reader.pos)
         return result
 
 
@@ -129,7 +386,31 @@ class Lazy(Parser):
     def __call__(self, reader):
         if not self.parser:
             self.parser = self.parserFunc()
-        return self.parser(reader)
+        if reader.memo is None:
+            return self.parser(reader)
+        # Lazy parsers built from the same function are equivalent, so they share entries.
+        return reader.memo.parse(self.parserFunc, self.parser, reader)
+
+    def computeFirstSet(self, visiting):
+        if not self.parser:
+            self.parser = self.parserFunc()
+        return self.parser.firstSet(visiting)
+
+
+class Memo(Parser):
+    """Caches results of a parser when reading with a MemoTable. Does nothing otherwise."""
+
+    def __init__(self, parser):
+        assert isinstance(parser, Parser)
+        self.parser = parser
+
+    def __call__(self, reader):
+        if reader.memo is None:
+            return self.parser(reader)
+        return reader.memo.parse(self, self.parser, reader)
+
+    def computeFirstSet(self, visiting):
+        return self.parser.firstSet(visiting)
 
 
 class Phrase(Parser):
@@ -143,6 +424,28 @@ class Phrase(Parser):
             return Failure(result.location, "found garbage at end of file")
         return result
 
+    def computeFirstSet(self, visiting):
+        return self.parser.firstSet(visiting)
+
+
+class Release(Parser):
+    """Releases tokens before the end of a successful parse from a StreamReader's window.
+
+    This must only be used where no enclosing parser can backtrack over the parsed text."""
+
+    def __init__(self, parser):
+        assert isinstance(parser, Parser)
+        self.parser = parser
+
+    def __call__(self, reader):
+        result = self.parser(reader)
+        if result:
+            result.next.release()
+        return result
+
+    def computeFirstSet(self, visiting):
+        return self.parser.firstSet(visiting)
+
 
 class Process(Parser):
     def __init__(self, parser, process):
@@ -155,11 +458,16 @@ class Process(Parser):
         if not result:
             return result
         value = self.process(result.value)
-        if isinstance(value, FailValue):
+        if value is result.value:
+            return result
+        elif isinstance(value, FailValue):
             return Failure(result.location, value.message)
         else:
             return Success(result.location, value, result.next)
 
+    def computeFirstSet(self, visiting):
+        return self.parser.firstSet(visiting)
+
 
 def If(parser, f):
     return Process(parser, lambda p: p if f(p) else FailValue())
@@ -169,64 +477,156 @@ class Opt(Parser):
     def __init__(self, parser):
         assert isinstance(parser, Parser)
         self.parser = parser
+        self.parserFirstSet = None
 
     def __call__(self, reader):
-        result = self.parser(reader)
-        if result or not result.retry:
-            return result
+        if self.parserFirstSet is None:
+            self.parserFirstSet = self.parser.firstSet()
+        if self.parserFirstSet.mayMatch(reader):
+            result = self.parser(reader)
+            if result or not result.retry:
+                return result
         return Success(reader.location(), None, reader)
 
+    def computeFirstSet(self, visiting):
+        return self.parser.firstSet(visiting).withNullable()
+
 
 class Concatenate(Parser):
-    def __init__(self, left, right):
-        assert isinstance(left, Parser) and isinstance(right, Parser)
-        self.left = left
-        self.right = right
+    """Matches a sequence of parsers. The value is a flat tuple with one value per parser.
+
+    a + b + c builds a single Concatenate with three parsers, so its value is (a, b, c)
+    rather than ((a, b), c)."""
+
+    def __init__(self, *parsers):
+        assert len(parsers) >= 2 and all(isinstance(p, Parser) for p in parsers)
+        self.parsers = parsers
+
+    def __add__(self, other):
+        return Concatenate(*(self.parsers + (other,)))
 
     def __call__(self, reader):
-        left_result = self.left(reader)
-        if not left_result:
-            return left_result
-        right_result = self.right(left_result.next)
-        if not right_result:
-            return right_result
-        return Success(left_result.location.combine(right_result.location),
-                       (left_result.value, right_result.value),
-                       right_result.next)
+        values = []
+        firstLocation = None
+        result = None
+        next = reader
+        for parser in self.parsers:
+            result = parser(next)
+            if not result:
+                return result
+            if firstLocation is None:
+                firstLocation = result.location
+            values.append(result.value)
+            next = result.next
+        return Success(firstLocation.combine(result.location), tuple(values), next)
+
+    def computeFirstSet(self, visiting):
+        first = self.parsers[0].firstSet(visiting)
+        for parser in self.parsers[1:]:
+            if first.unknown or not first.nullable:
+                break
+            first = first.then(parser.firstSet(visiting))
+        return first
 
 
 class Alternate(Parser):
-    def __init__(self, left, right):
-        assert isinstance(left, Parser) and isinstance(right, Parser)
-        self.left = left
-        self.right = right
+    """Matches the first of several parsers that succeeds.
+
+    a | b | c builds a single Alternate. The first time it's called, it builds a table from
+    tokens to the alternatives whose FIRST sets allow them to match, and it only tries those.
+    The others would fail without consuming anything and allow a retry, so skipping them
+    doesn't change the result. If every alternative fails, the result is the failure of the
+    last one, as if all had been tried."""
+
+    def __init__(self, *parsers):
+        assert len(parsers) >= 2 and all(isinstance(p, Parser) for p in parsers)
+        self.parsers = parsers
+        self.dispatch = None
+        self.defaultParsers = None
+
+    def __or__(self, other):
+        return Alternate(*(self.parsers + (other,)))
 
     def __call__(self, reader):
-        result = self.left(reader)
-        if result:
-            return result
-        if not result.retry:
-            return result
-        return self.right(reader)
+        if self.dispatch is None:
+            self.buildDispatch()
+        if reader.isEmpty():
+            parsers = self.defaultParsers
+        else:
+            token = reader.token()
+            entry = self.dispatch.get(token.tag)
+            if entry is None:
+                parsers = self.defaultParsers
+            else:
+                (parsersByText, parsersForTag) = entry
+                parsers = parsersByText.get(token.text, parsersForTag)
+
+        result = None
+        for parser in parsers:
+            result = parser(reader)
+            if result or not result.retry:
+                return result
+        last = self.parsers[-1]
+        if result is None or parsers[-1] is not last:
+            result = last(reader)
+        return result
+
+    def computeFirstSet(self, visiting):
+        first = self.parsers[0].firstSet(visiting)
+        for parser in self.parsers[1:]:
+            first = first.union(parser.firstSet(visiting))
+        return first
+
+    def buildDispatch(self):
+        firstSets = [parser.firstSet() for parser in self.parsers]
+        def select(predicate):
+            return tuple(parser for parser, first in zip(self.parsers, firstSets)
+                         if first.unknown or first.nullable or predicate(first.keys))
+
+        dispatch = {}
+        keys = set()
+        for first in firstSets:
+            keys |= first.keys
+        for tag in set(tag for tag, _ in keys):
+            parsersForTag = select(lambda ks: (tag, None) in ks)
+            parsersByText = {}
+            for keyTag, text in keys:
+                if keyTag == tag and text is not None:
+                    parsersByText[text] = \
+                        select(lambda ks: (tag, text) in ks or (tag, None) in ks)
+            dispatch[tag] = (parsersByText, parsersForTag)
+        self.defaultParsers = select(lambda ks: False)
+        self.dispatch = dispatch
 
 
 class Rep(Parser):
     def __init__(self, parser):
         assert isinstance(parser, Parser)
         self.parser = parser
+        self.parserFirstSet = None
+
+    def computeFirstSet(self, visiting):
+        return self.parser.firstSet(visiting).withNullable()
 
     def __call__(self, reader):
+        if self.parserFirstSet is None:
+            self.parserFirstSet = self.parser.firstSet()
+        first = self.parserFirstSet
         elements = []
         location = reader.location()
+        lastLocation = None
         next = reader
-        result = self.parser(next)
-        while result:
+        while first.mayMatch(next):
+            result = self.parser(next)
+            if not result:
+                if not result.retry:
+                    return result
+                break
             elements.append(result.value)
-            location = location.combine(result.location)
+            lastLocation = result.location
             next = result.next
-            result = self.parser(next)
-        if not result.retry:
-            return result
+        if lastLocation is not None:
+            location = location.combine(lastLocation)
         return Success(location, elements, next)
 
 
@@ -234,7 +634,7 @@ def Rep1(parser):
     def process(parsed):
         (l, r) = parsed
         return [l] + r
-    return parser + Rep(parser) ^ process
+    return Concatenate(parser, Rep(parser)) ^ process
 
 
 def Rep1Sep(parser, separator):
@@ -243,7 +643,7 @@ def Rep1Sep(parser, separator):
     def process(parsed):
         (l, r) = parsed
         return [l] + r
-    return parser + Rep(separator + parser ^ processElem) ^ process
+    return Concatenate(parser, Rep(Concatenate(separator, parser) ^ processElem)) ^ process
 
 
 def RepSep(parser, separator):
@@ -262,18 +662,30 @@ class LeftRec(Parser):
         if not result:
             return result
 
+        value = result.value
+        location = result.location
+        next = result.next
+        combined = False
         while True:
-            nextResult = self.next(result.next)
+            nextResult = self.next(next)
             if not nextResult:
                 break
 
-            nextValue = self.combine(result.value, nextResult.value)
+            nextValue = self.combine(value, nextResult.value)
             if isinstance(nextValue, FailValue):
                 break
 
-            result = nextResult
-            result.value = nextValue
-        return result
+            value = nextValue
+            location = nextResult.location
+            next = nextResult.next
+            combined = True
+
+        if not combined:
+            return result
+        return Success(location, value, next)
+
+    def computeFirstSet(self, visiting):
+        return self.left.firstSet(visiting)
 
 
 class Break(Parser):
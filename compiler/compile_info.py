@@ -26,23 +26,14 @@ class CompileInfo(object):
             package = Package()
         self.ast = ast
         self.package = package
-        self.scopes = {}
+        self.scopes = IdTable()
         self.globalScope = None
-        self.contextInfo = {}
-        self.closureInfo = {}
-        self.defnInfo = {}
-        self.useInfo = {}
-        self.classInfo = {}
-        self.typeInfo = {}
-
-    def _get(self, key, dictionary):
-        return dictionary[self._key(key)]
-
-    def _set(self, key, value, dictionary):
-        dictionary[self._key(key)] = value
-
-    def _has(self, key, dictionary):
-        return self._key(key) in dictionary
+        self.contextInfo = IdTable()
+        self.closureInfo = IdTable()
+        self.defnInfo = IdTable()
+        self.useInfo = IdTable()
+        self.classInfo = IdTable()
+        self.typeInfo = IdTable()
 
     def _key(self, k):
         if isinstance(k, int):
@@ -67,16 +58,118 @@ _dictNames = [("Scope", "scopes"),
               ("ClassInfo", "classInfo"),
               ("Type", "typeInfo")]
 def _addDictMethods(elemName, dictName):
-    setattr(CompileInfo, "get" + elemName,
-            lambda self, key: self._get(key, getattr(self, dictName)))
-    setattr(CompileInfo, "set" + elemName,
-            lambda self, key, value: self._set(key, value, getattr(self, dictName)))
-    setattr(CompileInfo, "has" + elemName,
-            lambda self, key: self._has(key, getattr(self, dictName)))
+    # Type analysis and code generation call these for almost every node they visit, so they
+    # skip _key when they're given an int id, and they index the table's list directly.
+    def get(self, key):
+        if key.__class__ is not int:
+            key = key.id if isinstance(key, AstNode) else self._key(key)
+        table = getattr(self, dictName)
+        if key >= 0:
+            if key < len(table.dense):
+                value = table.dense[key]
+                if value is not _MISSING:
+                    return value
+            raise KeyError(key)
+        return table.sparse[key]
+
+    def set(self, key, value):
+        if key.__class__ is not int:
+            key = key.id if isinstance(key, AstNode) else self._key(key)
+        getattr(self, dictName)[key] = value
+
+    def has(self, key):
+        if key.__class__ is not int:
+            key = key.id if isinstance(key, AstNode) else self._key(key)
+        table = getattr(self, dictName)
+        if key >= 0:
+            return key < len(table.dense) and table.dense[key] is not _MISSING
+        return key in table.sparse
+
+    get.__name__ = "get" + elemName
+    set.__name__ = "set" + elemName
+    has.__name__ = "has" + elemName
+    setattr(CompileInfo, get.__name__, get)
+    setattr(CompileInfo, set.__name__, set)
+    setattr(CompileInfo, has.__name__, has)
 for _elemName, _dictName in _dictNames:
     _addDictMethods(_elemName, _dictName)
 
 
+_MISSING = object()
+
+class IdTable(object):
+    """Maps AST ids to information about nodes. It may be used like a dict with int keys.
+
+    Ids from AstEnumerator are small, dense, non-negative integers, so values for those are
+    stored in a list indexed by id, which grows as needed. Negative ids, which belong to
+    builtin definitions, are kept in a separate dict. Keys are iterated in increasing order."""
+
+    __slots__ = ("dense", "sparse", "count")
+
+    def __init__(self):
+        self.dense = []
+        self.sparse = {}
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, id):
+        if id >= 0:
+            if id < len(self.dense):
+                value = self.dense[id]
+                if value is not _MISSING:
+                    return value
+            raise KeyError(id)
+        return self.sparse[id]
+
+    def __setitem__(self, id, value):
+        if id >= 0:
+            dense = self.dense
+            if id >= len(dense):
+                dense.extend([_MISSING] * max(id + 1 - len(dense), len(dense)))
+            if dense[id] is _MISSING:
+                self.count += 1
+            dense[id] = value
+        else:
+            if id not in self.sparse:
+                self.count += 1
+            self.sparse[id] = value
+
+    def __contains__(self, id):
+        if id >= 0:
+            return id < len(self.dense) and self.dense[id] is not _MISSING
+        return id in self.sparse
+
+    def get(self, id, default=None):
+        return self[id] if id in self else default
+
+    def iteritems(self):
+        for id in sorted(self.sparse):
+            yield id, self.sparse[id]
+        for id, value in enumerate(self.dense):
+            if value is not _MISSING:
+                yield id, value
+
+    def iterkeys(self):
+        return (id for id, _ in self.iteritems())
+
+    def itervalues(self):
+        return (value for _, value in self.iteritems())
+
+    def __iter__(self):
+        return self.iterkeys()
+
+    def items(self):
+        return list(self.iteritems())
+
+    def keys(self):
+        return list(self.iterkeys())
+
+    def values(self):
+        return list(self.itervalues())
+
+
 class ContextInfo(Data):
     """Created for every AST node which creates a scope.
 
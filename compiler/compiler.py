@@ -5,6 +5,7 @@
 
 
 from functools import partial
+import multiprocessing
 
 from ast import *
 from bytecode import *
@@ -12,15 +13,106 @@ from ir import *
 from ir_types import *
 import ir_instructions
 from ir_instructions import *
+import peephole
 from scope_analysis import *
 from utils import *
 
-def compile(info):
+def compile(info, jobs=1, peepholeRules=(), peepholeCounts=None):
+    """Generates code for every function in the package.
+
+    If any peephole rules are given, they're applied to each function after it's compiled
+    (see peephole.py). If peepholeCounts is also given, it should be a dict; the number of
+    times each rule was applied is added to it.
+
+    With jobs > 1, functions are compiled concurrently in a pool of worker processes. Each
+    function's code only depends on analysis results, which workers inherit when they are
+    forked. Strings are added to the package's string table afterward, in the same order as
+    in a sequential build, so the package is the same either way. Pools can't be created
+    inside daemonic processes (like the driver's workers), so functions are compiled
+    sequentially there."""
     for clas in info.package.classes:
         assignFieldIndices(clas, info)
-    for function in info.package.functions:
-        compiler = CompileVisitor(function, info)
-        compiler.compile()
+    functions = info.package.functions
+    if peepholeCounts is None:
+        peepholeCounts = {}
+    if jobs <= 1 or len(functions) <= 1 or multiprocessing.current_process().daemon:
+        for function in functions:
+            _compileFunction(function, info, peepholeRules, peepholeCounts)
+        return
+
+    # Functions may load variables which belong to other functions (for example, a class
+    # initializer's receiver is the context for the class's methods), so every variable needs
+    # an index before workers are forked.
+    for function in functions:
+        CompileVisitor(function, info).enumerateVariables()
+
+    global _workerInfo, _workerPeepholeRules
+    _workerInfo = info
+    _workerPeepholeRules = peepholeRules
+    chunkSize = max(1, len(functions) // (4 * jobs))
+    chunks = [(start, min(start + chunkSize, len(functions)))
+              for start in xrange(0, len(functions), chunkSize)]
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for results, counts in pool.imap(_compileInWorker, chunks):
+            for index, result in results:
+                function = functions[index]
+                if result is None:
+                    # Compile it again here, so the same exception is raised as in a
+                    # sequential build.
+                    _compileFunction(function, info, peepholeRules, {})
+                    raise AssertionError("function compiled in parent but not in worker")
+                _mergeWorkerResult(info.package, function, result)
+            for rule, count in counts.iteritems():
+                peepholeCounts[rule] = peepholeCounts.get(rule, 0) + count
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        _workerInfo = None
+        _workerPeepholeRules = ()
+
+
+def _compileFunction(function, info, peepholeRules, peepholeCounts):
+    CompileVisitor(function, info).compile()
+    if len(peepholeRules) > 0:
+        peephole.optimize(function, peepholeRules, peepholeCounts)
+
+
+_workerInfo = None
+_workerPeepholeRules = ()
+
+def _compileInWorker(chunk):
+    # Each function gets its own string table, so the ids in its string instructions can be
+    # mapped to ids in the real table when the function is merged. Exceptions aren't sent
+    # back, since they don't always survive pickling; None is returned for the function
+    # instead, and nothing after it is compiled.
+    package = _workerInfo.package
+    results = []
+    counts = {}
+    for index in xrange(*chunk):
+        function = package.functions[index]
+        package.clearStrings()
+        try:
+            _compileFunction(function, _workerInfo, _workerPeepholeRules, counts)
+        except Exception:
+            results.append((index, None))
+            break
+        results.append((index, (function.blocks, package.strings)))
+    return results, counts
+
+
+def _mergeWorkerResult(package, function, result):
+    blocks, strings = result
+    stringIds = package.addStrings(strings)
+    if len(stringIds) > 0:
+        for block in blocks:
+            block.instructions = [ir_instructions.string(stringIds[inst.op(0)])
+                                  if isinstance(inst, ir_instructions.string) else inst
+                                  for inst in block.instructions]
+    function.blocks = blocks
 
 
 def assignFieldIndices(clas, info):
@@ -519,6 +611,18 @@ class CompileVisitor(AstNodeVisitor):
         else:
             raise CompileException("left side of assignment is unassignable")
 
+    def enumerateVariables(self):
+        """Sets indices for local variables and parameters, as compile does."""
+        if self.compileHint:
+            return
+        if isinstance(self.astDefn, AstFunctionDefinition) or \
+           isinstance(self.astDefn, AstPrimaryConstructorDefinition):
+            parameters = self.astDefn.parameters
+        else:
+            parameters = None
+        self.enumerateLocals()
+        self.enumerateParameters(parameters)
+
     def enumerateLocals(self):
         nextLocalIndex = Counter(-1, -1)
         for var in self.function.variables:
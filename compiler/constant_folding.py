@@ -0,0 +1,292 @@
+# Copyright 2014, Jay Conrod. All rights reserved.
+#
+# This file is part of Gypsum. Use of this source code is governed by
+# the GPL license that can be found in the LICENSE.txt file.
+
+
+# Evaluation of primitive instructions on constant operands.
+#
+# Results must be exactly what the VM would compute, so values are modeled the way the
+# interpreter stores them: as 64-bit stack words. Each instruction pops its operands by
+# truncating words to the operand type and pushes its result zero-extended from the C++
+# result type. Since C++ promotes i8 and i16 operands to int, arithmetic on those types
+# leaves bits above the type's width in the word, and so do lsr and trunc. Those bits can
+# be observed later by a zext, which is a no-op in the VM. A literal instruction always pushes
+# a clean word, so a result is only replaced with a literal if the literal would push the
+# same word.
+#
+# Instructions which would trap or have undefined behavior in the VM (integer division by
+# zero, out of range shifts and float to integer conversions) are not folded. Neither are
+# float results which are NaN, since the VM's NaN bits may not match ours.
+
+
+import math
+import operator
+import struct
+
+from bytecode import instInfoByName
+import ir_instructions
+
+
+def literalWord(inst):
+    """Returns the stack word pushed by a literal instruction, or None for other instructions."""
+    kind = _LITERAL_KINDS.get(inst.opcode())
+    if kind is None:
+        return None
+    elif kind == _BOOLEAN:
+        return 1 if inst.opcode() == _TRUE else 0
+    elif kind == _F32:
+        try:
+            return _f32ToWord(inst.op(0), False)
+        except OverflowError:
+            return None
+    elif kind == _F64:
+        return _f64ToWord(inst.op(0))
+    else:
+        return inst.op(0) & _mask(_INT_BITS[kind])
+
+
+def operandCount(inst):
+    """Returns how many values an instruction pops if it can be folded, or None otherwise."""
+    folder = _FOLDERS.get(inst.opcode())
+    return folder[0] if folder is not None else None
+
+
+def fold(inst, operands):
+    """Evaluates an instruction on constant operands.
+
+    operands is a list of literal instructions which push the instruction's operands, in
+    order. Returns a literal instruction which pushes the result, or None if the instruction
+    can't be folded."""
+    folder = _FOLDERS.get(inst.opcode())
+    if folder is None or folder[0] != len(operands):
+        return None
+    _, evaluate, resultKind = folder
+    words = [literalWord(operand) for operand in operands]
+    if None in words:
+        return None
+    try:
+        word = evaluate(*words)
+    except (OverflowError, ZeroDivisionError, ValueError):
+        return None
+    if word is None:
+        return None
+    return _makeLiteral(resultKind, word)
+
+
+_BOOLEAN = "boolean"
+_I8 = "i8"
+_I16 = "i16"
+_I32 = "i32"
+_I64 = "i64"
+_F32 = "f32"
+_F64 = "f64"
+
+_INT_BITS = {_I8: 8, _I16: 16, _I32: 32, _I64: 64}
+
+_TRUE = instInfoByName["true"].opcode
+_LITERAL_KINDS = {instInfoByName[name].opcode: kind for name, kind in
+                  (("true", _BOOLEAN), ("false", _BOOLEAN),
+                   ("i8", _I8), ("i16", _I16), ("i32", _I32), ("i64", _I64),
+                   ("f32", _F32), ("f64", _F64))}
+
+
+def _mask(bits):
+    return (1 << bits) - 1
+
+
+def _signed(word, bits):
+    word &= _mask(bits)
+    return word - (1 << bits) if word >> (bits - 1) else word
+
+
+def _f32ToWord(value, saturate=True):
+    # A C++ conversion to float rounds to infinity on overflow, but struct raises an error.
+    try:
+        return struct.unpack("<I", struct.pack("<f", value))[0]
+    except OverflowError:
+        if not saturate:
+            raise
+        return _f32ToWord(math.copysign(float("inf"), value))
+
+
+def _f32FromWord(word):
+    return struct.unpack("<f", struct.pack("<I", word & _mask(32)))[0]
+
+
+def _f64ToWord(value):
+    return struct.unpack("<Q", struct.pack("<d", value))[0]
+
+
+def _f64FromWord(word):
+    return struct.unpack("<d", struct.pack("<Q", word))[0]
+
+
+def _floatFromWord(kind, word):
+    return _f32FromWord(word) if kind == _F32 else _f64FromWord(word)
+
+
+def _floatToWord(kind, value):
+    return _f32ToWord(value) if kind == _F32 else _f64ToWord(value)
+
+
+def _makeLiteral(kind, word):
+    if kind == _BOOLEAN:
+        return ir_instructions.true() if word else ir_instructions.false()
+    elif kind == _F32 or kind == _F64:
+        if kind == _F32 and word >> 32 != 0:
+            return None
+        value = _floatFromWord(kind, word)
+        if math.isnan(value):
+            return None
+        return getattr(ir_instructions, kind)(value)
+    else:
+        bits = _INT_BITS[kind]
+        if word >> bits != 0:
+            return None
+        return getattr(ir_instructions, kind)(_signed(word, bits))
+
+
+def _truncatingDivide(left, right):
+    quotient = abs(left) // abs(right)
+    return quotient if (left < 0) == (right < 0) else -quotient
+
+
+def _intBinaryFolder(bits, op):
+    # Operands narrower than int are promoted, and the result is pushed with the promoted type.
+    width = max(bits, 32)
+    def evaluate(leftWord, rightWord):
+        result = op(_signed(leftWord, bits), _signed(rightWord, bits), width)
+        return result & _mask(width) if result is not None else None
+    return evaluate
+
+
+def _divide(left, right, width):
+    if right == 0 or (left == -(1 << (width - 1)) and right == -1):
+        return None
+    return _truncatingDivide(left, right)
+
+
+def _modulo(left, right, width):
+    if right == 0 or (left == -(1 << (width - 1)) and right == -1):
+        return None
+    return left - right * _truncatingDivide(left, right)
+
+
+def _shiftLeft(left, right, width):
+    return left << right if 0 <= right < width else None
+
+
+def _shiftRightArithmetic(left, right, width):
+    return left >> right if 0 <= right < width else None
+
+
+def _intShiftRightLogicalFolder(bits):
+    # Both operands are sign-extended to u64 before shifting, and the result is pushed as a u64.
+    def evaluate(leftWord, rightWord):
+        left = _signed(leftWord, bits) & _mask(64)
+        right = _signed(rightWord, bits) & _mask(64)
+        return left >> right if right < 64 else None
+    return evaluate
+
+
+def _intUnaryFolder(bits, op):
+    width = max(bits, 32)
+    return lambda word: op(_signed(word, bits)) & _mask(width)
+
+
+def _intComparisonFolder(bits, op):
+    return lambda leftWord, rightWord: int(op(_signed(leftWord, bits), _signed(rightWord, bits)))
+
+
+def _floatBinaryFolder(kind, op):
+    def evaluate(leftWord, rightWord):
+        right = _floatFromWord(kind, rightWord)
+        if op is operator.truediv and right == 0.:
+            return None
+        return _floatToWord(kind, op(_floatFromWord(kind, leftWord), right))
+    return evaluate
+
+
+def _floatComparisonFolder(kind, op):
+    return lambda leftWord, rightWord: int(op(_floatFromWord(kind, leftWord),
+                                              _floatFromWord(kind, rightWord)))
+
+
+def _floatToIntFolder(fromKind, bits):
+    def evaluate(word):
+        value = _floatFromWord(fromKind, word)
+        if math.isinf(value) or math.isnan(value):
+            return None
+        result = int(value)
+        if not -(1 << (bits - 1)) <= result < (1 << (bits - 1)):
+            return None
+        return result & _mask(bits)
+    return evaluate
+
+
+def _buildFolders():
+    folders = {}
+
+    def add(name, operandCount, evaluate, resultKind):
+        folders[instInfoByName[name].opcode] = (operandCount, evaluate, resultKind)
+
+    intBinaryOps = (("add", operator.add), ("sub", operator.sub), ("mul", operator.mul),
+                    ("and", operator.and_), ("or", operator.or_), ("xor", operator.xor))
+    comparisonOps = (("eq", operator.eq), ("ne", operator.ne), ("lt", operator.lt),
+                     ("le", operator.le), ("gt", operator.gt), ("ge", operator.ge))
+    for kind, bits in _INT_BITS.items():
+        for name, op in intBinaryOps:
+            add(name + kind, 2,
+                _intBinaryFolder(bits, lambda left, right, width, op=op: op(left, right)),
+                kind)
+        add("div" + kind, 2, _intBinaryFolder(bits, _divide), kind)
+        add("mod" + kind, 2, _intBinaryFolder(bits, _modulo), kind)
+        add("lsl" + kind, 2, _intBinaryFolder(bits, _shiftLeft), kind)
+        add("asr" + kind, 2, _intBinaryFolder(bits, _shiftRightArithmetic), kind)
+        add("lsr" + kind, 2, _intShiftRightLogicalFolder(bits), kind)
+        for name, op in comparisonOps:
+            add(name + kind, 2, _intComparisonFolder(bits, op), _BOOLEAN)
+        add("neg" + kind, 1, _intUnaryFolder(bits, operator.neg), kind)
+        add("inv" + kind, 1, _intUnaryFolder(bits, operator.invert), kind)
+
+    floatBinaryOps = (("add", operator.add), ("sub", operator.sub), ("mul", operator.mul),
+                      ("div", operator.truediv))
+    for kind in (_F32, _F64):
+        for name, op in floatBinaryOps:
+            add(name + kind, 2, _floatBinaryFolder(kind, op), kind)
+        for name, op in comparisonOps:
+            add(name + kind, 2, _floatComparisonFolder(kind, op), _BOOLEAN)
+        add("neg" + kind, 1,
+            lambda word, kind=kind: _floatToWord(kind, -_floatFromWord(kind, word)), kind)
+
+    add("notb", 1, lambda word: int(word == 0), _BOOLEAN)
+
+    # trunc pops the narrow type and pushes it sign-extended to i64.
+    for kind in (_I8, _I16, _I32):
+        bits = _INT_BITS[kind]
+        add("trunc" + kind, 1, lambda word, bits=bits: _signed(word, bits) & _mask(64), kind)
+    add("truncf32", 1, lambda word: _f32ToWord(_f64FromWord(word)), _F32)
+
+    for toKind, fromKind in ((_I16, _I8), (_I32, _I8), (_I64, _I8),
+                             (_I32, _I16), (_I64, _I16), (_I64, _I32)):
+        fromBits, toBits = _INT_BITS[fromKind], _INT_BITS[toKind]
+        add("sexti%d_%d" % (toBits, fromBits), 1,
+            lambda word, fromBits=fromBits, toBits=toBits:
+                _signed(word, fromBits) & _mask(toBits),
+            toKind)
+
+    # zext, ftoi, and itof don't change the word at all. They only change how it's interpreted.
+    for name, kind in (("zexti16", _I16), ("zexti32", _I32), ("zexti64", _I64),
+                       ("ftoi32", _I32), ("ftoi64", _I64), ("itof32", _F32), ("itof64", _F64)):
+        add(name, 1, lambda word: word, kind)
+
+    add("extf64", 1, lambda word: _f64ToWord(_f32FromWord(word)), _F64)
+    add("fcvti32", 1, _floatToIntFolder(_F32, 32), _I32)
+    add("fcvti64", 1, _floatToIntFolder(_F64, 64), _I64)
+    add("icvtf32", 1, lambda word: _f32ToWord(float(_signed(word, 32))), _F32)
+    add("icvtf64", 1, lambda word: _f64ToWord(float(_signed(word, 64))), _F64)
+    return folders
+
+
+_FOLDERS = _buildFolders()
@@ -0,0 +1,452 @@
+# Copyright 2014, Jay Conrod. All rights reserved.
+#
+# This file is part of Gypsum. Use of this source code is governed by
+# the GPL license that can be found in the LICENSE.txt file.
+
+
+# Reads packages written by serialize.py back into IR.
+#
+# Packages only contain what the VM needs, so some information is lost. Definitions have no
+# names, functions have a placeholder variable for each local (but none for parameters),
+# class types have no type arguments, and classes have only their first supertype. Methods
+# are not linked back to their classes. Everything that is stored is read back exactly, so
+# serializing a deserialized package produces the original bytes.
+
+
+import mmap
+import os
+import struct
+
+from builtins import *
+from flags import *
+from ir import *
+import ir_instructions
+from ir_instructions import BasicBlock
+from ir_types import *
+from serialize import Serializer
+
+
+class DeserializeException(Exception):
+    def __init__(self, offset, message):
+        self.offset = offset
+        self.message = message
+
+    def __str__(self):
+        return "offset %d: error: %s" % (self.offset, self.message)
+
+
+def deserialize(fileName):
+    """Reads a package from a file.
+
+    The file is mapped into memory and parsed in place, without being copied."""
+    with open(fileName, "rb") as inFile:
+        if os.fstat(inFile.fileno()).st_size == 0:
+            return Deserializer("").deserialize()
+        data = mmap.mmap(inFile.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return Deserializer(data).deserialize()
+    finally:
+        data.close()
+
+
+def checkRoundTrip(fileName):
+    """Reads a package from a file, then checks that serializing it produces the same bytes.
+
+    Returns the package. Raises DeserializeException at the first difference."""
+    with open(fileName, "rb") as inFile:
+        data = inFile.read()
+    package = Deserializer(data).deserialize()
+    serializer = Serializer(package)
+    serializer.serialize()
+    reserialized = bytes(serializer.buf)
+    if reserialized != data:
+        offset = next((i for i, (a, b) in enumerate(zip(data, reserialized)) if a != b),
+                      min(len(data), len(reserialized)))
+        raise DeserializeException(offset, "package changed after serializing again")
+    return package
+
+
+class Deserializer(object):
+    """Decodes a package from a string, bytearray, or mmap.
+
+    The data is accessed through a buffer, so no part of it is copied except the strings."""
+
+    def __init__(self, data):
+        self.buf = buffer(data)
+        self.offset = 0
+        self.package = Package()
+
+    def deserialize(self):
+        stringCount, functionCount, classCount, typeParameterCount, entryFunction = \
+            self.readHeader()
+        self.package.addStrings([self.readRecord(i, self.readString)
+                                 for i in xrange(stringCount)])
+
+        # Definitions may refer to definitions which come later in the package, so they are
+        # all created first and filled in when they are read.
+        for _ in xrange(functionCount):
+            self.package.addFunction(_newFunction())
+        for _ in xrange(classCount):
+            self.package.addClass(_newClass())
+        for _ in xrange(typeParameterCount):
+            self.package.addTypeParameter(_newTypeParameter())
+
+        recordIndex = stringCount
+        for function in self.package.functions:
+            self.readRecord(recordIndex, self.readFunction, function)
+            recordIndex += 1
+        for clas in self.package.classes:
+            self.readRecord(recordIndex, self.readClass, clas)
+            recordIndex += 1
+        for typeParameter in self.package.typeParameters:
+            self.readRecord(recordIndex, self.readTypeParameter, typeParameter)
+            recordIndex += 1
+
+        if self.offset != len(self.buf):
+            self.error("unexpected data after end of package")
+        if entryFunction != -1:
+            self.lookupFunction(entryFunction)
+        self.package.entryFunction = entryFunction
+        return self.package
+
+    def readHeader(self):
+        magic, major, minor, flags, stringCount, functionCount, classCount, \
+            typeParameterCount, entryFunction = self.unpack("<Ihhqiiiii")
+        if magic != 0x676b7073:
+            self.error("not a package (bad magic number)", 0)
+        if (major, minor) != (0, 8):
+            self.error("unsupported package version %d.%d" % (major, minor), 4)
+        counts = (stringCount, functionCount, classCount, typeParameterCount)
+        if min(counts) < 0:
+            self.error("negative definition count", 16)
+
+        # The index of record offsets follows the header.
+        self.indexOffset = self.offset
+        self.skipBytes(4 * sum(counts))
+        return stringCount, functionCount, classCount, typeParameterCount, entryFunction
+
+    def recordOffset(self, recordIndex):
+        """Returns the offset of a record, looked up in the index.
+
+        Records are numbered in the order they appear: strings, then functions, classes, and
+        type parameters."""
+        return struct.unpack_from("<I", self.buf, self.indexOffset + 4 * recordIndex)[0]
+
+    def readRecord(self, recordIndex, reader, *args):
+        if self.offset != self.recordOffset(recordIndex):
+            self.error("record %d is not at the offset in the index" % recordIndex)
+        return reader(*args)
+
+    def readString(self):
+        length = self.readVbn()
+        size = self.readVbn()
+        encoded = self.readBytes(size)
+        try:
+            s = encoded.decode("utf-8")
+        except UnicodeDecodeError:
+            self.error("string is not valid UTF-8", self.offset - size)
+        if len(s) != length:
+            self.error("string length does not match its contents", self.offset - size)
+        return s
+
+    def readFunction(self, function):
+        self.readFunctionHeader(function)
+        function.blocks = self.readBlocks()
+
+    def readFunctionHeader(self, function):
+        function.flags = self.readFlags()
+        function.typeParameters = self.readList(lambda: self.lookupTypeParameter(self.readVbn()))
+        function.returnType = self.readType()
+        function.parameterTypes = self.readList(self.readType)
+        localsSize = self.readVbn()
+        if localsSize % WORDSIZE != 0:
+            self.error("locals size is not a multiple of the word size")
+        function.variables = [Variable(None, None, LOCAL, frozenset())
+                              for _ in xrange(localsSize // WORDSIZE)]
+
+    def readBlocks(self):
+        instructionsSize = self.readVbn()
+        start = self.offset
+        end = start + instructionsSize
+        self.skipBytes(instructionsSize)
+        blockOffsets = self.readList(self.readVbn)
+
+        blocks = []
+        offset = start
+        for i, blockOffset in enumerate(blockOffsets):
+            if offset != start + blockOffset:
+                self.error("block %d does not start at an instruction" % i, offset)
+            nextOffset = start + blockOffsets[i + 1] if i + 1 < len(blockOffsets) else end
+            instructions = []
+            while offset < nextOffset:
+                instruction, offset = self.decodeInstruction(offset, end)
+                instructions.append(instruction)
+            blocks.append(BasicBlock(i, instructions))
+        if offset != end:
+            self.error("instructions are not in any block", offset)
+        return blocks
+
+    def decodeInstruction(self, offset, end):
+        opcode = ord(self.buf[offset])
+        if opcode >= len(_instClassesByCode):
+            self.error("unknown opcode %d" % opcode, offset)
+        instClass = _instClassesByCode[opcode]
+        offset += 1
+        if instClass is ir_instructions.f32 or instClass is ir_instructions.f64:
+            format = "<f" if instClass is ir_instructions.f32 else "<d"
+            size = struct.calcsize(format)
+            if offset + size > end:
+                self.error("instruction is truncated", offset)
+            operands = struct.unpack_from(format, self.buf, offset)
+            offset += size
+        else:
+            operands = []
+            for _ in xrange(instClass.info.operandCount):
+                operand, offset = self.decodeVbn(offset, end)
+                operands.append(operand)
+        return instClass(*operands), offset
+
+    def readClass(self, clas):
+        clas.flags = self.readFlags()
+        clas.supertypes = [self.readType()]
+        clas.fields = self.readList(self.readField)
+        clas.constructors = self.readList(lambda: self.lookupFunction(self.readVbn()))
+        clas.methods = self.readList(lambda: self.lookupFunction(self.readVbn()))
+
+    def readField(self):
+        flags = self.readFlags()
+        return Field(None, self.readType(), flags)
+
+    def readTypeParameter(self, typeParameter):
+        typeParameter.flags = self.readFlags()
+        typeParameter.upperBound = self.readType()
+        typeParameter.lowerBound = self.readType()
+
+    def readType(self):
+        offset = self.offset
+        bits = self.readVbn()
+        form = bits & 0xF
+        flags = frozenset([NULLABLE_TYPE_FLAG]) if bits >> 4 & 1 else frozenset()
+        if bits >> 5 != 0:
+            self.error("unknown type flags", offset)
+        if form < len(_simpleTypesByForm):
+            if flags:
+                self.error("primitive type cannot be nullable", offset)
+            return _simpleTypesByForm[form]
+        elif form == 8:
+            return ClassType(self.lookupClass(self.readVbn()), (), flags)
+        elif form == 9:
+            return VariableType(self.lookupTypeParameter(self.readVbn()), flags)
+        else:
+            self.error("unknown type form %d" % form, offset)
+
+    def readFlags(self):
+        offset = self.offset
+        bits, = self.unpack("<I")
+        try:
+            return flagBitsToFlagSet(bits)
+        except ValueError as e:
+            self.error(str(e), offset)
+
+    def readList(self, reader):
+        return [reader() for _ in xrange(self.readVbn())]
+
+    def readVbn(self):
+        value, self.offset = self.decodeVbn(self.offset, len(self.buf))
+        return value
+
+    def decodeVbn(self, offset, end):
+        buf = self.buf
+        value = 0
+        shift = 0
+        while True:
+            if offset >= end:
+                self.error("number is truncated", offset)
+            bits = ord(buf[offset])
+            offset += 1
+            value |= (bits & 0x7F) << shift
+            shift += 7
+            if not bits & 0x80:
+                break
+        if bits & 0x40:
+            value -= 1 << shift
+        return value, offset
+
+    def readBytes(self, size):
+        offset = self.offset
+        self.skipBytes(size)
+        return self.buf[offset:self.offset]
+
+    def skipBytes(self, size):
+        if size < 0 or self.offset + size > len(self.buf):
+            self.error("data is truncated")
+        self.offset += size
+
+    def unpack(self, format):
+        size = struct.calcsize(format)
+        if self.offset + size > len(self.buf):
+            self.error("data is truncated")
+        values = struct.unpack_from(format, self.buf, self.offset)
+        self.offset += size
+        return values
+
+    def lookupFunction(self, id):
+        return self.lookupDefinition(id, self.package.functions, getBuiltinFunctionById,
+                                     "function")
+
+    def lookupClass(self, id):
+        return self.lookupDefinition(id, self.package.classes, getBuiltinClassById, "class")
+
+    def lookupTypeParameter(self, id):
+        return self.lookupDefinition(id, self.package.typeParameters, None, "type parameter")
+
+    def lookupDefinition(self, id, defns, getBuiltin, kind):
+        if 0 <= id < len(defns):
+            return defns[id]
+        defn = getBuiltin(id) if id < 0 and getBuiltin is not None else None
+        if defn is None:
+            self.error("unknown %s id %d" % (kind, id))
+        return defn
+
+    def error(self, message, offset=None):
+        raise DeserializeException(self.offset if offset is None else offset, message)
+
+
+class LazyPackage(Deserializer):
+    """A view of a package in a file, which decodes definitions only when they are used.
+
+    The file is mapped into memory, and only the header is read when the view is created.
+    Records are found through the index which follows the header, so nothing else is read
+    until a definition is requested. Requested definitions are decoded and cached, along
+    with any definitions they refer to. Functions are decoded without their blocks (blocks
+    is None) until they are requested with getFunction, so the bytecode of other functions
+    is never decoded."""
+
+    def __init__(self, fileName):
+        with open(fileName, "rb") as inFile:
+            if os.fstat(inFile.fileno()).st_size == 0:
+                self.data = ""
+            else:
+                self.data = mmap.mmap(inFile.fileno(), 0, access=mmap.ACCESS_READ)
+        super(LazyPackage, self).__init__(self.data)
+        self.stringCount, self.functionCount, self.classCount, self.typeParameterCount, \
+            self.entryFunction = self.readHeader()
+        self.blocksOffsets = {}
+        self.strings = {}
+        self.functions = {}
+        self.classes = {}
+        self.typeParameters = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.buf = None
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def getString(self, id):
+        s = self.strings.get(id)
+        if s is None:
+            self.checkId(id, self.stringCount, "string")
+            s = self.decodeAt(self.recordOffset(id), self.readString)
+            self.strings[id] = s
+        return s
+
+    def getFunction(self, id):
+        """Returns a function with its blocks decoded."""
+        self.checkId(id, self.functionCount, "function")
+        function = self.lookupFunction(id)
+        if function.blocks is None:
+            function.blocks = self.decodeAt(self.blocksOffsets[id], self.readBlocks)
+        return function
+
+    def getClass(self, id):
+        self.checkId(id, self.classCount, "class")
+        return self.lookupClass(id)
+
+    def getTypeParameter(self, id):
+        self.checkId(id, self.typeParameterCount, "type parameter")
+        return self.lookupTypeParameter(id)
+
+    def lookupFunction(self, id):
+        if id < 0:
+            return super(LazyPackage, self).lookupFunction(id)
+        function = self.functions.get(id)
+        if function is None:
+            self.checkReferencedId(id, self.functionCount, "function")
+            function = _newFunction()
+            function.id = id
+            self.functions[id] = function
+            self.decodeAt(self.recordOffset(self.stringCount + id),
+                          self.readFunctionWithoutBlocks, function)
+        return function
+
+    def lookupClass(self, id):
+        if id < 0:
+            return super(LazyPackage, self).lookupClass(id)
+        clas = self.classes.get(id)
+        if clas is None:
+            self.checkReferencedId(id, self.classCount, "class")
+            clas = _newClass()
+            clas.id = id
+            self.classes[id] = clas
+            self.decodeAt(self.recordOffset(self.stringCount + self.functionCount + id),
+                          self.readClass, clas)
+        return clas
+
+    def lookupTypeParameter(self, id):
+        typeParameter = self.typeParameters.get(id)
+        if typeParameter is None:
+            self.checkReferencedId(id, self.typeParameterCount, "type parameter")
+            typeParameter = _newTypeParameter()
+            typeParameter.id = id
+            self.typeParameters[id] = typeParameter
+            recordIndex = self.stringCount + self.functionCount + self.classCount + id
+            self.decodeAt(self.recordOffset(recordIndex), self.readTypeParameter,
+                          typeParameter)
+        return typeParameter
+
+    def readFunctionWithoutBlocks(self, function):
+        self.readFunctionHeader(function)
+        function.blocks = None
+        self.blocksOffsets[function.id] = self.offset
+
+    def decodeAt(self, offset, reader, *args):
+        # Definitions are decoded recursively, so the current offset is saved and restored.
+        savedOffset = self.offset
+        self.offset = offset
+        try:
+            return reader(*args)
+        finally:
+            self.offset = savedOffset
+
+    def checkId(self, id, count, kind):
+        if not 0 <= id < count:
+            raise IndexError("%s id %d is out of range" % (kind, id))
+
+    def checkReferencedId(self, id, count, kind):
+        if not 0 <= id < count:
+            self.error("unknown %s id %d" % (kind, id))
+
+
+def _newFunction():
+    return Function(None, None, None, None, None, None, frozenset())
+
+
+def _newClass():
+    return Class(None, [], None, None, [], [], [], frozenset())
+
+
+def _newTypeParameter():
+    return TypeParameter(None, None, None, frozenset())
+
+
+# Type forms, as written by Serializer.writeType. Forms 8 and 9 are class and variable types.
+_simpleTypesByForm = [UnitType, BooleanType, I8Type, I16Type, I32Type, I64Type,
+                      F32Type, F64Type]
+
+_instClassesByCode = [getattr(ir_instructions, info.name) for info in instInfoByCode]
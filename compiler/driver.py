@@ -0,0 +1,228 @@
+# Copyright 2014, Jay Conrod. All rights reserved.
+#
+# This file is part of Gypsum. Use of this source code is governed by
+# the GPL license that can be found in the LICENSE.txt file.
+
+
+import multiprocessing
+import os.path
+import sys
+import traceback
+
+from lexer import *
+from layout import *
+from parser import *
+from scope_analysis import *
+from type_analysis import *
+from compiler import compile
+from serialize import serialize
+from stats import CompileStats, NullStats
+from utils import StringIO
+
+
+def compileFile(sourceFilename, outputFilename, options, out=None, stats=None, cache=None):
+    """Compiles one source file into a package and writes it to outputFilename.
+
+    options is the namespace parsed by the compiler script; its print_*, no_layout,
+    codegen_jobs, and peephole attributes are used here. Anything printed is written to out,
+    which is sys.stdout by default. If a CompileStats object is given, the time taken by each
+    phase and the number of objects it produced are recorded in it.
+
+    If a CompileCache is given, the package is copied from the cache when the same source
+    was compiled before with the same compiler, and it's added to the cache otherwise. The
+    cache is not used when anything is printed or when the package is written to stdout."""
+    if out is None:
+        out = sys.stdout
+    if stats is None:
+        stats = NullStats()
+    with open(sourceFilename) as inFile:
+        source = inFile.read()
+
+    useCache = cache is not None and outputFilename != "-" and \
+               not any(getattr(options, name) for name in _printOptions)
+    if useCache:
+        with stats.phase("cacheLookup") as phase:
+            key = cache.key(source, options)
+            hit = cache.fetch(key, outputFilename)
+        phase.count("hits", int(hit))
+        if hit:
+            return
+
+    # Tokens are streamed from the lexer through layout into the parser, unless they need to be
+    # printed or counted along the way.
+    with stats.phase("lex") as phase:
+        rawTokens = iterLex(sourceFilename, source)
+        if options.print_tokens or stats.enabled:
+            rawTokens = list(rawTokens)
+            phase.count("tokens", len(rawTokens))
+    if options.print_tokens:
+        for tok in rawTokens:
+            out.write(str(tok) + "\n")
+    with stats.phase("layout") as phase:
+        layoutTokens = iterLayout(rawTokens, skipAnalysis=options.no_layout)
+        if options.print_layout or stats.enabled:
+            layoutTokens = list(layoutTokens)
+            phase.count("tokens", len(layoutTokens))
+    if options.print_layout:
+        for tok in layoutTokens:
+            out.write(str(tok) + "\n")
+    with stats.phase("parse") as phase:
+        ast = parse(sourceFilename, layoutTokens)
+    if stats.enabled:
+        phase.count("astNodes", _countAstNodes(ast))
+    if options.print_ast:
+        printer = AstPrinter(out)
+        printer.visit(ast)
+
+    info = CompileInfo(ast)
+    with stats.phase("analyzeDeclarations") as phase:
+        analyzeDeclarations(info)
+    phase.count("scopes", len(info.scopes))
+    phase.count("definitions", len(info.defnInfo))
+    with stats.phase("analyzeInheritance") as phase:
+        analyzeInheritance(info)
+    phase.count("classes", len(info.classInfo))
+    if options.print_scope:
+        printer = InfoPrinter(out, info)
+        printer.visit(ast)
+    with stats.phase("analyzeTypes") as phase:
+        analyzeTypes(info)
+    phase.count("types", len(info.typeInfo))
+    phase.count("uses", len(info.useInfo))
+    if options.print_types:
+        printer = InfoPrinter(out, info)
+        printer.visit(ast)
+    with stats.phase("convertClosures") as phase:
+        convertClosures(info)
+    phase.count("closures", len(info.closureInfo))
+    with stats.phase("flattenClasses") as phase:
+        flattenClasses(info)
+    phase.count("irClasses", len(info.package.classes))
+    peepholeCounts = {}
+    with stats.phase("compile") as phase:
+        compile(info, options.codegen_jobs, options.peephole, peepholeCounts)
+    package = info.package
+    if stats.enabled:
+        for rule in options.peephole:
+            phase.count("peephole." + rule, peepholeCounts.get(rule, 0))
+        blocks = [block for function in package.functions for block in function.blocks or []]
+        phase.count("irFunctions", len(package.functions))
+        phase.count("blocks", len(blocks))
+        phase.count("instructions", sum(len(block.instructions) for block in blocks))
+    if options.print_ir:
+        out.write("%s\n" % str(package))
+    with stats.phase("serialize") as phase:
+        serialize(package, outputFilename)
+    if stats.enabled and outputFilename != "-":
+        phase.count("bytes", os.path.getsize(outputFilename))
+    if useCache:
+        with stats.phase("cacheStore"):
+            cache.store(key, outputFilename)
+
+
+_printOptions = ["print_tokens", "print_layout", "print_ast", "print_scope", "print_types",
+                 "print_ir"]
+
+
+def _countAstNodes(node):
+    return 1 + sum(_countAstNodes(child) for child in node.children() if child is not None)
+
+
+def outputFilenames(sourceFilenames, output, outputDir):
+    """Chooses where the package for each source file is written.
+
+    If outputDir is None, every package is written to output. Otherwise each package is
+    written to a file in outputDir named after its source, with a .csp extension. Raises
+    ValueError if two sources would be written to the same file."""
+    if outputDir is None:
+        return [output] * len(sourceFilenames)
+    filenames = []
+    sourcesByOutput = {}
+    for sourceFilename in sourceFilenames:
+        baseName = os.path.splitext(os.path.basename(sourceFilename))[0]
+        outputFilename = os.path.join(outputDir, baseName + ".csp")
+        if outputFilename in sourcesByOutput:
+            raise ValueError("%s and %s would both be written to %s" %
+                             (sourcesByOutput[outputFilename], sourceFilename, outputFilename))
+        sourcesByOutput[outputFilename] = sourceFilename
+        filenames.append(outputFilename)
+    return filenames
+
+
+def compileFiles(sourceFilenames, outputFilenames, options, jobs=1, stats=None, cache=None):
+    """Compiles several source files, each into its own package.
+
+    With jobs > 1, files are compiled concurrently in a pool of worker processes. Each package
+    only depends on its own source, so the files written are the same as in a sequential
+    build. Printed output and errors are collected from the workers and written in the order
+    the sources were given, also as in a sequential build.
+
+    If stats is a list, a CompileStats object for each file is appended to it, in the order
+    the sources were given. If a CompileCache is given, it's used for each file, and its hit
+    and miss counters include lookups made by workers.
+
+    Returns True if every file was compiled. The first IOError stops a sequential build; in a
+    parallel build, files already submitted are still compiled, and errors from all of them
+    are reported."""
+    tasks = zip(sourceFilenames, outputFilenames)
+    jobs = min(jobs, len(tasks))
+    if jobs <= 1:
+        for sourceFilename, outputFilename in tasks:
+            fileStats = CompileStats(sourceFilename) if stats is not None else None
+            try:
+                compileFile(sourceFilename, outputFilename, options,
+                            stats=fileStats, cache=cache)
+            except IOError, err:
+                sys.stderr.write("%s: error: %s\n" % (sourceFilename, str(err)))
+                return False
+            if stats is not None:
+                stats.append(fileStats)
+        return True
+
+    # Build the grammar before forking so workers don't each build their own copy.
+    module()
+    pool = multiprocessing.Pool(jobs)
+    try:
+        collectStats = stats is not None
+        results = pool.imap(_compileInWorker,
+                            [(s, o, options, collectStats, cache) for s, o in tasks])
+        succeeded = True
+        for printed, error, fileStats, cacheHits, cacheMisses in results:
+            if cache is not None:
+                cache.hits += cacheHits
+                cache.misses += cacheMisses
+            sys.stdout.write(printed)
+            if error is not None:
+                sys.stderr.write(error)
+                succeeded = False
+            elif collectStats:
+                stats.append(fileStats)
+        sys.stdout.flush()
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return succeeded
+
+
+def _compileInWorker(task):
+    # Exceptions raised by compiler passes don't always survive pickling, so errors are sent
+    # back to the parent as text. The cache is a copy, so the lookups it counts are sent back
+    # too.
+    sourceFilename, outputFilename, options, collectStats, cache = task
+    out = StringIO()
+    stats = CompileStats(sourceFilename) if collectStats else None
+    if cache is not None:
+        cache.hits = cache.misses = 0
+    try:
+        compileFile(sourceFilename, outputFilename, options, out, stats, cache)
+        error = None
+    except IOError, err:
+        error = "%s: error: %s\n" % (sourceFilename, str(err))
+    except Exception:
+        error = "%s: error: compilation failed\n%s" % (sourceFilename, traceback.format_exc())
+    if cache is None:
+        return out.getvalue(), error, stats, 0, 0
+    return out.getvalue(), error, stats, cache.hits, cache.misses
@@ -5,9 +5,38 @@
 
 
 class Equality(object):
+    """Objects are equal if they have the same class and the same attributes.
+
+    Attributes may be stored in __dict__ or declared in __slots__. An attribute which hasn't
+    been set is only equal to another attribute which hasn't been set."""
+
+    __slots__ = ()
+
     def __eq__(self, other):
-        return isinstance(other, self.__class__) and \
-               self.__dict__ == other.__dict__
+        if not isinstance(other, self.__class__):
+            return False
+        for name in _slotNames(other.__class__):
+            if not (getattr(self, name, _MISSING) == getattr(other, name, _MISSING)):
+                return False
+        return getattr(self, "__dict__", None) == getattr(other, "__dict__", None)
 
     def __ne__(self, other):
         return not self.__eq__(other)
+
+
+_MISSING = object()
+
+_slotNamesByClass = {}
+
+def _slotNames(cls):
+    names = _slotNamesByClass.get(cls)
+    if names is None:
+        names = []
+        for c in cls.__mro__:
+            slots = c.__dict__.get("__slots__", ())
+            if isinstance(slots, str):
+                slots = (slots,)
+            names.extend(name for name in slots if name not in ("__dict__", "__weakref__"))
+        names = tuple(names)
+        _slotNamesByClass[cls] = names
+    return names
@@ -24,6 +24,13 @@ def flagSetToFlagBits(flagSet):
     return reduce(lambda bits, flag: bits | _flagCodes[flag], flagSet, 0)
 
 
+def flagBitsToFlagSet(bits):
+    flagSet = frozenset(flag for flag, code in _flagCodes.iteritems() if bits & code)
+    if flagSetToFlagBits(flagSet) != bits:
+        raise ValueError("unknown flag bits: 0x%x" % bits)
+    return flagSet
+
+
 _flagCodes = {}
 _flagNames = {}
 _flagGroups = []
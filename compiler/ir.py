@@ -17,6 +17,7 @@ class Package(object):
         self.classes = []
         self.typeParameters = []
         self.strings = []
+        self.stringIds = {}
         self.entryFunction = -1
 
     def __str__(self):
@@ -58,11 +59,33 @@ class Package(object):
 
     def findOrAddString(self, s):
         assert type(s) == unicode
-        for i in xrange(0, len(self.strings)):
-            if self.strings[i] == s:
-                return i
-        self.strings.append(s)
-        return len(self.strings) - 1
+        id = self.stringIds.get(s)
+        if id is None:
+            id = len(self.strings)
+            self.strings.append(s)
+            self.stringIds[s] = id
+        return id
+
+    def addStrings(self, strings):
+        """Adds several strings to the package at once.
+
+        Strings are added in order, skipping any already present, exactly as if
+        findOrAddString were called for each one. Returns a list of their ids."""
+        ids = []
+        stringIds = self.stringIds
+        for s in strings:
+            assert type(s) == unicode
+            id = stringIds.get(s)
+            if id is None:
+                id = len(self.strings)
+                self.strings.append(s)
+                stringIds[s] = id
+            ids.append(id)
+        return ids
+
+    def clearStrings(self):
+        self.strings = []
+        self.stringIds = {}
 
     def findFunction(self, **kwargs):
         return next(self.find(self.functions, kwargs))
@@ -118,8 +141,11 @@ class Function(IrDefinition):
         if self.isMethod():
             # Nullable receivers are fine, since they are checked when a method is called.
             argTypes = [argTypes[0].withoutFlag(NULLABLE_TYPE_FLAG)] + argTypes[1:]
-        paramTypes = [pt.substitute(self.typeParameters, typeArgs)
-                      for pt in self.parameterTypes]
+        if len(self.typeParameters) == 0:
+            paramTypes = self.parameterTypes
+        else:
+            paramTypes = [pt.substitute(self.typeParameters, typeArgs)
+                          for pt in self.parameterTypes]
         return all(at.isSubtypeOf(pt) for at, pt in zip(argTypes, paramTypes))
 
     def isMethod(self):
@@ -183,6 +209,16 @@ class Class(IrDefinition):
     propertyNames = ("name", "typeParameters", "supertypes", \
                      "initializer", "constructors", "fields", "methods", "flags")
 
+    @property
+    def supertypes(self):
+        return self.supertypes_
+
+    @supertypes.setter
+    def supertypes(self, supertypes):
+        # Subtype checks and hierarchy indices are cached, and the results depend on this.
+        self.supertypes_ = supertypes
+        invalidateClassHierarchy()
+
     def superclass(self):
         assert self is not getNothingClass()
         if len(self.supertypes) == 0:
@@ -207,21 +243,39 @@ class Class(IrDefinition):
         elif other.id == nothingClassId:
             return False
         else:
-            return other in self.superclasses()
+            return id(other) in self.hierarchyIndex()[1]
 
     def findCommonBaseClass(self, other):
         """Returns a class which (a) is a superclass of both classes, and (b) has no subclasses
         which are superclasses of both classes."""
         if self is other:
             return self
-        selfBases = list(self.superclasses())
-        selfLast = -len(selfBases) - 1
-        otherBases = list(other.superclasses())
-        otherLast = -len(otherBases) - 1
-        i = -1
-        while i > selfLast and i > otherLast and selfBases[i] is otherBases[i]:
-            i -= 1
-        return selfBases[i + 1]
+        selfBases = self.hierarchyIndex()[0]
+        otherBases = other.hierarchyIndex()[0]
+        if selfBases[0] is not otherBases[0]:
+            return self
+
+        # Bases are listed from the root, so the common bases are a prefix of both lists.
+        low, high = 1, min(len(selfBases), len(otherBases))
+        while low < high:
+            mid = (low + high + 1) // 2
+            if selfBases[mid - 1] is otherBases[mid - 1]:
+                low = mid
+            else:
+                high = mid - 1
+        return selfBases[low - 1]
+
+    def hierarchyIndex(self):
+        """Returns the superclasses of this class, starting with the root, and a set of their
+        ids. This is computed once and reused until the supertypes of any class change."""
+        version = getHierarchyVersion()
+        index = getattr(self, "hierarchyIndex_", None)
+        if index is None or index[0] != version:
+            bases = list(self.superclasses())
+            bases.reverse()
+            index = (version, bases, frozenset(id(base) for base in bases))
+            self.hierarchyIndex_ = index
+        return index[1:]
 
     def getConstructor(self, argTypes):
         # TODO: support constructor overloading
@@ -5,6 +5,7 @@
 
 
 import copy
+import weakref
 
 import builtins
 from bytecode import *
@@ -14,25 +15,34 @@ from ir_values import *
 
 NULLABLE_TYPE_FLAG = "nullable"
 
+def _normalizeFlags(flags):
+    if flags is None:
+        flags = frozenset()
+    if isinstance(flags, str):
+        flags = frozenset([flags])
+    assert isinstance(flags, frozenset)
+    return flags
+
+
 class Type(Data):
     propertyNames = ("flags",)
 
     def __init__(self, flags=None):
-        if flags is None:
-            flags = frozenset()
-        if isinstance(flags, str):
-            flags = frozenset([flags])
-        assert isinstance(flags, frozenset)
-        self.flags = flags
+        self.flags = _normalizeFlags(flags)
 
     def withFlag(self, flag):
-        ty = copy.copy(self)
-        ty.flags |= frozenset((flag,))
-        return ty
+        if flag in self.flags:
+            return self
+        return self.withFlags(self.flags | frozenset((flag,)))
 
     def withoutFlag(self, flag):
+        if flag not in self.flags:
+            return self
+        return self.withFlags(self.flags - frozenset((flag,)))
+
+    def withFlags(self, flags):
         ty = copy.copy(self)
-        ty.flags -= frozenset((flag,))
+        ty.flags = flags
         return ty
 
     def isSubtypeOf(self, other):
@@ -135,7 +145,30 @@ F64Type = SimpleType("f64", W64, F64Value(0.))
 BooleanType = SimpleType("boolean", W8, BooleanValue(False))
 
 
+class _InternedType(type):
+    """Metaclass for types which are interned.
+
+    Calling a class with this metaclass returns an existing instance if one was already created
+    with the same internKey, so structurally equal types are the same object. Instances are
+    held weakly, so types which are no longer used are still freed. Interned types must not be
+    modified after they are created."""
+
+    def __init__(cls, name, bases, members):
+        super(_InternedType, cls).__init__(name, bases, members)
+        cls.internTable_ = weakref.WeakValueDictionary()
+
+    def __call__(cls, *args, **kwargs):
+        key = cls.internKey(*args, **kwargs)
+        ty = cls.internTable_.get(key)
+        if ty is None:
+            ty = super(_InternedType, cls).__call__(*args, **kwargs)
+            cls.internTable_[key] = ty
+        return ty
+
+
 class ObjectType(Type):
+    __metaclass__ = _InternedType
+
     def __init__(self, flags):
         super(ObjectType, self).__init__(flags)
 
@@ -156,7 +189,15 @@ class ClassType(ObjectType):
     def __init__(self, clas, typeArguments=(), flags=None):
         super(ClassType, self).__init__(flags)
         self.clas = clas
-        self.typeArguments = typeArguments
+        self.typeArguments = tuple(typeArguments)
+        self.hash_ = hashList([self.flags, clas.name, self.typeArguments])
+        self.subtypeCache_ = None
+
+    @staticmethod
+    def internKey(clas, typeArguments=(), flags=None):
+        # Classes are compared by identity. The interned type refers to its class, so the id
+        # can't be reused while the type is in the table.
+        return id(clas), tuple(typeArguments), _normalizeFlags(flags)
 
     def __str__(self):
         if len(self.typeArguments) == 0:
@@ -174,14 +215,35 @@ class ClassType(ObjectType):
                 ", ".join(self.flags))
 
     def __hash__(self):
-        return hashList([getattr(self, name) for name in Type.propertyNames] + \
-                        [self.clas.name, self.typeArguments])
+        return self.hash_
 
     def __eq__(self, other):
-        return self.__class__ is other.__class__ and \
-               self.flags == other.flags and \
-               self.clas is other.clas and \
-               self.typeArguments == other.typeArguments
+        return self is other
+
+    def __ne__(self, other):
+        return self is not other
+
+    def withFlags(self, flags):
+        return ClassType(self.clas, self.typeArguments, flags)
+
+    def isSubtypeOf(self, other):
+        if self is other:
+            return True
+        if other.__class__ is not ClassType:
+            return super(ClassType, self).isSubtypeOf(other)
+        # Results are cached for the current class hierarchy, keyed by the id of the other
+        # type. Other types are held weakly, so the cache doesn't keep them (or their classes)
+        # alive, and an entry is only used if its type is still the one with that id.
+        cache = self.subtypeCache_
+        if cache is None or cache[0] != _hierarchyVersion:
+            cache = (_hierarchyVersion, {})
+            self.subtypeCache_ = cache
+        entry = cache[1].get(id(other))
+        if entry is not None and entry[0]() is other:
+            return entry[1]
+        result = super(ClassType, self).isSubtypeOf(other)
+        cache[1][id(other)] = (weakref.ref(other), result)
+        return result
 
     def substitute(self, parameters, replacements):
         return ClassType(self.clas,
@@ -198,10 +260,14 @@ class VariableType(ObjectType):
     propertyNames = Type.propertyNames + ("typeParameter",)
     width = WORD
 
-    def __init__(self, typeParameter):
-        super(VariableType, self).__init__(frozenset())
+    def __init__(self, typeParameter, flags=None):
+        super(VariableType, self).__init__(flags)
         self.typeParameter = typeParameter
 
+    @staticmethod
+    def internKey(typeParameter, flags=None):
+        return id(typeParameter), _normalizeFlags(flags)
+
     def __str__(self):
         return self.typeParameter.name
 
@@ -215,6 +281,9 @@ class VariableType(ObjectType):
         return self.__class__ is other.__class__ and \
                self.typeParameter is other.typeParameter
 
+    def withFlags(self, flags):
+        return VariableType(self.typeParameter, flags)
+
     def substitute(self, parameters, replacements):
         assert len(parameters) == len(replacements)
         for param, repl in zip(parameters, replacements):
@@ -227,6 +296,19 @@ class VariableType(ObjectType):
                self.typeParameter.upperBound.isNullable()
 
 
+# Incremented whenever the supertypes of a class change. Results which depend on the class
+# hierarchy (ClassType.isSubtypeOf and Class.hierarchyIndex) are cached along with the version
+# they were computed for, so this invalidates all of them.
+_hierarchyVersion = 0
+
+def getHierarchyVersion():
+    return _hierarchyVersion
+
+def invalidateClassHierarchy():
+    global _hierarchyVersion
+    _hierarchyVersion += 1
+
+
 def getClassFromType(ty):
     if isinstance(ty, ClassType):
         return ty.clas
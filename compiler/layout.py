@@ -5,7 +5,8 @@
 
 
 # This module provides automatic insertion of semicolons (;) and braces ({, }) based on
-# indentation. It operates on the output of the lexer, returning a new list of tokens.
+# indentation. It operates on the output of the lexer, returning a new list of tokens. The
+# iterLayout variant consumes and produces tokens lazily, one at a time.
 #
 # Internally, a stack of indentation is maintained. Each element is the number of tabs
 # and spaces used to indent a particular block. Tabs are almost more significant than
@@ -26,7 +27,12 @@
 # the current indentation ((0, 0) in case of end of file) is greater than or equal to the
 # block on top of the stack, the stack is popped and a closing brace (}) is inserted. Unless
 # the next token is the keyword "else" or "catch", a semicolon is also inserted.
+#
+# layoutWithCheckpoints also records the analyzer's state before each line with no
+# indentation. After an edit, relayout restarts from the last checkpoint before the edit and
+# stops at the first checkpoint after the edit where the state matches the old state.
 
+import bisect
 import re
 
 from token import *
@@ -41,115 +47,292 @@ class LayoutException(Exception):
 
 
 def layout(tokensIn, skipAnalysis=False):
+    return list(iterLayout(tokensIn, skipAnalysis))
+
+
+def iterLayout(tokensIn, skipAnalysis=False):
+    """Returns a generator which yields layout tokens lazily as raw tokens are consumed.
+
+    tokensIn may be any iterable, including the generator returned by iterLex. Only the
+    indentation stack and pattern state are kept between tokens, so memory use does not
+    depend on the number of tokens."""
     if skipAnalysis:
-        tokensOut = filter(lambda t: t.isPrintable(), tokensIn)
-        return tokensOut
-
-    tokensOut = []
-    indentStack = [IndentLevel(0, 0)]
-    patterns = PatternManager([
-      ["var", ANY_PATTERN, "="],
-      ["def", ANY_PATTERN, "="],
-      ["class", ANY_PATTERN],
-      ["if", "(", ANY_PATTERN, ")"],
-      ["else"],
-      ["else", "if", "(", ANY_PATTERN, ")"],
-      ["while", "(", ANY_PATTERN, ")"],
-      ["match", "(", ANY_PATTERN, ")"],
-      ["case", ANY_PATTERN, "=>"],
-      ["try"],
-      ["catch"],
-      ["catch", "(", ANY_PATTERN, ")"],
-      ["finally"],
-      ["lambda", "(", ANY_PATTERN, ")"]
-    ])
+        return (t for t in tokensIn if t.isPrintable())
+    else:
+        return _iterLayout(tokensIn)
+
+
+def layoutWithCheckpoints(tokensIn):
+    """Returns the same tokens as layout, and a list of LayoutCheckpoints for relayout."""
+    return _layoutFrom(tokensIn, 0, LayoutAnalyzer(), [], [])
+
+
+def relayout(tokensIn, splice, oldTokensOut, oldCheckpoints):
+    """Updates the output of layoutWithCheckpoints after an edit.
+
+    tokensIn is the new list of raw tokens, and splice describes how it differs from the old
+    list, as returned by relex. Returns a new list of layout tokens and a new list of
+    checkpoints. Layout tokens which follow the re-analyzed lines are reused with locations
+    moved by splice.shift."""
+    index = bisect.bisect_right(_CheckpointRawIndices(oldCheckpoints), splice.first) - 1
+    if index < 0:
+        analyzer = LayoutAnalyzer()
+        rawIndex = 0
+        tokensOut = []
+    else:
+        checkpoint = oldCheckpoints[index]
+        analyzer = LayoutAnalyzer.fromCheckpoint(checkpoint)
+        rawIndex = checkpoint.rawIndex
+        tokensOut = oldTokensOut[:checkpoint.outIndex]
+    checkpoints = oldCheckpoints[:max(index, 0)]
+
+    rawDelta = splice.newStop - splice.oldStop
+    def resync(checkpoint):
+        if checkpoint.rawIndex < splice.newStop:
+            return None
+        oldRawIndex = checkpoint.rawIndex - rawDelta
+        oldIndex = bisect.bisect_left(_CheckpointRawIndices(oldCheckpoints), oldRawIndex)
+        if oldIndex == len(oldCheckpoints):
+            return None
+        oldCheckpoint = oldCheckpoints[oldIndex]
+        if oldCheckpoint.rawIndex != oldRawIndex or not oldCheckpoint.isEquivalent(checkpoint):
+            return None
+        outDelta = checkpoint.outIndex - oldCheckpoint.outIndex
+        restTokens = splice.shift.shiftTokens(oldTokensOut[oldCheckpoint.outIndex:])
+        restCheckpoints = [c.moved(rawDelta, outDelta) for c in oldCheckpoints[oldIndex:]]
+        return restTokens, restCheckpoints
+
+    return _layoutFrom(tokensIn, rawIndex, analyzer, tokensOut, checkpoints, resync)
+
+
+def _layoutFrom(tokensIn, rawIndex, analyzer, tokensOut, checkpoints, resync=None):
+    for i in xrange(rawIndex, len(tokensIn)):
+        token = tokensIn[i]
+        if analyzer.state is LayoutAnalyzer.BEGIN and token.isPrintable():
+            checkpoint = analyzer.checkpoint(i, len(tokensOut))
+            rest = resync(checkpoint) if resync is not None else None
+            if rest is not None:
+                (restTokens, restCheckpoints) = rest
+                tokensOut.extend(restTokens)
+                checkpoints.extend(restCheckpoints)
+                return tokensOut, checkpoints
+            checkpoints.append(checkpoint)
+        analyzer.next(token)
+        tokensOut.extend(analyzer.flush())
+    analyzer.finish()
+    tokensOut.extend(analyzer.flush())
+    return tokensOut, checkpoints
+
+
+class _CheckpointRawIndices(object):
+    """A sequence of the raw token indices of checkpoints, for bisect."""
+
+    def __init__(self, checkpoints):
+        self.checkpoints = checkpoints
+
+    def __len__(self):
+        return len(self.checkpoints)
+
+    def __getitem__(self, index):
+        return self.checkpoints[index].rawIndex
+
+
+def _iterLayout(tokensIn):
+    analyzer = LayoutAnalyzer()
+    for token in tokensIn:
+        analyzer.next(token)
+        for tokenOut in analyzer.flush():
+            yield tokenOut
+    analyzer.finish()
+    for tokenOut in analyzer.flush():
+        yield tokenOut
+
+
+class LayoutAnalyzer(object):
+    """Inserts layout tokens into a stream of raw tokens, one token at a time.
+
+    Raw tokens are passed to `next`, and `finish` is called after the last one. Output tokens
+    accumulate until they are removed with `flush`."""
 
     BEGIN = "begin"
     PRENORMAL = "pre-normal"
     NORMAL = "normal"
-    state = BEGIN
-    indent = None
-
-    def dedent(indent, text, loc):
-        while indent < indentStack[-1]:
-            indentStack.pop()
-            patterns.pop()
-            if tokensOut[-1].text != ";":
-                tokensOut.append(Token(";", INTERNAL, loc))
-            if indent < indentStack[-1] or text != "}":
-                tokensOut.append(Token("}", INTERNAL, loc))
-
-    for pos in range(0, len(tokensIn)):
-        token = tokensIn[pos]
-        if state is BEGIN:
+
+    def __init__(self):
+        self.indentStack = [IndentLevel(0, 0)]
+        self.patterns = PatternManager([
+          ["var", ANY_PATTERN, "="],
+          ["def", ANY_PATTERN, "="],
+          ["class", ANY_PATTERN],
+          ["if", "(", ANY_PATTERN, ")"],
+          ["else"],
+          ["else", "if", "(", ANY_PATTERN, ")"],
+          ["while", "(", ANY_PATTERN, ")"],
+          ["match", "(", ANY_PATTERN, ")"],
+          ["case", ANY_PATTERN, "=>"],
+          ["try"],
+          ["catch"],
+          ["catch", "(", ANY_PATTERN, ")"],
+          ["finally"],
+          ["lambda", "(", ANY_PATTERN, ")"]
+        ])
+        self.state = self.BEGIN
+        self.indent = None
+
+        # Tokens which have been produced but not flushed yet. Only the last token produced
+        # and the number of tokens produced are needed to decide what to insert.
+        self.pending = []
+        self.lastToken = None
+        self.tokenCount = 0
+
+    def checkpoint(self, rawIndex, outIndex):
+        """Returns a LayoutCheckpoint for the current state.
+
+        The analyzer must be about to read the first token of a line, and no tokens may be
+        pending."""
+        assert self.state is self.BEGIN and not self.pending
+        indentStack = tuple((level.tabs, level.spaces) for level in self.indentStack)
+        return LayoutCheckpoint(rawIndex, outIndex, indentStack, self.patterns.saveState(),
+                                self.lastToken, self.tokenCount)
+
+    @staticmethod
+    def fromCheckpoint(checkpoint):
+        analyzer = LayoutAnalyzer()
+        analyzer.indentStack = [IndentLevel(tabs, spaces)
+                                for tabs, spaces in checkpoint.indentStack]
+        analyzer.patterns.restoreState(checkpoint.patternState)
+        analyzer.lastToken = checkpoint.lastToken
+        analyzer.tokenCount = checkpoint.tokenCount
+        return analyzer
+
+    def flush(self):
+        tokens = self.pending
+        self.pending = []
+        return tokens
+
+    def emit(self, token):
+        self.pending.append(token)
+        self.lastToken = token
+        self.tokenCount += 1
+
+    def lastText(self):
+        return self.lastToken.text if self.lastToken is not None else None
+
+    def dedent(self, indent, text, loc):
+        while indent < self.indentStack[-1]:
+            self.indentStack.pop()
+            self.patterns.pop()
+            if self.lastText() != ";":
+                self.emit(Token(";", INTERNAL, loc))
+            if indent < self.indentStack[-1] or text != "}":
+                self.emit(Token("}", INTERNAL, loc))
+
+    def next(self, token):
+        if self.state is self.BEGIN:
             if token.tag is SPACE:
                 m = re.match("^(\t*)( *)$", token.text)
                 if m:
-                    indent = IndentLevel(len(m.group(1)), len(m.group(2)))
-                    state = PRENORMAL
-                    continue
+                    self.indent = IndentLevel(len(m.group(1)), len(m.group(2)))
+                    self.state = self.PRENORMAL
+                    return
                 else:
                     raise LayoutException(token.location, "mixed tabs and spaces used for indentation")
             elif token.tag in [NEWLINE, COMMENT]:
-                continue   # Blank line
+                return   # Blank line
             elif token.isPrintable():
-                indent = IndentLevel(0, 0)
-                state = PRENORMAL
+                self.indent = IndentLevel(0, 0)
+                self.state = self.PRENORMAL
                 # fall through
 
-        if state is PRENORMAL:
+        if self.state is self.PRENORMAL:
             assert token.tag is not SPACE
             if token.tag is COMMENT:
-                continue   # next should be newline
+                return   # next should be newline
             elif token.tag is NEWLINE:
-                state = BEGIN   # turned out to be a blank line
-                continue
+                self.state = self.BEGIN   # turned out to be a blank line
+                return
             else:
                 assert token.isPrintable()
-                if indent < indentStack[-1]:
-                    dedent(indent, token.text, token.location)
-                    if tokensOut[-1].text != ";" and token.text not in ["else", "catch", "finally"]:
-                        tokensOut.append(Token(";", INTERNAL, token.location))
-                elif indent == indentStack[-1]:
-                    if len(tokensOut) > 1 and \
-                       tokensOut[-1].text != ";" and \
-                       (token.text != "{" or not patterns.match()):
-                        tokensOut.append(Token(";", INTERNAL, token.location))
-                        patterns.reset()
+                indent = self.indent
+                if indent < self.indentStack[-1]:
+                    self.dedent(indent, token.text, token.location)
+                    if self.lastText() != ";" and token.text not in ["else", "catch", "finally"]:
+                        self.emit(Token(";", INTERNAL, token.location))
+                elif indent == self.indentStack[-1]:
+                    if self.tokenCount > 1 and \
+                       self.lastText() != ";" and \
+                       (token.text != "{" or not self.patterns.match()):
+                        self.emit(Token(";", INTERNAL, token.location))
+                        self.patterns.reset()
                 else:
-                    assert indent > indentStack[-1]
-                    if patterns.match() or (len(tokensOut) > 0 and tokensOut[-1].text == "{"):
-                        if tokensOut[-1].text != "{":
-                            tokensOut.append(Token("{", INTERNAL, token.location))
-                            patterns.reset()
-                        patterns.push()
-                        indentStack.append(indent)
+                    assert indent > self.indentStack[-1]
+                    if self.patterns.match() or self.lastText() == "{":
+                        if self.lastText() != "{":
+                            self.emit(Token("{", INTERNAL, token.location))
+                            self.patterns.reset()
+                        self.patterns.push()
+                        self.indentStack.append(indent)
                     else:
                         # this is a continuation of a previous line
                         pass
 
-                state = NORMAL
+                self.state = self.NORMAL
                 # fall through
 
-        if state is NORMAL:
+        if self.state is self.NORMAL:
             if token.tag is NEWLINE:
-                state = BEGIN
+                self.state = self.BEGIN
             elif not token.isPrintable():
                 # discard stuff that doesn't matter
                 pass
             else:
                 assert token.isPrintable()
-                patterns.next(token)
-                tokensOut.append(token)
+                self.patterns.next(token)
+                self.emit(token)
+
+    def finish(self):
+        if self.tokenCount > 0 and self.lastText() != ";":
+            self.emit(Token(";", INTERNAL, self.lastToken.location))
+        if len(self.indentStack) > 1:
+            self.dedent(self.indentStack[0], None, self.lastToken.location)
+        if self.tokenCount > 0 and self.lastText() != ";":
+            self.emit(Token(";", INTERNAL, self.lastToken.location))
+
+
+class LayoutCheckpoint(object):
+    """The state of a LayoutAnalyzer before the first token of a line with no indentation.
+
+    rawIndex is the index of that token in the raw token list, and outIndex is the number of
+    layout tokens produced before it."""
+
+    def __init__(self, rawIndex, outIndex, indentStack, patternState, lastToken, tokenCount):
+        self.rawIndex = rawIndex
+        self.outIndex = outIndex
+        self.indentStack = indentStack
+        self.patternState = patternState
+        self.lastToken = lastToken
+        self.tokenCount = tokenCount
+
+    def isEquivalent(self, other):
+        """Returns whether analyzers in both states would produce the same output.
+
+        Only the text of the last token matters, since the location of the next token is used
+        for anything inserted. Only whether fewer than two tokens were produced matters."""
+        return self.indentStack == other.indentStack and \
+               self.patternState == other.patternState and \
+               self.lastText() == other.lastText() and \
+               min(self.tokenCount, 2) == min(other.tokenCount, 2)
+
+    def lastText(self):
+        return self.lastToken.text if self.lastToken is not None else None
+
+    def moved(self, rawDelta, outDelta):
+        return LayoutCheckpoint(self.rawIndex + rawDelta, self.outIndex + outDelta,
+                                self.indentStack, self.patternState,
+                                self.lastToken, self.tokenCount)
 
-    if len(tokensOut) > 0 and tokensOut[-1].text != ";":
-        tokensOut.append(Token(";", INTERNAL, tokensOut[-1].location))
-    if len(indentStack) > 1:
-        dedent(indentStack[0], None, tokensOut[-1].location)
-    if len(tokensOut) > 0 and tokensOut[-1].text != ";":
-        tokensOut.append(Token(";", INTERNAL, tokensOut[-1].location))
-
-    return tokensOut
+    def __repr__(self):
+        return "LayoutCheckpoint(%d, %d)" % (self.rawIndex, self.outIndex)
 
 
 class IndentLevel(object):
@@ -187,6 +370,13 @@ class PatternMatcher(object):
         self.pos = 0
         self.delimiters = []
 
+    def saveState(self):
+        return (self.pos, tuple(self.delimiters))
+
+    def restoreState(self, state):
+        self.pos = state[0]
+        self.delimiters = list(state[1])
+
     def next(self, token):
         if self.pos == len(self.pattern):
             self.pos = 0
@@ -232,6 +422,17 @@ class PatternManager(object):
     def pop(self):
         self.stack.pop()
 
+    def saveState(self):
+        return tuple(tuple(matcher.saveState() for matcher in matchers)
+                     for matchers in self.stack)
+
+    def restoreState(self, state):
+        self.stack = []
+        for matcherStates in state:
+            self.push()
+            for matcher, matcherState in zip(self.stack[-1], matcherStates):
+                matcher.restoreState(matcherState)
+
     def next(self, token):
         for matcher in self.stack[-1]:
             matcher.next(token)
@@ -4,6 +4,7 @@
 # the GPL license that can be found in the LICENSE.txt file.
 
 
+import bisect
 import re
 
 from token import *
@@ -85,6 +86,49 @@ __expressions = [
 __expressions = [(re.compile(expr[0]), expr[1]) for expr in __expressions]
 
 
+# The master regex engine matches all tokens with a single combined regular expression instead
+# of trying every expression above. Python's regex alternation is leftmost-first, not
+# longest-match, so alternatives are ordered such that the first alternative that matches is
+# also the longest match the table above would produce:
+# - comments come before operators, since a comment always extends at least as far as an
+#   operator beginning with "//".
+# - numbers come before operators, since a sign followed by a number is longer than the sign.
+# - floats come before integers, and hex and binary integers come before decimal integers,
+#   since these only match when they extend past the leading digits.
+# - keywords, attributes, and reserved operators are not matched directly. They are
+#   recognized with a table lookup after a symbol or operator is matched, since a keyword
+#   can only win when it is exactly as long as the symbol or operator.
+__scannerExpressions = [
+  (r"\r?\n", NEWLINE),
+  (r"[\t ]+", SPACE),
+  (r"//[^\r\n]*", COMMENT),
+
+  (r"[+-]?[0-9]+\.[0-9]*(?:[Ee][+-]?[0-9]+)?(?:f[0-9]+)?", FLOAT),
+  (r"[+-]?\.[0-9]+(?:[Ee][+-]?[0-9]+)?(?:f[0-9]+)?", FLOAT),
+  (r"[+-]?[0-9]+[Ee][+-]?[0-9]+(?:f[0-9]+)?", FLOAT),
+  (r"[+-]?[0-9]+f[0-9]+", FLOAT),
+
+  (r"[+-]?0[xX][0-9A-Fa-f]+(?:i[0-9]+)?", INTEGER),
+  (r"[+-]?0[bB][01]+(?:i[0-9]+)?", INTEGER),
+  (r"[+-]?[0-9]+(?:i[0-9]+)?", INTEGER),
+
+  (r'"(?:\\"|[^"])*"', STRING),
+
+  (r"[!#%&*+\-/:<=>?@\\^|~]+", OPERATOR),
+  (r"[A-Za-z_][A-Za-z0-9_-]*", SYMBOL),
+  (r"[\[\](){}.,;]", RESERVED),
+]
+__scanner = re.compile("|".join("(%s)" % expr for expr, _ in __scannerExpressions))
+__scannerTags = [tag for _, tag in __scannerExpressions]
+
+# Keywords and reserved operators are the literal expressions in the main table which would
+# also be matched as a symbol or operator.
+__keywords = {}
+for _rx, _tag in __expressions:
+    if re.match(r"(?:[A-Za-z_][A-Za-z0-9_-]*|%s+)$" % __opchars, _rx.pattern):
+        __keywords[_rx.pattern] = _tag
+
+
 class LexException(Exception):
     def __init__(self, location, char):
         self.location = location
@@ -94,11 +138,115 @@ class LexException(Exception):
         return "%s: error: Illegal character: '%s'" % (self.location, self.char)
 
 
-def lex(filename, source):
-    tokens = []
-    pos = 0
+# Engines which may be passed to lex. Both produce identical tokens and errors.
+LONGEST_MATCH_ENGINE = "longest-match"
+MASTER_REGEX_ENGINE = "master-regex"
+
+def lex(filename, source, engine=MASTER_REGEX_ENGINE):
+    return list(iterLex(filename, source, engine))
+
+
+def iterLex(filename, source, engine=MASTER_REGEX_ENGINE):
+    """Returns a generator which yields tokens lazily as the source is scanned.
+
+    LexException is raised when the illegal character is reached, not when this is called."""
+    return _engineFunction(engine)(filename, source)
+
+
+def _engineFunction(engine):
+    if engine == LONGEST_MATCH_ENGINE:
+        return _lexLongestMatch
+    elif engine == MASTER_REGEX_ENGINE:
+        return _lexMasterRegex
+    else:
+        raise ValueError("unknown lexer engine: %s" % engine)
+
+
+def relex(filename, oldSource, oldTokens, source, start, oldEnd, newEnd,
+          engine=MASTER_REGEX_ENGINE):
+    """Updates a token list after an edit. Returns the new token list and a TokenSplice.
+
+    oldTokens must be the output of lex for oldSource. In source, [start, newEnd) replaced
+    [start, oldEnd) of oldSource. Lexing restarts at the beginning of the line containing
+    start, since tokens before the edit may depend on a few characters after it. It stops at
+    the first token boundary after the edit which was also a boundary before the edit; old
+    tokens are reused from there, since lexing a token only depends on the text after its
+    beginning.
+
+    Line numbers count NEWLINE tokens, so if a string before the edit contains a newline,
+    lines in oldTokens don't match lines in oldSource. The whole source is lexed in that
+    case."""
+    lexEngine = _engineFunction(engine)
+    delta = newEnd - oldEnd
+    lineStart = source.rfind("\n", 0, start) + 1
+    line = source.count("\n", 0, lineStart) + 1
+    first = bisect.bisect_left(_TokenLines(oldTokens), line)
+    if lineStart == 0 or not _linesMatchSource(oldSource, oldTokens):
+        lineStart = 0
+        line = 1
+        first = 0
+
+    newTokens = lexEngine(filename, source, lineStart, line)
+
+    relexed = []
+    oldStop = first
+    oldPos = lineStart
+    pos = lineStart
+    column = 1
+    shift = None
+    for token in newTokens:
+        if pos >= newEnd:
+            while oldPos < pos - delta and oldStop < len(oldTokens):
+                oldPos += len(oldTokens[oldStop].text)
+                oldStop += 1
+            if oldPos == pos - delta and oldStop < len(oldTokens):
+                oldLoc = oldTokens[oldStop].location
+                shift = LocationShift(oldLoc.beginLine, oldLoc.beginColumn,
+                                      line - oldLoc.beginLine, column - oldLoc.beginColumn)
+                break
+        relexed.append(token)
+        pos += len(token.text)
+        if token.tag is NEWLINE:
+            line += 1
+            column = 1
+        else:
+            column += len(token.text)
+
+    if shift is None:
+        oldStop = len(oldTokens)
+        shift = LocationShift(line, column, 0, 0)
+    tokens = oldTokens[:first]
+    tokens.extend(relexed)
+    tokens.extend(shift.shiftTokens(oldTokens[oldStop:]))
+    return tokens, TokenSplice(first, oldStop, first + len(relexed), shift)
+
+
+def _linesMatchSource(source, tokens):
+    """Returns whether every newline in source was lexed as a NEWLINE token."""
+    if not tokens:
+        return True
+    last = tokens[-1]
+    newlineCount = last.location.beginLine - 1
+    if last.tag is NEWLINE:
+        newlineCount += 1
+    return newlineCount == source.count("\n")
+
+
+class _TokenLines(object):
+    """A sequence of the beginning line numbers of tokens, for bisect."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __getitem__(self, index):
+        return self.tokens[index].location.beginLine
+
+
+def _lexLongestMatch(filename, source, pos=0, line=1):
     end = len(source)
-    line = 1
     column = 1
     while pos < end:
         token = None
@@ -115,7 +263,7 @@ def lex(filename, source):
         if not token:
             location = Location(filename, line, column, line, column + 1)
             raise LexException(location, source[pos:pos+1])
-        tokens.append(token)
+        yield token
         if token.tag is NEWLINE:
             line += 1
             column = 1
@@ -123,4 +271,24 @@ def lex(filename, source):
             column += len(token.text)
         pos += len(token.text)
 
-    return tokens
+
+def _lexMasterRegex(filename, source, pos=0, line=1):
+    end = len(source)
+    column = 1
+    while pos < end:
+        m = __scanner.match(source, pos)
+        if not m:
+            location = Location(filename, line, column, line, column + 1)
+            raise LexException(location, source[pos:pos+1])
+        text = m.group(0)
+        tag = __scannerTags[m.lastindex - 1]
+        if tag is SYMBOL or tag is OPERATOR:
+            tag = __keywords.get(text, tag)
+        location = Location(filename, line, column, line, column + len(text))
+        yield Token(text, tag, location)
+        if tag is NEWLINE:
+            line += 1
+            column = 1
+        else:
+            column += len(text)
+        pos = m.end()
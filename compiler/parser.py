@@ -4,7 +4,9 @@
 # the GPL license that can be found in the LICENSE.txt file.
 
 
+import bisect
 import re
+import threading
 
 from ast import *
 from combinators import *
@@ -13,8 +15,15 @@ from utils import *
 
 
 # Main function
-def parse(filename, tokens):
-    reader = Reader(filename, tokens)
+def parse(filename, tokens, memo=None):
+    """Parses a module from a list or stream of layout tokens.
+
+    If a MemoTable is given, nonterminals referenced through Lazy are memoized (packrat
+    parsing). The table's hit and miss counters may be inspected afterward."""
+    if isinstance(tokens, list):
+        reader = Reader(filename, tokens, memo=memo)
+    else:
+        reader = StreamReader(filename, TokenWindow(tokens), memo=memo)
     parser = module()
     result = parser(reader)
     if not result:
@@ -33,37 +42,168 @@ class ParseException(Exception):
         return "%s: error: %s\n" % (self.location, self.message)
 
 
+# Incremental parsing
+#
+# Every top-level definition ends with a semicolon, and the definition parser does not look
+# past it, so the AST of a definition only depends on the tags and text of its own tokens
+# (nodes don't record locations). When a file is edited, definitions whose tokens did not change
+# may be reused from the previous parse instead of being parsed again.
+class ModuleParse(object):
+    """The result of parseDefinitions or reparse.
+
+    ast is the AstModule, and tokens is the list of layout tokens it was parsed from. spans
+    contains a (begin, end) pair of token indices for each top-level definition. nextId is the
+    lowest node id not used in ast."""
+
+    def __init__(self, ast, tokens, spans, nextId):
+        self.ast = ast
+        self.tokens = tokens
+        self.spans = spans
+        self.nextId = nextId
+
+
+def parseDefinitions(filename, tokens):
+    """Parses a module from a list of layout tokens, remembering where each definition is.
+
+    The AST and its ids are the same as the ones produced by parse. The returned ModuleParse
+    may be passed to reparse after the file is edited."""
+    emptyModule = AstModule([])
+    emptyModule.id = 0
+    return reparse(filename, tokens, ModuleParse(emptyModule, [], [], 1))
+
+
+def reparse(filename, tokens, previous):
+    """Parses a module again after an edit, reusing definitions whose tokens did not change.
+
+    previous is the ModuleParse for the file before the edit, and tokens is the new list of
+    layout tokens. Reused definitions keep their AST nodes and ids, so information recorded
+    about them by id stays valid. Nodes which are parsed again get new ids starting at
+    previous.nextId, so an id is never given to two different nodes. If the new tokens don't
+    parse, ParseException is raised with the same error parse would report."""
+    oldTokens = previous.tokens
+    limit = min(len(oldTokens), len(tokens))
+    first = 0
+    while first < limit and _isSameToken(oldTokens[first], tokens[first]):
+        first += 1
+    common = 0
+    while common < limit - first and \
+          _isSameToken(oldTokens[-1 - common], tokens[-1 - common]):
+        common += 1
+    oldStop = len(oldTokens) - common
+    newStop = len(tokens) - common
+    delta = newStop - oldStop
+
+    oldDefinitions = previous.ast.definitions
+    oldStarts = [begin for begin, _ in previous.spans]
+    keep = bisect.bisect_right([end for _, end in previous.spans], first)
+    definitions = oldDefinitions[:keep]
+    spans = previous.spans[:keep]
+    counter = Counter(previous.nextId)
+
+    parser = definition()
+    reader = Reader(filename, tokens, spans[-1][1] if spans else 0)
+    while not reader.isEmpty():
+        pos = reader.pos
+        if pos >= newStop:
+            # Everything from here to the end is unchanged. If a definition started at the
+            # same place before the edit, the rest of the old module can be reused.
+            index = bisect.bisect_left(oldStarts, pos - delta)
+            if index < len(oldStarts) and oldStarts[index] == pos - delta:
+                definitions.extend(oldDefinitions[index:])
+                spans.extend((begin + delta, end + delta)
+                             for begin, end in previous.spans[index:])
+                break
+        result = parser(reader)
+        if not result:
+            # Any definition which fails here would also fail in a full parse, which reports
+            # the error with the same location and message as usual.
+            parse(filename, tokens)
+            assert False, "definition did not parse, but module did"
+        addNodeIds(result.value, counter)
+        definitions.append(result.value)
+        spans.append((pos, result.next.pos))
+        reader = result.next
+
+    ast = AstModule(definitions)
+    ast.id = previous.ast.id
+    return ModuleParse(ast, tokens, spans, counter.value())
+
+
+def _isSameToken(a, b):
+    return a.tag == b.tag and a.text == b.text
+
+
+# Grammar cache
+#
+# Each nonterminal below is a function which builds a parser. Building the whole graph takes
+# much longer than parsing a small file, so functions decorated with grammarRule build their
+# parser once per process and return the same object afterward. This also means every
+# Lazy(expression) in the graph resolves to the same parser, so the graph is finite.
+#
+# Parsers hold no state between calls (Lazy only caches the parser returned by its function,
+# which is always the same object), so the cached graph may be shared across files and
+# threads. The lock only guards construction.
+_grammarCache = {}
+_grammarLock = threading.RLock()
+
+def grammarRule(fn):
+    def getParser():
+        parser = _grammarCache.get(fn)
+        if parser is None:
+            with _grammarLock:
+                parser = _grammarCache.get(fn)
+                if parser is None:
+                    parser = fn()
+                    _grammarCache[fn] = parser
+        return parser
+    getParser.__name__ = fn.__name__
+    getParser.__doc__ = fn.__doc__
+    return getParser
+
+
+def clearGrammarCache():
+    """Discards all cached parsers. The next parse will build the grammar again."""
+    with _grammarLock:
+        _grammarCache.clear()
+
+
 # Top level
+@grammarRule
 def module():
     def process(parsed):
         return AstModule(parsed)
-    return Phrase(Rep(definition())) ^ process
+    return Phrase(Rep(Release(definition()))) ^ process
 
 
 # Definitions
+@grammarRule
 def definition():
     return varDefn() | functionDefn() | classDefn()
 
 
+@grammarRule
 def attribs():
     return Rep(attrib())
 
 
+@grammarRule
 def attrib():
     return Tag(ATTRIB) ^ AstAttribute
 
 
+@grammarRule
 def varDefn():
     def process(parsed):
-        [ats, _, pat, expr, _] = untangle(parsed)
+        (ats, _, (pat, expr, _)) = parsed
         return AstVariableDefinition(ats, pat, expr)
     exprOpt = Opt(keyword("=") + expression() ^ (lambda p: p[1]))
     return attribs() + keyword("var") + Commit(pattern() + exprOpt + semi) ^ process
 
 
+@grammarRule
 def functionDefn():
     def process(parsed):
-        [ats, _, name, tps, ps, rty, body, _] = untangle(parsed)
+        (ats, _, (name, tps, ps, rty, body, _)) = parsed
         return AstFunctionDefinition(ats, name, tps, ps, rty, body)
     functionName = keyword("this") | symbol
     bodyOpt = Opt(keyword("=") + expression() ^ (lambda p: p[1]))
@@ -71,9 +211,10 @@ def functionDefn():
         tyOpt() + bodyOpt + semi) ^ process
 
 
+@grammarRule
 def classDefn():
     def process(parsed):
-        [ats, _, name, tps, ctor, stys, ms, _] = untangle(parsed)
+        (ats, _, (name, tps, ctor, stys, ms, _)) = parsed
         return AstClassDefinition(ats, name, tps, ctor, stys, ms)
     classBodyOpt = Opt(layoutBlock(Rep(Lazy(definition)))) ^ \
                    (lambda p: p if p is not None else [])
@@ -81,53 +222,61 @@ def classDefn():
            Opt(constructor()) + supertypes() + classBodyOpt + semi) ^ process
 
 
+@grammarRule
 def constructor():
     def process(parsed):
-        [ats, _, params, _] = untangle(parsed)
+        (ats, _, (params, _)) = parsed
         return AstPrimaryConstructorDefinition(ats, params)
     return attribs() + keyword("(") + \
            Commit(RepSep(parameter(), keyword(",")) + keyword(")")) ^ process
 
 
+@grammarRule
 def supertypes():
     def process(parsed):
-        return untangle(parsed)[1] if parsed else []
+        return parsed[1] if parsed else []
     return Opt(keyword("<:") + Rep1Sep(classType(), keyword(","))) ^ process
 
 
+@grammarRule
 def typeParameters():
     def process(parsed):
-        return untangle(parsed)[1] if parsed else []
+        return parsed[1] if parsed else []
     return Opt(keyword("[") + Rep1Sep(typeParameter(), keyword(",")) + keyword("]")) ^ process
 
 
+@grammarRule
 def typeParameter():
     def process(parsed):
-        (((ats, name), upper), lower) = parsed
+        (ats, name, upper, lower) = parsed
         upper = upper[1] if upper else None
         lower = lower[1] if lower else None
         return AstTypeParameter(ats, name, upper, lower)
     return attribs() + symbol + Opt(keyword("<:") + ty()) + Opt(keyword(">:") + ty()) ^ process
 
 
+@grammarRule
 def parameters():
     def process(parsed):
-        return untangle(parsed)[1] if parsed else []
+        return parsed[1] if parsed else []
     return Opt(keyword("(") + Rep1Sep(parameter(), keyword(",")) + keyword(")")) ^ process
 
 
+@grammarRule
 def parameter():
     def process(parsed):
-        [ats, pat] = untangle(parsed)
+        (ats, pat) = parsed
         return AstParameter(ats, pat)
     return attribs() + pattern() ^ process
 
 
 # Patterns
+@grammarRule
 def pattern():
     return varPattern()
 
 
+@grammarRule
 def varPattern():
     def process(parsed):
         (name, parsedTy) = parsed
@@ -137,14 +286,17 @@ def varPattern():
 
 
 # Types
+@grammarRule
 def ty():
     return simpleType() | classType()
 
 
+@grammarRule
 def tyOpt():
     return Opt(keyword(":") + ty() ^ (lambda p: p[1]))
 
 
+@grammarRule
 def simpleType():
     return (keyword("unit") ^ (lambda p: AstUnitType())) | \
            (keyword("i8") ^ (lambda p: AstI8Type())) | \
@@ -156,22 +308,25 @@ def simpleType():
            (keyword("boolean") ^ (lambda p: AstBooleanType()))
 
 
+@grammarRule
 def classType():
     def process(parsed):
-        name, typeArgs, nullFlag = untangle(parsed)
+        (name, typeArgs, nullFlag) = parsed
         typeArgs = [] if typeArgs is None else typeArgs
         flags = set([nullFlag]) if nullFlag else set()
         return AstClassType(name, typeArgs, flags)
     return symbol + typeArguments() + Opt(Reserved(OPERATOR, "?")) ^ process
 
 
+@grammarRule
 def typeArguments():
     def process(parsed):
-        return untangle(parsed)[1] if parsed else None
+        return parsed[1] if parsed else None
     return Opt(keyword("[") + Rep1Sep(Lazy(ty), keyword(",")) + keyword("]")) ^ process
 
 
 # Expressions
+@grammarRule
 def expression():
     def combine(left, right):
         return AstAssignExpression(left, right)
@@ -179,6 +334,7 @@ def expression():
     return LeftRec(maybeBinopExpr(), rhs, combine)
 
 
+@grammarRule
 def maybeBinopExpr():
     binopLevels = [[],   # other
                    ["*", "/", "%"],
@@ -256,18 +412,20 @@ def maybeBinopExpr():
     return parser
 
 
+@grammarRule
 def maybeCallExpr():
     return LeftRec(receiverExpr(), callSuffix(), processCall)
 
+@grammarRule
 def callSuffix():
     methodNameOpt = Opt(keyword(".") + symbol ^ (lambda p: p[1]))
     argumentsOpt = Opt(keyword("(") + RepSep(Lazy(expression), keyword(",")) + keyword(")")) ^ \
-        (lambda p: untangle(p)[1] if p else None)
+        (lambda p: p[1] if p else None)
     getMethodOpt = Opt(keyword("_")) ^ (lambda p: bool(p))
     return methodNameOpt + typeArguments() + argumentsOpt + getMethodOpt
 
 def processCall(receiver, parsed):
-    [methodName, typeArguments, arguments, isGetMethod] = untangle(parsed)
+    (methodName, typeArguments, arguments, isGetMethod) = parsed
     if isGetMethod:
         if methodName is None or \
            typeArguments is not None or \
@@ -292,6 +450,7 @@ def processCall(receiver, parsed):
         return FailValue("not a call")
 
 
+@grammarRule
 def receiverExpr():
     return unaryExpr() | \
            literalExpr() | \
@@ -312,33 +471,40 @@ def receiverExpr():
            returnExpr()
 
 
+@grammarRule
 def literalExpr():
     return literal() ^ (lambda p: AstLiteralExpression(p))
 
 
+@grammarRule
 def varExpr():
     return symbol ^ AstVariableExpression
 
 
+@grammarRule
 def thisExpr():
     return keyword("this") ^ (lambda p: AstThisExpression())
 
 
+@grammarRule
 def superExpr():
     return keyword("super") ^ (lambda p: AstSuperExpression())
 
 
+@grammarRule
 def groupExpr():
     def process(parsed):
-        [_, e, _] = untangle(parsed)
+        (_, e, _) = parsed
         return e
     return keyword("(") + Lazy(expression) + keyword(")") ^ process
 
 
+@grammarRule
 def blockExpr():
     return layoutBlock(Rep(Lazy(statement)) ^ (lambda stmts: AstBlockExpression(stmts)))
 
 
+@grammarRule
 def unaryExpr():
     def process(parsed):
         (op, e) = parsed
@@ -347,54 +513,62 @@ def unaryExpr():
     return op + Commit(Lazy(expression)) ^ process
 
 
+@grammarRule
 def ifExpr():
     def process(parsed):
-        [_, _, c, _, t, f] = untangle(parsed)
+        (_, (_, c, _, t, f)) = parsed
         return AstIfExpression(c, t, f)
     elseClause = Opt(keyword("else") + Commit(Lazy(expression))) ^ (lambda p: p[1] if p else None)
     return keyword("if") + Commit(keyword("(") + Lazy(expression) + keyword(")") + \
         Lazy(expression) + elseClause) ^ process
 
 
+@grammarRule
 def whileExpr():
     def process(parsed):
-        [_, _, c, _, b] = untangle(parsed)
+        (_, (_, c, _, b)) = parsed
         return AstWhileExpression(c, b)
     return keyword("while") + Commit(keyword("(") + Lazy(expression) + keyword(")") + \
         Lazy(expression)) ^ process
 
 
+@grammarRule
 def breakExpr():
     return keyword("break") ^ (lambda p: AstBreakExpression())
 
 
+@grammarRule
 def continueExpr():
     return keyword("continue") ^ (lambda p: AstContinueExpression())
 
 
+@grammarRule
 def partialFnExpr():
     def process(cases):
         return AstPartialFunctionExpression(cases)
     return layoutBlock(Rep1(partialFunctionCase()) ^ process)
 
 
+@grammarRule
 def partialFunctionCase():
     def process(parsed):
-        [_, p, c, _, e, _] = untangle(parsed)
+        (_, (p, c, _, e, _)) = parsed
         return AstPartialFunctionCase(p, c, e)
     conditionOpt = Opt(keyword("if") + Lazy(expression)) ^ (lambda p: p[1] if p else None)
     return keyword("case") + Commit(pattern() + conditionOpt + keyword("=>") + \
         Lazy(expression) + semi) ^ process
 
 
+@grammarRule
 def matchExpr():
     def process(parsed):
-        [_, _, e, _, m] = untangle(parsed)
+        (_, (_, e, _, m)) = parsed
         return AstMatchExpression(e, m)
     return keyword("match") + Commit(keyword("(") + Lazy(expression) + keyword(")") + \
         partialFnExpr()) ^ process
 
 
+@grammarRule
 def throwExpr():
     def process(parsed):
         (_, x) = parsed
@@ -402,9 +576,10 @@ def throwExpr():
     return keyword("throw") + Commit(Lazy(expression)) ^ process
 
 
+@grammarRule
 def tryCatchExpr():
     def process(parsed):
-        [_, e, c, f] = untangle(parsed)
+        (_, (e, c, f)) = parsed
         if c is None and f is None:
             return FailValue("expected 'catch' or 'finally' in 'try'-expression")
         else:
@@ -414,9 +589,10 @@ def tryCatchExpr():
     return keyword("try") + Commit(Lazy(expression) + catchHandler() + finallyOpt) ^ process
 
 
+@grammarRule
 def catchHandler():
     def processSimple(parsed):
-        [_, p, _, e] = untangle(parsed)
+        (_, (p, _, e)) = parsed
         return AstPartialFunctionExpression([AstPartialFunctionCase(p, None, e)])
     simpleHandler = keyword("(") + Commit(pattern() + keyword(")") + \
                     Lazy(expression)) ^ processSimple
@@ -428,14 +604,16 @@ def catchHandler():
     return Opt(keyword("catch") + Commit(simpleHandler | matchHandler) ^ process)
 
 
+@grammarRule
 def lambdaExpr():
     def process(parsed):
-        [_, n, tps, _, ps, _, b] = untangle(parsed)
+        (_, (n, tps, _, ps, _, b)) = parsed
         return AstLambdaExpression(n, tps, ps, b)
     return keyword("lambda") + Commit(Opt(symbol) + typeParameters() + keyword("(") + \
         RepSep(pattern(), keyword(",")) + keyword(")") + Lazy(expression)) ^ process
 
 
+@grammarRule
 def returnExpr():
     def process(parsed):
         (_, e) = parsed
@@ -443,15 +621,18 @@ def returnExpr():
     return keyword("return") + Opt(Lazy(expression)) ^ process
 
 
+@grammarRule
 def statement():
     return definition() | ((expression() + semi) ^ (lambda parsed: parsed[0]))
 
 
 # Literals
+@grammarRule
 def literal():
     return intLiteral() | floatLiteral() | booleanLiteral() | nullLiteral() | stringLiteral()
 
 
+@grammarRule
 def intLiteral():
     def process(t):
         m = re.match("([+-]?)(0[BbXx])?([0-9A-Fa-f]+)(?:i([0-9]+))?", t)
@@ -478,6 +659,7 @@ def intLiteral():
     return Tag(INTEGER) ^ process
 
 
+@grammarRule
 def floatLiteral():
     def process(t):
         m = re.match("([^f]*)(?:f([0-9]+))?", t)
@@ -488,15 +670,18 @@ def floatLiteral():
     return Tag(FLOAT) ^ process
 
 
+@grammarRule
 def booleanLiteral():
     return (keyword("true") ^ (lambda p: AstBooleanLiteral(True))) | \
            (keyword("false") ^ (lambda p: AstBooleanLiteral(False)))
 
 
+@grammarRule
 def nullLiteral():
     return keyword("null") ^ (lambda p: AstNullLiteral())
 
 
+@grammarRule
 def stringLiteral():
     def process(t):
         value = tryDecodeString(t)
@@ -512,7 +697,7 @@ def keyword(kw):
 
 def layoutBlock(contents):
     def process(parsed):
-        [_, ast, _] = untangle(parsed)
+        (_, ast, _) = parsed
         return ast
     return ((keyword("{") + contents + keyword("}")) |
             (Reserved(INTERNAL, "{") + contents + Reserved(INTERNAL, "}"))) ^ process
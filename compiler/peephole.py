@@ -0,0 +1,271 @@
+# Copyright 2014, Jay Conrod. All rights reserved.
+#
+# This file is part of Gypsum. Use of this source code is governed by
+# the GPL license that can be found in the LICENSE.txt file.
+
+
+# Peephole optimizations for compiled functions.
+#
+# CompileVisitor generates simple stack code: values compiled for effect are pushed and then
+# dropped, conditions are negated before branching, and blocks often do nothing but branch
+# to another block. The rules here clean up those patterns after a function's blocks have
+# been ordered. Each rule has a name, so rules can be turned on and off individually and
+# the number of times each one was applied can be counted.
+#
+# Rules which look at neighboring instructions:
+#   pushDrop: a value is pushed without side effects and then dropped. Both are removed.
+#   loadStore: a local is loaded and stored back into itself. Both are removed.
+#   swapSwap: two swaps cancel out. Both are removed.
+#   notBranch: a condition is negated before branchif. The targets are swapped instead.
+#   constantBranch: branchif on true or false becomes a branch.
+#   constantFold: a primitive operator applied to literals is replaced with a literal of the
+#     result. See constant_folding.py for how results are computed.
+#   constantPropagation: a local loaded after a literal was stored in it earlier in the same
+#     block is replaced with the literal.
+# Rules which change the control flow graph:
+#   threadBranch: branches to a block which only branches again go to its target instead.
+#   mergeBlocks: a block which ends with a branch to a block with no other predecessors is
+#     merged with that block.
+
+
+from bytecode import instInfoByName
+import constant_folding
+import ir_instructions
+
+
+PUSH_DROP = "pushDrop"
+LOAD_STORE = "loadStore"
+SWAP_SWAP = "swapSwap"
+NOT_BRANCH = "notBranch"
+CONSTANT_BRANCH = "constantBranch"
+CONSTANT_FOLD = "constantFold"
+CONSTANT_PROPAGATION = "constantPropagation"
+THREAD_BRANCH = "threadBranch"
+MERGE_BLOCKS = "mergeBlocks"
+
+RULES = (PUSH_DROP, LOAD_STORE, SWAP_SWAP, NOT_BRANCH, CONSTANT_BRANCH, CONSTANT_FOLD,
+         CONSTANT_PROPAGATION, THREAD_BRANCH, MERGE_BLOCKS)
+
+
+def parseRules(text):
+    """Parses a comma-separated list of rule names. "all" and "none" may also be given.
+
+    Returns a frozenset of rule names. Raises ValueError if a name isn't recognized."""
+    names = [name.strip() for name in text.split(",") if name.strip() != ""]
+    rules = set()
+    for name in names:
+        if name == "all":
+            rules.update(RULES)
+        elif name == "none":
+            pass
+        elif name in RULES:
+            rules.add(name)
+        else:
+            raise ValueError("unknown peephole rule: %s" % name)
+    return frozenset(rules)
+
+
+def optimize(function, rules=RULES, counts=None):
+    """Applies peephole rules to the blocks of a function until none of them apply.
+
+    Blocks which become unreachable are removed, and the rest are renumbered without being
+    reordered. If counts is given, it should be a dict; the number of times each rule was
+    applied is added to it."""
+    if counts is None:
+        counts = {}
+    changed = True
+    cfgChanged = False
+    while changed:
+        changed = False
+        for block in function.blocks:
+            blockChanged, successorsChanged = _rewriteBlock(block, rules, counts)
+            changed |= blockChanged
+            cfgChanged |= successorsChanged
+        if cfgChanged:
+            _removeDeadBlocks(function)
+            cfgChanged = False
+        if THREAD_BRANCH in rules and _threadBranches(function, counts):
+            _removeDeadBlocks(function)
+            changed = True
+        if MERGE_BLOCKS in rules and _mergeBlocks(function, counts):
+            _removeDeadBlocks(function)
+            changed = True
+
+
+def _rewriteBlock(block, rules, counts):
+    # Each instruction is combined with the instructions kept so far, as long as a rule
+    # applies, so patterns exposed by an earlier rewrite are found too. Literals stored in
+    # locals are remembered until the end of the block.
+    instructions = []
+    localConstants = {}
+    changed = False
+    successorsChanged = False
+    for inst in block.instructions:
+        while inst is not None:
+            match = _simplify(instructions, inst, rules, localConstants)
+            if match is None:
+                break
+            rule, replacedCount, inst = match
+            del instructions[len(instructions) - replacedCount:]
+            counts[rule] = counts.get(rule, 0) + 1
+            changed = True
+            successorsChanged |= rule == CONSTANT_BRANCH
+        if inst is not None:
+            if inst.opcode() == _STLOCAL:
+                value = instructions[-1] if len(instructions) > 0 else None
+                if value is not None and constant_folding.literalWord(value) is not None:
+                    localConstants[inst.op(0)] = value
+                else:
+                    localConstants.pop(inst.op(0), None)
+            instructions.append(inst)
+    if changed:
+        block.instructions = instructions
+    return changed, successorsChanged
+
+
+def _simplify(instructions, inst, rules, localConstants):
+    """Checks whether a rule applies to an instruction and the instructions kept before it.
+
+    Returns None if no rule applies. Otherwise, returns the rule's name, the number of kept
+    instructions to remove, and an instruction to replace them and inst with, which may be
+    None."""
+    if inst.opcode() == _LDLOCAL and CONSTANT_PROPAGATION in rules:
+        value = localConstants.get(inst.op(0))
+        if value is not None:
+            return CONSTANT_PROPAGATION, 0, type(value)(*value.operands)
+    if CONSTANT_FOLD in rules:
+        operandCount = constant_folding.operandCount(inst)
+        if operandCount is not None and len(instructions) >= operandCount:
+            operands = instructions[len(instructions) - operandCount:]
+            result = constant_folding.fold(inst, operands)
+            if result is not None:
+                return CONSTANT_FOLD, operandCount, result
+    if len(instructions) == 0:
+        return None
+    match = _combine(instructions[-1], inst, rules)
+    if match is None:
+        return None
+    rule, replacement = match
+    return rule, 1, replacement
+
+
+def _combine(prev, inst, rules):
+    """Checks whether a rule applies to a pair of neighboring instructions.
+
+    Returns None if no rule applies. Otherwise, returns the rule's name and an instruction to
+    replace both instructions with, which may be None."""
+    prevOpcode = prev.opcode()
+    opcode = inst.opcode()
+    if opcode == _DROP:
+        if prevOpcode in _PURE_PUSHES and PUSH_DROP in rules:
+            return PUSH_DROP, None
+    elif opcode == _STLOCAL:
+        if prevOpcode == _LDLOCAL and prev.op(0) == inst.op(0) and LOAD_STORE in rules:
+            return LOAD_STORE, None
+    elif opcode == _SWAP:
+        if prevOpcode == _SWAP and SWAP_SWAP in rules:
+            return SWAP_SWAP, None
+    elif opcode == _BRANCHIF:
+        trueId, falseId = inst.successorIds()
+        if prevOpcode == _NOTB and NOT_BRANCH in rules:
+            return NOT_BRANCH, ir_instructions.branchif(falseId, trueId)
+        elif prevOpcode == _TRUE and CONSTANT_BRANCH in rules:
+            return CONSTANT_BRANCH, ir_instructions.branch(trueId)
+        elif prevOpcode == _FALSE and CONSTANT_BRANCH in rules:
+            return CONSTANT_BRANCH, ir_instructions.branch(falseId)
+    return None
+
+
+def _threadBranches(function, counts):
+    blocks = function.blocks
+
+    def isTrivial(block):
+        return len(block.instructions) == 1 and block.instructions[0].opcode() == _BRANCH
+
+    def finalTarget(id):
+        visited = set()
+        while isTrivial(blocks[id]) and id not in visited:
+            visited.add(id)
+            id = blocks[id].instructions[0].op(0)
+        return id
+
+    changed = False
+    for block in blocks:
+        inst = block.instructions[-1]
+        if inst.opcode() not in (_BRANCH, _BRANCHIF):
+            continue
+        successorIds = inst.successorIds()
+        newSuccessorIds = [finalTarget(id) for id in successorIds]
+        threadedCount = sum(1 for a, b in zip(successorIds, newSuccessorIds) if a != b)
+        if threadedCount > 0:
+            inst.setSuccessorIds(newSuccessorIds)
+            counts[THREAD_BRANCH] = counts.get(THREAD_BRANCH, 0) + threadedCount
+            changed = True
+    return changed
+
+
+def _mergeBlocks(function, counts):
+    blocks = function.blocks
+    predecessorCounts = [0] * len(blocks)
+    for block in blocks:
+        for id in block.instructions[-1].successorIds():
+            predecessorCounts[id] += 1
+
+    merged = set()
+    for block in blocks:
+        if block.id in merged:
+            continue
+        while True:
+            inst = block.instructions[-1]
+            if inst.opcode() != _BRANCH:
+                break
+            succId = inst.op(0)
+            if succId == block.id or succId == 0 or predecessorCounts[succId] != 1:
+                break
+            block.instructions = block.instructions[:-1] + blocks[succId].instructions
+            merged.add(succId)
+            counts[MERGE_BLOCKS] = counts.get(MERGE_BLOCKS, 0) + 1
+    return len(merged) > 0
+
+
+def _removeDeadBlocks(function):
+    blocks = function.blocks
+    live = [False] * len(blocks)
+    live[0] = True
+    stack = [0]
+    while len(stack) > 0:
+        id = stack.pop()
+        for succId in blocks[id].instructions[-1].successorIds():
+            if not live[succId]:
+                live[succId] = True
+                stack.append(succId)
+    if all(live):
+        return
+
+    newIds = {}
+    liveBlocks = []
+    for block in blocks:
+        if live[block.id]:
+            newIds[block.id] = len(liveBlocks)
+            liveBlocks.append(block)
+    for block in liveBlocks:
+        block.id = newIds[block.id]
+        inst = block.instructions[-1]
+        inst.setSuccessorIds([newIds[id] for id in inst.successorIds()])
+    function.blocks = liveBlocks
+
+
+_DROP = instInfoByName["drop"].opcode
+_SWAP = instInfoByName["swap"].opcode
+_LDLOCAL = instInfoByName["ldlocal"].opcode
+_STLOCAL = instInfoByName["stlocal"].opcode
+_NOTB = instInfoByName["notb"].opcode
+_TRUE = instInfoByName["true"].opcode
+_FALSE = instInfoByName["false"].opcode
+_BRANCH = instInfoByName["branch"].opcode
+_BRANCHIF = instInfoByName["branchif"].opcode
+
+# Instructions which push one value and have no other effect.
+_PURE_PUSHES = frozenset(instInfoByName[name].opcode for name in
+                         ("dup", "unit", "true", "false", "null", "uninitialized",
+                          "i8", "i16", "i32", "i64", "f32", "f64", "string", "ldlocal"))
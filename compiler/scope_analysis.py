@@ -92,17 +92,14 @@ def analyzeInheritance(info):
     if inheritanceGraph.isCyclic():
         raise ScopeException("inheritance cycle detected")
 
-    # Copy bindings from superclasses to subclasses. This must be done in topological order
-    # to ensure we don't miss anything, i.e., if S <: T, we must ensure all bindings have been
-    # copied to T before copying from T to S. Builtin classes are already flattened, so this
-    # is not necessary for them.
-    def bind(scope, name, defnInfo):
-        if scope.isBound(name) and \
-           not scope.getDefinition(name).isOverloadable(defnInfo):
-            raise ScopeException("%s: conflicts with inherited definition" % name)
-        scope.bind(name, defnInfo)
-        scope.define(name)
-
+    # Make bindings from superclasses available in subclasses. This must be done in
+    # topological order to ensure we don't miss anything, i.e., if S <: T, we must ensure T
+    # inherits from its superclass before S inherits from T. Builtin classes are already
+    # flattened, so this is not necessary for them.
+    #
+    # Names which are only inherited are copied into a subclass scope the first time they
+    # are looked up there (see `Scope.inheritFrom`), so deep hierarchies don't copy every
+    # binding into every class.
     topologicalClassIds = inheritanceGraph.reverseEdges().topologicalSort()
     for classId in topologicalClassIds:
         if isBuiltinId(classId):
@@ -111,11 +108,7 @@ def analyzeInheritance(info):
         scope = info.getScope(classId)
         if classInfo.superclassInfo is None:
             continue
-        superclassScope = info.getScope(classInfo.superclassInfo.irDefn)
-        for name, defnInfo in superclassScope.getBindings():
-            if defnInfo.inheritanceDepth == NOT_HERITABLE:
-                continue
-            bind(scope, name, defnInfo.inherit(scope.scopeId))
+        scope.inheritFrom(info.getScope(classInfo.superclassInfo.irDefn))
 
 
 def convertClosures(info):
@@ -248,6 +241,10 @@ def flattenClasses(info):
 
 NOT_HERITABLE = -1
 
+# Incremented whenever a name is bound in any scope, which invalidates the lookup caches of
+# all scopes.
+_bindingVersion = 0
+
 
 class NameInfo(object):
     def __init__(self, name):
@@ -262,8 +259,18 @@ class NameInfo(object):
         # Only defined after `resolveOverrides` is called and only if `isOverloaded` is true.
         self.overrides = None
 
+        # An index of overloads which may be called, built by `findDefnInfoWithArgTypes` after
+        # overrides are resolved. See `getOverloadIndex`.
+        self.overloadIndex = None
+
+        # A map from (receiver type, receiver is explicit, type arguments, argument types) to
+        # the DefnInfo returned by `findDefnInfoWithArgTypes` for those arguments.
+        self.callCache = {}
+
     def addOverload(self, defnInfo):
         self.overloads.append(defnInfo)
+        self.overloadIndex = None
+        self.callCache.clear()
 
     def isOverloadable(self, otherDefnInfo):
         return isinstance(otherDefnInfo.irDefn, Function) and \
@@ -314,9 +321,23 @@ class NameInfo(object):
         if not self.isOverloaded():
             return
 
+        # A function may only override another function with the same number of type
+        # parameters and parameters, so only functions in the same group are compared.
+        groups = {}
+        for defnInfo in self.overloads:
+            irDefn = defnInfo.irDefn
+            if isinstance(irDefn, Function):
+                key = (len(irDefn.typeParameters), len(irDefn.parameterTypes))
+            else:
+                key = None
+            groups.setdefault(key, []).append(defnInfo)
+        for key in sorted(groups):
+            self.resolveOverridesInGroup(groups[key])
+
+    def resolveOverridesInGroup(self, overloads):
         # Sort overloads by depth to simplify the loop and avoid the last condition
         # mentioned above.
-        overloadsByDepth = sorted(self.overloads,
+        overloadsByDepth = sorted(overloads,
                                   key=lambda defnInfo: defnInfo.inheritanceDepth)
 
         # Compare each function with each other function with greater depth.
@@ -341,7 +362,7 @@ class NameInfo(object):
 
                     aIrDefn.override = bIrDefn
                     self.overrides[bIrDefn.id] = aIrDefn.id
-                    overrideIndex = aIndex + bIndex
+                    overrideIndex = bIndex
                     break
 
             # If we found an override, check that there aren't other functions we could
@@ -362,42 +383,62 @@ class NameInfo(object):
 
         This is safe to call on any NameInfo, even if it doesn't refer to a function. Returns
         DefnInfo if there is exactly one match. Raises ScopeException if there zero or
-        multiple matches."""
-        self.resolveOverrides()
-        candidate = None
-        for defnInfo in self.overloads:
-            irDefn = defnInfo.irDefn
-            if isinstance(irDefn, Function) and irDefn.id in self.overrides:
-                continue
-
-            isNonFunction = not isinstance(irDefn, Function) and \
-                            len(typeArgs) == 0 and len(argTypes) == 0
-            isFunction = not receiverIsExplicit and \
-                         isinstance(irDefn, Function) and \
-                         not irDefn.isMethod() and \
-                         irDefn.canCallWith(typeArgs, argTypes)
-            isImplicitMethod = not receiverIsExplicit and \
-                               isinstance(irDefn, Function) and \
-                               irDefn.isMethod() and \
-                               irDefn.canCallWith(typeArgs, [receiverType] + argTypes)
-            isExplicitMethod = receiverIsExplicit and \
-                               isinstance(irDefn, Function) and \
-                               irDefn.isMethod() and \
-                               irDefn.canCallWith(typeArgs, [receiverType] + argTypes)
-
-            if isNonFunction or \
-               isFunction or \
-               isImplicitMethod or \
-               isExplicitMethod:
-                if candidate is not None:
-                    raise TypeException("ambiguous call to overloaded function: %s" % \
-                                        self.name)
-                candidate = defnInfo
-
-        if candidate is None:
+        multiple matches.
+
+        Results are remembered for each combination of receiver and argument types, so this
+        must not be called before the types of the overloads are known."""
+        key = (receiverType, receiverIsExplicit, tuple(typeArgs), tuple(argTypes))
+        candidate = self.callCache.get(key)
+        if candidate is not None:
+            return candidate
+
+        nonFunctions, functions, methods = self.getOverloadIndex()
+        candidates = []
+        if len(typeArgs) == 0 and len(argTypes) == 0:
+            candidates.extend(nonFunctions)
+        if not receiverIsExplicit:
+            for defnInfo in functions.get((len(typeArgs), len(argTypes)), ()):
+                if defnInfo.irDefn.canCallWith(typeArgs, argTypes):
+                    candidates.append(defnInfo)
+        methodOverloads = methods.get((len(typeArgs), len(argTypes) + 1), ())
+        if len(methodOverloads) > 0:
+            methodArgTypes = [receiverType] + argTypes
+            for defnInfo in methodOverloads:
+                if defnInfo.irDefn.canCallWith(typeArgs, methodArgTypes):
+                    candidates.append(defnInfo)
+
+        if len(candidates) > 1:
+            raise TypeException("ambiguous call to overloaded function: %s" % \
+                                self.name)
+        if len(candidates) == 0:
             raise TypeException("could not find compatible definition: %s" % self.name)
+        candidate = candidates[0]
+        self.callCache[key] = candidate
         return candidate
 
+    def getOverloadIndex(self):
+        """Returns overloads which may be called, excluding overriden functions.
+
+        The index is a tuple containing a list of definitions which are not functions, a dict
+        of functions which are not methods, and a dict of methods. The dicts map the number of
+        type parameters and parameters (including the receiver for methods) to lists of
+        functions."""
+        if self.overloadIndex is None:
+            self.resolveOverrides()
+            nonFunctions = []
+            functions = {}
+            methods = {}
+            for defnInfo in self.overloads:
+                irDefn = defnInfo.irDefn
+                if not isinstance(irDefn, Function):
+                    nonFunctions.append(defnInfo)
+                elif irDefn.id not in self.overrides:
+                    table = methods if irDefn.isMethod() else functions
+                    key = (len(irDefn.typeParameters), len(irDefn.parameterTypes))
+                    table.setdefault(key, []).append(defnInfo)
+            self.overloadIndex = (nonFunctions, functions, methods)
+        return self.overloadIndex
+
 
 class Scope(AstNodeVisitor):
     def __init__(self, ast, scopeId, parent, info):
@@ -408,6 +449,18 @@ class Scope(AstNodeVisitor):
         self.bindings = {}
         self.defined = set()
         self.childScopes = {}
+
+        # For class scopes, the scope of the superclass, which bindings are inherited from.
+        # Set during inheritance analysis.
+        self.inheritedScope = None
+
+        # Names which have been copied from `inheritedScope` (or found not to be there).
+        self.inheritedNames = set()
+
+        # Results of `lookup`, keyed by its arguments. Only valid while `_bindingVersion` is
+        # equal to `lookupCacheVersion`.
+        self.lookupCache = {}
+        self.lookupCacheVersion = _bindingVersion
         info.setScope(self.scopeId, self)
         info.setContextInfo(scopeId, ContextInfo(self.scopeId))
         if not self.isLocal() and \
@@ -460,16 +513,63 @@ class Scope(AstNodeVisitor):
         For non-function defintions, this requires the name is not already bound. For function
         definitions, multiple functions may share the same name. They are added to
         OverloadInfo."""
+        global _bindingVersion
+        _bindingVersion += 1
+        if self.inheritedScope is not None and name not in self.inheritedNames:
+            # Inherited definitions come before any added later.
+            self.inheritName(name)
         if name not in self.bindings:
             self.bindings[name] = NameInfo(name)
         self.bindings[name].addOverload(defnInfo)
 
+    def inheritFrom(self, inheritedScope):
+        """Makes heritable definitions in another scope available in this scope.
+
+        Names bound in this scope are merged with inherited definitions immediately, since
+        they may conflict with or override them. Other names are copied the first time they
+        are looked up."""
+        global _bindingVersion
+        _bindingVersion += 1
+        self.inheritedScope = inheritedScope
+        for name in list(self.bindings):
+            self.inheritName(name)
+
+    def inheritName(self, name):
+        """Copies heritable definitions of a name from the inherited scope into this scope.
+
+        Raises ScopeException if a definition conflicts with one already bound here."""
+        self.inheritedNames.add(name)
+        inheritedNameInfo = self.inheritedScope.getDefinition(name)
+        if inheritedNameInfo is None:
+            return
+        for defnInfo in inheritedNameInfo.overloads:
+            if defnInfo.inheritanceDepth == NOT_HERITABLE:
+                continue
+            nameInfo = self.bindings.get(name)
+            if nameInfo is None:
+                nameInfo = NameInfo(name)
+                self.bindings[name] = nameInfo
+            elif not nameInfo.isOverloadable(defnInfo):
+                raise ScopeException("%s: conflicts with inherited definition" % name)
+            nameInfo.addOverload(defnInfo.inherit(self.scopeId))
+            self.defined.add(name)
+
+    def inheritAllNames(self):
+        """Copies all heritable definitions from the inherited scope into this scope."""
+        if self.inheritedScope is None:
+            return
+        self.inheritedScope.inheritAllNames()
+        for name in self.inheritedScope.bindings.keys():
+            if name not in self.inheritedNames:
+                self.inheritName(name)
+
     def getBindings(self):
         """Returns a iterator, which returns (str, DefnInfo, int) pairs for each binding.
 
         The str is the name, and the int indicates how many classes the definition was inherited
         through (0 indicates it was inherited from this class). For overloaded functions, this
         will return the same name more than once."""
+        self.inheritAllNames()
         for name, nameInfo in self.bindings.iteritems():
             for defnInfo in nameInfo.overloads:
                 yield (name, defnInfo)
@@ -521,7 +621,23 @@ class Scope(AstNodeVisitor):
     def lookup(self, name, localOnly, mayBeAssignment):
         """Resolves a reference to a symbol, possibly in a parent scope.
 
-        Returns NameInfo. For overloaded symbols, there may be several functions in there."""
+        Returns NameInfo. For overloaded symbols, there may be several functions in there.
+
+        Successful lookups are remembered until a name is bound in any scope. Defining a name
+        can only make a failed lookup succeed, so it doesn't affect remembered results."""
+        key = (name, localOnly, mayBeAssignment)
+        if self.lookupCacheVersion == _bindingVersion:
+            nameInfo = self.lookupCache.get(key)
+            if nameInfo is not None:
+                return nameInfo
+        else:
+            self.lookupCache = {}
+            self.lookupCacheVersion = _bindingVersion
+        nameInfo = self.lookupUncached(name, localOnly, mayBeAssignment)
+        self.lookupCache[key] = nameInfo
+        return nameInfo
+
+    def lookupUncached(self, name, localOnly, mayBeAssignment):
         defnScope = self
         while defnScope is not None and \
               not defnScope.isBound(name) and \
@@ -542,6 +658,8 @@ class Scope(AstNodeVisitor):
 
     def getDefinition(self, name):
         """Returns NameInfo for a symbol defined in this scope or None."""
+        if self.inheritedScope is not None and name not in self.inheritedNames:
+            self.inheritName(name)
         return self.bindings.get(name)
 
     def isDefined(self, name):
@@ -16,52 +16,58 @@ from ir_types import *
 from utils import *
 
 def serialize(package, fileName):
+    serializer = Serializer(package)
+    serializer.serialize()
     if fileName == "-":
-        outFile = sys.stdout
-        shouldClose = False
+        sys.stdout.write(serializer.buf)
     else:
-        outFile = open(fileName, "wb")
-        shouldClose = True
-    try:
-        serializer = Serializer(package, outFile)
-        serializer.serialize()
-    finally:
-        if shouldClose:
-            outFile.close()
+        with open(fileName, "wb") as outFile:
+            outFile.write(serializer.buf)
 
 
 class Serializer(object):
-    def __init__(self, package, outFile):
+    """Encodes a package into a single buffer, which can be written all at once."""
+
+    def __init__(self, package):
         self.package = package
-        self.outFile = outFile
+        self.buf = bytearray()
 
     def serialize(self):
         self.writeHeader()
-        for s in self.package.strings:
-            self.writeString(s)
-        for f in self.package.functions:
-            self.writeFunction(f)
-        for c in self.package.classes:
-            self.writeClass(c)
-        for p in self.package.typeParameters:
-            self.writeTypeParameter(p)
+
+        # The index of record offsets comes right after the header. Its size is known from
+        # the counts in the header, so space is reserved for it here, and it's filled in once
+        # the records have been written.
+        recordCount = len(self.package.strings) + len(self.package.functions) + \
+                      len(self.package.classes) + len(self.package.typeParameters)
+        indexOffset = len(self.buf)
+        self.buf += bytearray(4 * recordCount)
+        recordOffsets = []
+        for writer, records in [(self.writeString, self.package.strings),
+                                (self.writeFunction, self.package.functions),
+                                (self.writeClass, self.package.classes),
+                                (self.writeTypeParameter, self.package.typeParameters)]:
+            for record in records:
+                recordOffsets.append(len(self.buf))
+                writer(record)
+        struct.pack_into("<%dI" % recordCount, self.buf, indexOffset, *recordOffsets)
 
     def writeHeader(self):
-        self.outFile.write(struct.pack("<Ihhqiiiii",
-                                       0x676b7073,   # magic number
-                                       0,            # major version
-                                       7,            # minor version
-                                       0,            # flags
-                                       len(self.package.strings),
-                                       len(self.package.functions),
-                                       len(self.package.classes),
-                                       len(self.package.typeParameters),
-                                       self.package.entryFunction))
+        self.buf += struct.pack("<Ihhqiiiii",
+                                0x676b7073,   # magic number
+                                0,            # major version
+                                8,            # minor version
+                                0,            # flags
+                                len(self.package.strings),
+                                len(self.package.functions),
+                                len(self.package.classes),
+                                len(self.package.typeParameters),
+                                self.package.entryFunction)
 
     def rewrite(self, format, value, offset, whence=os.SEEK_SET):
-        self.outFile.seek(offset, whence)
-        self.outFile.write(struct.pack("<" + format, value))
-        self.outFile.seek(0, os.SEEK_END)
+        if whence == os.SEEK_END:
+            offset += len(self.buf)
+        struct.pack_into("<" + format, self.buf, offset, value)
 
     def writeString(self, s):
         length = len(s)
@@ -69,7 +75,7 @@ class Serializer(object):
         size = len(encoded)
         self.writeVbn(length)
         self.writeVbn(size)
-        self.outFile.write(encoded)
+        self.buf += encoded
 
     def writeFunction(self, function):
         self.writeFlags(function.flags)
@@ -78,11 +84,11 @@ class Serializer(object):
         self.writeVbn(len(function.parameterTypes))
         for ty in function.parameterTypes:
             self.writeType(ty)
-        localsSize = 8 * len(filter(lambda v: v.kind is LOCAL, function.variables))
+        localsSize = 8 * sum(1 for v in function.variables if v.kind is LOCAL)
         self.writeVbn(localsSize)
         instructions, blockOffsetTable = self.encodeInstructions(function)
         self.writeVbn(len(instructions))
-        self.outFile.write(instructions)
+        self.buf += instructions
         self.writeVbn(len(blockOffsetTable))
         for offset in blockOffsetTable:
             self.writeVbn(offset)
@@ -101,8 +107,8 @@ class Serializer(object):
                 elif isinstance(inst, f64):
                     self.encodeFloat(64, inst.op(0), buf)
                 else:
-                    for i in xrange(inst.operandCount()):
-                        self.encodeVbn(inst.op(i), buf)
+                    for operand in inst.operands:
+                        self.encodeVbn(operand, buf)
         return buf, blockOffsetTable
 
     def writeClass(self, clas):
@@ -162,8 +168,11 @@ class Serializer(object):
             self.writeVbn(id)
 
     def writeFlags(self, flags):
-        bits = flagSetToFlagBits(flags)
-        self.outFile.write(struct.pack("<I", bits))
+        encoded = _encodedFlags.get(flags)
+        if encoded is None:
+            encoded = struct.pack("<I", flagSetToFlagBits(flags))
+            _encodedFlags[flags] = encoded
+        self.buf += encoded
 
     def writeList(self, writer, list):
         self.writeVbn(len(list))
@@ -171,23 +180,39 @@ class Serializer(object):
             writer(elem)
 
     def writeVbn(self, value):
-        buf = bytearray()
-        self.encodeVbn(value, buf)
-        self.outFile.write(buf)
+        self.encodeVbn(value, self.buf)
 
     def encodeVbn(self, value, buf):
-        offset = 0
-        done = False
-        while not done:
-            bits = value & 0x7F
-            value >>= 7
-            done = (value == 0 or ~value == 0) and \
-                   bit(bits, 6) == bit(value, 0)
-            if not done:
-                bits |= 0x80
-            buf.append(bits)
+        if _MIN_TABLE_VBN <= value < _MAX_TABLE_VBN:
+            buf += _vbnTable[value - _MIN_TABLE_VBN]
+        else:
+            buf += _encodeVbn(value)
 
     def encodeFloat(self, width, value, buf):
         format = "<f" if width == 32 else "<d"
         fbuf = struct.pack(format, value)
         buf += fbuf
+
+
+def _encodeVbn(value):
+    buf = bytearray()
+    done = False
+    while not done:
+        bits = value & 0x7F
+        value >>= 7
+        done = (value == 0 or ~value == 0) and \
+               bit(bits, 6) == bit(value, 0)
+        if not done:
+            bits |= 0x80
+        buf.append(bits)
+    return bytes(buf)
+
+
+# Encodings of small numbers, which are most of the numbers in a package (ids, lengths, and
+# operands), are looked up in a table instead of being computed each time.
+_MIN_TABLE_VBN = -(1 << 13)
+_MAX_TABLE_VBN = 1 << 13
+_vbnTable = [_encodeVbn(value) for value in xrange(_MIN_TABLE_VBN, _MAX_TABLE_VBN)]
+
+# Encodings of flag sets seen so far.
+_encodedFlags = {}
@@ -0,0 +1,125 @@
+# Copyright 2014, Jay Conrod. All rights reserved.
+#
+# This file is part of Gypsum. Use of this source code is governed by
+# the GPL license that can be found in the LICENSE.txt file.
+
+
+import resource
+import sys
+import time
+
+
+class CompileStats(object):
+    """Records how long each phase of compiling a file took and what it produced.
+
+    The compiler driver runs each phase inside a `with stats.phase(name) as phase:` block
+    and records counts of the objects the phase created with phase.count. CompileStats
+    objects are pickled to send them from worker processes back to the driver."""
+
+    enabled = True
+
+    def __init__(self, sourceFilename):
+        self.sourceFilename = sourceFilename
+        self.phases = []
+
+    def phase(self, name):
+        phase = PhaseStats(name)
+        self.phases.append(phase)
+        return phase
+
+    def total(self):
+        """Returns a PhaseStats with the sum of the times and memory growth of all phases."""
+        total = PhaseStats("total")
+        for phase in self.phases:
+            total.wallTime += phase.wallTime
+            total.cpuTime += phase.cpuTime
+            total.peakRssDelta += phase.peakRssDelta
+        return total
+
+    def toJson(self):
+        """Returns a dict describing these stats which may be passed to json.dump."""
+        return {"source": self.sourceFilename,
+                "phases": [phase.toJson() for phase in self.phases],
+                "total": self.total().toJson()}
+
+    def format(self):
+        """Returns a human readable table of these stats."""
+        lines = ["%s:" % self.sourceFilename,
+                 "  %-20s %10s %10s %10s  %s" % ("phase", "wall ms", "cpu ms", "rss KB",
+                                                 "counts")]
+        for phase in self.phases + [self.total()]:
+            counts = " ".join("%s=%d" % (name, phase.counts[name])
+                              for name in sorted(phase.counts))
+            lines.append("  %-20s %10.2f %10.2f %10d  %s" %
+                         (phase.name, 1000 * phase.wallTime, 1000 * phase.cpuTime,
+                          phase.peakRssDelta // 1024, counts))
+        return "\n".join(lines) + "\n"
+
+
+class NullStats(object):
+    """Stands in for CompileStats when stats aren't being collected. Nothing is measured."""
+
+    enabled = False
+
+    def phase(self, name):
+        return _NULL_PHASE
+
+
+class PhaseStats(object):
+    """Wall time, CPU time, and peak memory growth of one phase, plus object counts.
+
+    Times are in seconds. peakRssDelta is the number of bytes by which the peak resident set
+    size of the process grew during the phase; it is 0 when the phase stayed under the peak
+    reached by an earlier phase or file."""
+
+    def __init__(self, name):
+        self.name = name
+        self.wallTime = 0.
+        self.cpuTime = 0.
+        self.peakRssDelta = 0
+        self.counts = {}
+
+    def __enter__(self):
+        self.startWallTime = time.time()
+        self.startCpuTime, self.startPeakRss = _cpuTimeAndPeakRss()
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        cpuTime, peakRss = _cpuTimeAndPeakRss()
+        self.wallTime = time.time() - self.startWallTime
+        self.cpuTime = cpuTime - self.startCpuTime
+        self.peakRssDelta = peakRss - self.startPeakRss
+        del self.startWallTime, self.startCpuTime, self.startPeakRss
+        return False
+
+    def count(self, name, value):
+        self.counts[name] = value
+
+    def toJson(self):
+        return {"name": self.name,
+                "wallTime": self.wallTime,
+                "cpuTime": self.cpuTime,
+                "peakRssDelta": self.peakRssDelta,
+                "counts": self.counts}
+
+
+class _NullPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        return False
+
+    def count(self, name, value):
+        pass
+
+
+_NULL_PHASE = _NullPhase()
+
+
+# ru_maxrss is in kilobytes on Linux, but in bytes on OS X.
+_MAX_RSS_SCALE = 1 if sys.platform == "darwin" else 1024
+
+def _cpuTimeAndPeakRss():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss * _MAX_RSS_SCALE
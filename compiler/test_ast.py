@@ -0,0 +1,48 @@
+# Copyright 2014, Jay Conrod. All rights reserved.
+#
+# This file is part of Gypsum. Use of this source code is governed by
+# the GPL license that can be found in the LICENSE.txt file.
+
+
+import unittest
+
+from ast import *
+
+
+class TestAst(unittest.TestCase):
+    def makeFunction(self):
+        return AstFunctionDefinition([], "f", [], [], AstI64Type(),
+                                     AstLiteralExpression(AstIntegerLiteral(12, 64)))
+
+    def testNodesHaveNoDict(self):
+        node = self.makeFunction()
+        self.assertFalse(hasattr(node, "__dict__"))
+        with self.assertRaises(AttributeError):
+            node.extra = 1
+
+    def testStructuralEquality(self):
+        self.assertEqual(self.makeFunction(), self.makeFunction())
+        self.assertFalse(self.makeFunction() != self.makeFunction())
+        other = self.makeFunction()
+        other.body.literal.value = 34
+        self.assertNotEqual(self.makeFunction(), other)
+
+    def testInheritedFieldsAreCompared(self):
+        a = self.makeFunction()
+        b = self.makeFunction()
+        b.attribs = [AstAttribute("private")]
+        self.assertNotEqual(a, b)
+
+    def testDifferentClassesAreNotEqual(self):
+        self.assertNotEqual(AstI32Type(), AstI64Type())
+        self.assertNotEqual(AstThisExpression(), AstSuperExpression())
+
+    def testIdsAreCompared(self):
+        a = self.makeFunction()
+        b = self.makeFunction()
+        addNodeIds(a)
+        self.assertNotEqual(a, b)
+        addNodeIds(b)
+        self.assertEqual(a, b)
+        b.body.id += 1
+        self.assertNotEqual(a, b)
@@ -0,0 +1,80 @@
+# Copyright 2014, Jay Conrod. All rights reserved.
+#
+# This file is part of Gypsum. Use of this source code is governed by
+# the GPL license that can be found in the LICENSE.txt file.
+
+
+import argparse
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from cache import *
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = CompileCache(os.path.join(self.dir, "cache"))
+        self.options = argparse.Namespace(no_layout=False, peephole=frozenset())
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def writeFile(self, name, contents):
+        filename = os.path.join(self.dir, name)
+        with open(filename, "wb") as f:
+            f.write(contents)
+        return filename
+
+    def readFile(self, filename):
+        with open(filename, "rb") as f:
+            return f.read()
+
+    def testKey(self):
+        key = self.cache.key("var x = 1\n", self.options)
+        self.assertEqual(key, self.cache.key("var x = 1\n", self.options))
+        self.assertNotEqual(key, self.cache.key("var x = 2\n", self.options))
+        noLayout = argparse.Namespace(no_layout=True, peephole=frozenset())
+        self.assertNotEqual(key, self.cache.key("var x = 1\n", noLayout))
+        peephole = argparse.Namespace(no_layout=False, peephole=frozenset(["pushDrop"]))
+        self.assertNotEqual(key, self.cache.key("var x = 1\n", peephole))
+
+    def testMiss(self):
+        output = os.path.join(self.dir, "out.csp")
+        self.assertFalse(self.cache.fetch("0" * 40, output))
+        self.assertFalse(os.path.exists(output))
+        self.assertEqual((0, 1), (self.cache.hits, self.cache.misses))
+
+    def testStoreAndFetch(self):
+        key = self.cache.key("var x = 1\n", self.options)
+        package = self.writeFile("in.csp", "package")
+        self.cache.store(key, package)
+        output = os.path.join(self.dir, "out.csp")
+        self.assertTrue(self.cache.fetch(key, output))
+        self.assertEqual("package", self.readFile(output))
+        self.assertEqual((1, 0), (self.cache.hits, self.cache.misses))
+        self.assertEqual([key + ".csp"], os.listdir(os.path.dirname(self.cache.path(key))))
+
+    def testEvictOld(self):
+        self.cache.maxAge = 100
+        package = self.writeFile("in.csp", "package")
+        for key, mtime in [("a" * 40, 1000), ("b" * 40, 1090)]:
+            self.cache.store(key, package)
+            os.utime(self.cache.path(key), (mtime, mtime))
+        self.assertEqual(1, self.cache.evict(now=1150))
+        self.assertFalse(os.path.exists(self.cache.path("a" * 40)))
+        self.assertTrue(os.path.exists(self.cache.path("b" * 40)))
+
+    def testEvictLeastRecentlyUsed(self):
+        self.cache.maxSize = 20
+        package = self.writeFile("in.csp", "0123456789")
+        keys = ["a" * 40, "b" * 40, "c" * 40]
+        for key, mtime in zip(keys, [1000, 3000, 2000]):
+            self.cache.store(key, package)
+            os.utime(self.cache.path(key), (mtime, mtime))
+        self.assertEqual(1, self.cache.evict())
+        self.assertEqual([False, True, True],
+                         [os.path.exists(self.cache.path(key)) for key in keys])
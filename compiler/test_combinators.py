@@ -4,6 +4,7 @@
 # the GPL license that can be found in the LICENSE.txt file.
 
 
+import gc
 import unittest
 
 from combinators import *
@@ -53,6 +54,20 @@ class TestCombinators(unittest.TestCase):
         self.assertFalse(result)
         self.assertEquals(False, result.retry)
 
+    def testCommitKeepsMessage(self):
+        parser = Commit(Reserved(RESERVED, "var"))
+        result = parser(makeReader("a"))
+        self.assertFalse(result.retry)
+        self.assertEqual("expected var but found a", result.message)
+
+    def testReaderNextShared(self):
+        reader = makeReader("a b")
+        self.assertIs(reader.next(), reader.next())
+        first = symbol(reader)
+        second = symbol(reader)
+        self.assertIs(first.next, second.next)
+        self.assertEqual(1, first.next.pos)
+
     def testPhrase(self):
         parser = Phrase(symbol)
         reader = makeReader("a b")
@@ -95,11 +110,99 @@ class TestCombinators(unittest.TestCase):
         parser = symbol + symbol
         self.checkParse(("a", "b"), parser, "a b")
 
+    def testConcatFlat(self):
+        parser = symbol + symbol + symbol
+        self.checkParse(("a", "b", "c"), parser, "a b c")
+
+    def testConcatNestedRight(self):
+        parser = symbol + (symbol + symbol)
+        self.checkParse(("a", ("b", "c")), parser, "a b c")
+
+    def testConcatLocation(self):
+        reader = makeReader("a b c")
+        result = (symbol + symbol + symbol)(reader)
+        expected = reader.tokens[0].location.combine(reader.tokens[2].location)
+        self.assertEqual(expected, result.location)
+
+    def testConcatFailure(self):
+        parser = symbol + symbol + Reserved(RESERVED, "var")
+        reader = makeReader("a b c")
+        result = parser(reader)
+        self.assertFalse(result)
+        self.assertEqual("expected var but found c", result.message)
+
     def testAlternate(self):
         parser = symbol | Reserved(RESERVED, "var")
         self.checkParse("abc", parser, "abc")
         self.checkParse("var", parser, "var")
 
+    def testAlternateFlat(self):
+        parser = symbol | Reserved(RESERVED, "var") | Reserved(RESERVED, "def")
+        self.assertEqual(3, len(parser.parsers))
+        self.checkParse("def", parser, "def")
+
+    def testAlternateDispatch(self):
+        calls = []
+        def track(name, parser):
+            def process(parsed):
+                calls.append(name)
+                return parsed
+            return parser ^ process
+        parser = track("var", Reserved(RESERVED, "var")) | \
+                 track("sym", symbol) | \
+                 track("def", Reserved(RESERVED, "def"))
+        self.checkParse("def", parser, "def")
+        self.assertEqual(["def"], calls)
+
+    def testAlternateFailureFromLast(self):
+        parser = Reserved(RESERVED, "var") | symbol | Reserved(RESERVED, "def")
+        result = parser(makeReader("class"))
+        self.assertFalse(result)
+        self.assertEqual("expected def but found class", result.message)
+
+    def testAlternateFailureAtEnd(self):
+        parser = Reserved(RESERVED, "var") | symbol
+        result = parser(makeReader(""))
+        self.assertFalse(result)
+        self.assertEqual("unexpected end of file", result.message)
+
+    def testAlternateNullable(self):
+        parser = Reserved(RESERVED, "var") | Opt(symbol)
+        self.checkParse(None, parser, "def")
+
+    def testAlternateCommitNotSkipped(self):
+        parser = Commit(Reserved(RESERVED, "var")) | symbol
+        result = parser(makeReader("a"))
+        self.assertFalse(result)
+        self.assertFalse(result.retry)
+
+    def testFirstSet(self):
+        var = Reserved(RESERVED, "var")
+        first = (Opt(var) + symbol).firstSet()
+        self.assertEqual(frozenset([(RESERVED, "var"), (SYMBOL, None)]), first.keys)
+        self.assertFalse(first.nullable)
+        self.assertFalse(first.unknown)
+        self.assertTrue(Rep(symbol).firstSet().nullable)
+        self.assertTrue(Commit(var).firstSet().unknown)
+
+    def testFirstSetCycle(self):
+        def rule():
+            return Reserved(RESERVED, "(") + Lazy(rule) | symbol
+        parser = Lazy(rule) + symbol
+        self.assertFalse(parser.firstSet().unknown)
+        rules = []
+        def leftRecRule():
+            if not rules:
+                rules.append(Lazy(leftRecRule) + symbol | symbol)
+            return rules[0]
+        self.assertTrue(leftRecRule().firstSet().unknown)
+
+    def testOptSkipsByFirstSet(self):
+        calls = []
+        parser = Opt(symbol ^ (lambda p: calls.append(p)))
+        self.checkParse(None, parser, "var")
+        self.assertEqual([], calls)
+
     def testAlternateCommit(self):
         parser = Commit(symbol) | Reserved(RESERVED, "var")
         reader = makeReader("var")
@@ -158,3 +261,83 @@ class TestCombinators(unittest.TestCase):
     def testUntangle(self):
         tangled = (1, (2, (3, 4), 5))
         self.assertEqual([1, 2, 3, 4, 5], untangle(tangled))
+
+    def testStreamReader(self):
+        tokens = filter(tokenIsPrintable, lex("test", "a b"))
+        reader = StreamReader("test", TokenWindow(iter(tokens)))
+        self.assertFalse(reader.isEmpty())
+        self.assertEqual("a", reader.token().text)
+        reader = reader.next().next()
+        self.assertTrue(reader.isEmpty())
+        self.assertEqual(tokens[-1].location, reader.location())
+
+    def testTokenWindowIsLazy(self):
+        def tokens():
+            yield Token("a", SYMBOL, None)
+            raise AssertionError("read too many tokens")
+        reader = StreamReader("test", TokenWindow(tokens()))
+        self.assertEqual("a", symbol(reader).value)
+
+    def testRelease(self):
+        tokens = filter(tokenIsPrintable, lex("test", "a b c"))
+        window = TokenWindow(iter(tokens))
+        parser = Rep(Release(symbol))
+        result = parser(StreamReader("test", window))
+        self.assertEqual(["a", "b", "c"], result.value)
+        self.assertEqual(3, window.offset)
+        self.assertEqual([], window.buffer)
+
+    def testReleasedReadersAreCollected(self):
+        tokens = filter(tokenIsPrintable, lex("test", "a b c d e"))
+        window = TokenWindow(iter(tokens))
+        reader = StreamReader("test", window)
+        result = Rep(Release(symbol))(reader)
+        self.assertEqual(5, window.offset)
+        gc.collect()
+        objects = gc.get_objects()
+        readerPositions = [o.pos for o in objects
+                           if isinstance(o, StreamReader) and o.tokens is window]
+        self.assertEqual([0, 5], sorted(readerPositions))
+        successes = [o for o in objects
+                     if isinstance(o, Success) and isinstance(o.next, StreamReader) and
+                        o.next.tokens is window]
+        self.assertEqual([result], successes)
+
+    def testMemo(self):
+        a = Memo(symbol)
+        parser = (a + Reserved(RESERVED, "var")) | (a + symbol ^ (lambda p: p[1]))
+        tokens = filter(tokenIsPrintable, lex("test", "a b"))
+        memo = MemoTable()
+        result = parser(Reader("test", tokens, memo=memo))
+        self.assertEqual("b", result.value)
+        self.assertEqual(1, memo.hits)
+        self.assertEqual(1, memo.misses)
+
+    def testMemoWithoutTable(self):
+        parser = Memo(symbol)
+        self.checkParse("a", parser, "a")
+
+    def testMemoLazyShared(self):
+        parser = Lazy(lambda: symbol)
+        memo = MemoTable()
+        reader = Reader("test", makeReader("a").tokens, memo=memo)
+        first = parser(reader)
+        second = parser(reader)
+        self.assertIs(first, second)
+        self.assertEqual(1, memo.hits)
+
+    def testMemoFlushedAfterCommit(self):
+        parser = Rep(Memo(symbol) + Commit(Reserved(RESERVED, ",")))
+        memo = MemoTable()
+        reader = Reader("test", makeReader("a , b , c ,").tokens, memo=memo)
+        result = parser(reader)
+        self.assertTrue(result)
+        self.assertEqual(5, memo.minPos)
+        self.assertTrue(all(pos >= memo.minPos for pos in memo.entries))
+
+    def testCommitDoesNotModifyResult(self):
+        parser = Memo(symbol)
+        memo = MemoTable()
+        reader = Reader("test", [], memo=memo)
+        self.assertFalse(Commit(parser)(reader).retry)
+        self.assertTrue(parser(reader).retry)
@@ -0,0 +1,84 @@
+# Copyright 2014, Jay Conrod. All rights reserved.
+#
+# This file is part of Gypsum. Use of this source code is governed by
+# the GPL license that can be found in the LICENSE.txt file.
+
+
+import unittest
+
+from ast import *
+from builtins import *
+from compile_info import *
+
+
+class TestIdTable(unittest.TestCase):
+    def testEmpty(self):
+        table = IdTable()
+        self.assertEqual(0, len(table))
+        self.assertFalse(0 in table)
+        self.assertFalse(-1 in table)
+        with self.assertRaises(KeyError):
+            table[0]
+        with self.assertRaises(KeyError):
+            table[-1]
+
+    def testSetAndGet(self):
+        table = IdTable()
+        table[3] = "c"
+        table[-2] = "b"
+        table[0] = "a"
+        self.assertEqual("a", table[0])
+        self.assertEqual("b", table[-2])
+        self.assertEqual("c", table[3])
+        self.assertFalse(1 in table)
+        with self.assertRaises(KeyError):
+            table[1]
+        self.assertEqual(3, len(table))
+
+    def testNoneIsAValue(self):
+        table = IdTable()
+        table[1] = None
+        self.assertTrue(1 in table)
+        self.assertIsNone(table[1])
+        self.assertEqual("default", table.get(2, "default"))
+
+    def testOverwrite(self):
+        table = IdTable()
+        table[1] = "a"
+        table[1] = "b"
+        table[-1] = "c"
+        table[-1] = "d"
+        self.assertEqual(2, len(table))
+        self.assertEqual("b", table[1])
+        self.assertEqual("d", table[-1])
+
+    def testIterationIsSorted(self):
+        table = IdTable()
+        for id in [5, -1, 0, -3, 200]:
+            table[id] = str(id)
+        self.assertEqual([-3, -1, 0, 5, 200], table.keys())
+        self.assertEqual(["-3", "-1", "0", "5", "200"], table.values())
+        self.assertEqual([(-3, "-3"), (-1, "-1")], table.items()[:2])
+        self.assertEqual(table.keys(), list(table))
+
+
+class TestCompileInfo(unittest.TestCase):
+    def testKeys(self):
+        info = CompileInfo(AstModule([]))
+        node = AstVariableExpression("x")
+        node.id = 3
+        info.setType(node, "ty")
+        self.assertTrue(info.hasType(3))
+        self.assertTrue(info.hasType(node))
+        self.assertEqual("ty", info.getType(3))
+        self.assertFalse(info.hasType(4))
+        with self.assertRaises(KeyError):
+            info.getType(4)
+
+    def testBuiltinKeys(self):
+        info = CompileInfo(AstModule([]))
+        rootClass = getRootClass()
+        info.setClassInfo(rootClass, "root")
+        self.assertTrue(info.hasClassInfo(rootClass.id))
+        self.assertEqual("root", info.getClassInfo(rootClass))
+        self.assertEqual([rootClass.id], info.classInfo.keys())
@@ -24,7 +24,7 @@ from bytecode import *
 
 
 class TestCompiler(unittest.TestCase):
-    def compileFromSource(self, source):
+    def compileFromSource(self, source, jobs=1):
         filename = "(test)"
         rawTokens = lex(filename, source)
         layoutTokens = layout(rawTokens)
@@ -35,7 +35,7 @@ class TestCompiler(unittest.TestCase):
         analyzeTypes(info)
         convertClosures(info)
         flattenClasses(info)
-        compile(info)
+        compile(info, jobs)
         return info.package
 
     def makePackage(self, input):
@@ -851,6 +851,34 @@ class TestCompiler(unittest.TestCase):
     def testRequireParameterTypes(self):
         self.assertRaises(TypeException, self.compileFromSource, "def f(x) = 12")
 
+    def testParallelMatchesSequential(self):
+        source = "def f = \"foo\"\n" + \
+                 "def g(x: i64) =\n" + \
+                 "  var s = \"bar\"\n" + \
+                 "  s = \"foo\"\n" + \
+                 "  def h = x + 1\n" + \
+                 "  h\n" + \
+                 "class C(a: i64)\n" + \
+                 "  var b = \"baz\"\n" + \
+                 "  def m(c: i64) = a + c\n" + \
+                 "def k = \"bar\""
+        sequential = self.compileFromSource(source)
+        parallel = self.compileFromSource(source, jobs=3)
+        self.assertEquals(sequential.strings, parallel.strings)
+        self.assertEquals(set([u"foo", u"bar", u"baz"]), set(parallel.strings))
+        self.assertEquals(len(sequential.functions), len(parallel.functions))
+        for expected, actual in zip(sequential.functions, parallel.functions):
+            self.assertEquals(expected.blocks, actual.blocks)
+            self.assertEquals([getattr(v, "index", None) for v in expected.variables],
+                              [getattr(v, "index", None) for v in actual.variables])
+
+    def testParallelRaisesSameException(self):
+        source = "def f = 12\n" + \
+                 "class Foo(x: i64)\n" + \
+                 "class Bar <: Foo\n" + \
+                 "def g = 34"
+        self.assertRaises(CompileException, self.compileFromSource, source, 2)
+
     def testTypeRequiresBody(self):
         self.assertRaises(CompileException, self.compileFromSource, "def f: i64")
 
@@ -0,0 +1,109 @@
+# Copyright 2014, Jay Conrod. All rights reserved.
+#
+# This file is part of Gypsum. Use of this source code is governed by
+# the GPL license that can be found in the LICENSE.txt file.
+
+
+import unittest
+
+from builtins import *
+from ir_instructions import *
+from constant_folding import *
+
+
+class TestConstantFolding(unittest.TestCase):
+    def checkFold(self, expected, inst, *operands):
+        self.assertEqual(expected, fold(inst, list(operands)))
+
+    def testLiteralWord(self):
+        self.assertEqual(0xFF, literalWord(i8(-1)))
+        self.assertEqual(2 ** 64 - 1, literalWord(i64(-1)))
+        self.assertEqual(0x3F800000, literalWord(f32(1.)))
+        self.assertEqual(0x3FF0000000000000, literalWord(f64(1.)))
+        self.assertEqual(1, literalWord(true()))
+        self.assertEqual(0, literalWord(false()))
+        self.assertIsNone(literalWord(ldlocal(0)))
+
+    def testOperandCount(self):
+        self.assertEqual(2, operandCount(addi64()))
+        self.assertEqual(1, operandCount(negf32()))
+        self.assertEqual(1, operandCount(sexti64_8()))
+        self.assertIsNone(operandCount(i64(1)))
+        self.assertIsNone(operandCount(callg(0, 0)))
+
+    def testWrongOperands(self):
+        self.checkFold(None, addi64(), i64(1))
+        self.checkFold(None, addi64(), ldlocal(0), i64(1))
+
+    def testIntArithmetic(self):
+        self.checkFold(i64(3), addi64(), i64(1), i64(2))
+        self.checkFold(i64(-1), subi64(), i64(1), i64(2))
+        self.checkFold(i32(-42), muli32(), i32(6), i32(-7))
+        self.checkFold(i16(6), andi16(), i16(14), i16(7))
+        self.checkFold(i16(15), ori16(), i16(8), i16(7))
+        self.checkFold(i8(9), xori8(), i8(12), i8(5))
+
+    def testWraparound(self):
+        self.checkFold(i64(-2 ** 63), addi64(), i64(2 ** 63 - 1), i64(1))
+        self.checkFold(i64(-2 ** 63), negi64(), i64(-2 ** 63))
+        self.checkFold(i32(0), muli32(), i32(2 ** 16), i32(2 ** 16))
+        self.checkFold(i8(-56), addi8(), i8(100), i8(100))
+        self.checkFold(i8(-128), divi8(), i8(-128), i8(-1))
+
+    def testPromotedBitsNotFolded(self):
+        # The VM computes this as an int, so the high bits of the word are set, and a zext
+        # would see them. A literal wouldn't set them.
+        self.checkFold(None, addi8(), i8(-1), i8(0))
+        self.checkFold(None, invi16(), i16(0))
+        self.checkFold(None, trunci8(), i64(200))
+        self.checkFold(None, lsri32(), i32(-1), i32(4))
+
+    def testDivision(self):
+        self.checkFold(i64(-3), divi64(), i64(-7), i64(2))
+        self.checkFold(i64(-1), modi64(), i64(-7), i64(2))
+        self.checkFold(i64(1), modi64(), i64(7), i64(-2))
+        self.checkFold(None, divi64(), i64(1), i64(0))
+        self.checkFold(None, modi32(), i32(1), i32(0))
+        self.checkFold(None, divi64(), i64(-2 ** 63), i64(-1))
+        self.checkFold(None, modi32(), i32(-2 ** 31), i32(-1))
+
+    def testShifts(self):
+        self.checkFold(i64(-16), lsli64(), i64(-1), i64(4))
+        self.checkFold(i64(-1), asri64(), i64(-1), i64(4))
+        self.checkFold(i64(2 ** 60 - 1), lsri64(), i64(-1), i64(4))
+        self.checkFold(i32(4), lsri32(), i32(16), i32(2))
+        self.checkFold(None, lsli64(), i64(1), i64(64))
+        self.checkFold(None, asri32(), i32(1), i32(-1))
+        self.checkFold(None, lsri64(), i64(1), i64(64))
+
+    def testComparisons(self):
+        self.checkFold(true(), lti64(), i64(-1), i64(0))
+        self.checkFold(false(), gei8(), i8(-1), i8(0))
+        self.checkFold(true(), eqi8(), true(), true())
+        self.checkFold(false(), nei16(), i16(3), i16(3))
+        self.checkFold(true(), lef64(), f64(1.5), f64(1.5))
+        self.checkFold(false(), eqf64(), f64(float("nan")), f64(float("nan")))
+        self.checkFold(false(), notb(), true())
+
+    def testFloatArithmetic(self):
+        self.checkFold(f64(0.1 + 0.2), addf64(), f64(0.1), f64(0.2))
+        self.checkFold(f32(0.30000001192092896), addf32(), f32(0.1), f32(0.2))
+        self.checkFold(f32(float("inf")), mulf32(), f32(3e38), f32(10.))
+        self.assertEqual(1 << 63, literalWord(fold(negf64(), [f64(0.)])))
+        self.checkFold(None, divf64(), f64(1.), f64(0.))
+        self.checkFold(None, subf64(), f64(float("inf")), f64(float("inf")))
+
+    def testConversions(self):
+        self.checkFold(i16(-1), sexti16_8(), i8(-1))
+        self.checkFold(i16(255), zexti16(), i8(-1))
+        self.checkFold(i8(44), trunci8(), i64(300))
+        self.checkFold(f32(0.10000000149011612), truncf32(), f64(0.1))
+        self.checkFold(f32(float("-inf")), truncf32(), f64(-1e300))
+        self.checkFold(f64(0.10000000149011612), extf64(), f32(0.1))
+        self.checkFold(i32(-2), fcvti32(), f32(-2.7))
+        self.checkFold(None, fcvti32(), f32(3e9))
+        self.checkFold(None, fcvti64(), f64(float("inf")))
+        self.checkFold(f32(16777216.), icvtf32(), i32(16777217))
+        self.checkFold(f64(2. ** 63), icvtf64(), i64(2 ** 63 - 1))
+        self.checkFold(f32(1.), itof32(), i32(0x3F800000))
+        self.checkFold(i64(0x4004000000000000), ftoi64(), f64(2.5))
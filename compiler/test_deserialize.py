@@ -0,0 +1,204 @@
+# Copyright 2014, Jay Conrod. All rights reserved.
+#
+# This file is part of Gypsum. Use of this source code is governed by
+# the GPL license that can be found in the LICENSE.txt file.
+
+
+import argparse
+import glob
+import os
+import os.path
+import shutil
+import struct
+import tempfile
+import unittest
+
+from driver import compileFile
+from deserialize import *
+from ir_types import *
+
+
+def makeOptions():
+    return argparse.Namespace(print_tokens=False,
+                              no_layout=False,
+                              print_layout=False,
+                              print_ast=False,
+                              print_scope=False,
+                              print_types=False,
+                              print_ir=False,
+                              codegen_jobs=1,
+                              peephole=frozenset())
+
+
+class TestDeserialize(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def compileToFile(self, sourceFilename):
+        name = os.path.splitext(os.path.basename(sourceFilename))[0]
+        outputFilename = os.path.join(self.dir, name + ".csp")
+        compileFile(sourceFilename, outputFilename, makeOptions())
+        return outputFilename
+
+    def compileSource(self, source):
+        sourceFilename = os.path.join(self.dir, "test.gy")
+        with open(sourceFilename, "w") as f:
+            f.write(source)
+        packageFilename = self.compileToFile(sourceFilename)
+        with open(packageFilename, "rb") as f:
+            return f.read()
+
+    def testRoundTripVmTests(self):
+        testDir = os.path.join(os.path.dirname(__file__), "..", "vm", "test")
+        sourceFilenames = sorted(glob.glob(os.path.join(testDir, "*.gy")))
+        self.assertTrue(len(sourceFilenames) > 0)
+        for sourceFilename in sourceFilenames:
+            packageFilename = self.compileToFile(sourceFilename)
+            checkRoundTrip(packageFilename)
+
+    def testCheckRoundTripMismatch(self):
+        # Encode the length of the first string with an extra byte. The package still
+        # deserializes, but it's serialized again with the shorter encoding.
+        data = bytearray(self.compileSource("def f = \"foo\""))
+        recordCount = sum(struct.unpack_from("<iiii", data, 16))
+        offsets = list(struct.unpack_from("<%dI" % recordCount, data, 36))
+        stringOffset = offsets[0]
+        self.assertEqual(3, data[stringOffset])
+        data[stringOffset:stringOffset + 1] = "\x83\x00"
+        offsets[1:] = [offset + 1 for offset in offsets[1:]]
+        struct.pack_into("<%dI" % recordCount, data, 36, *offsets)
+        packageFilename = os.path.join(self.dir, "mismatch.csp")
+        with open(packageFilename, "wb") as f:
+            f.write(data)
+        self.assertEqual([u"foo"], deserialize(packageFilename).strings)
+        with self.assertRaises(DeserializeException) as cm:
+            checkRoundTrip(packageFilename)
+        self.assertEqual(36 + 4, cm.exception.offset)   # the second index entry
+
+    def testDeserializedDefinitions(self):
+        source = "class Box\n" + \
+                 "  var value: i64 = 0\n" + \
+                 "  def get = value\n" + \
+                 "def id[static T](x: T) = x\n" + \
+                 "def main =\n" + \
+                 "  var s = \"foo\"\n" + \
+                 "  1.5\n"
+        package = Deserializer(self.compileSource(source)).deserialize()
+        self.assertEqual([u"foo"], package.strings)
+        clas = package.classes[0]
+        self.assertEqual(I64Type, clas.fields[0].type)
+        self.assertIn(clas.constructors[0], package.functions)
+        self.assertTrue(any(method in package.functions for method in clas.methods))
+        T = package.typeParameters[0]
+        idFunction = next(f for f in package.functions if f.typeParameters == [T])
+        self.assertEqual([VariableType(T)], idFunction.parameterTypes)
+        mainFunction = package.functions[package.entryFunction]
+        self.assertEqual(1, len(mainFunction.variables))
+        self.assertEqual(F64Type, mainFunction.returnType)
+
+    def testNegativeNumbers(self):
+        data = self.compileSource("def f = -100000")
+        function = Deserializer(data).deserialize().functions[0]
+        operands = [op for block in function.blocks for inst in block.instructions
+                    for op in inst.operands]
+        self.assertIn(-100000, operands)
+
+    def testEmptyFile(self):
+        filename = os.path.join(self.dir, "empty.csp")
+        open(filename, "wb").close()
+        with self.assertRaises(DeserializeException):
+            deserialize(filename)
+
+    def testBadMagic(self):
+        data = self.compileSource("def f = 12")
+        with self.assertRaises(DeserializeException) as cm:
+            Deserializer("xxxx" + data[4:]).deserialize()
+        self.assertEqual(0, cm.exception.offset)
+
+    def testTruncated(self):
+        data = self.compileSource("def f = \"foo\"")
+        for size in xrange(len(data)):
+            with self.assertRaises(DeserializeException):
+                Deserializer(data[:size]).deserialize()
+
+    def testTrailingData(self):
+        data = self.compileSource("def f = 12")
+        with self.assertRaises(DeserializeException):
+            Deserializer(data + "\0").deserialize()
+
+    def testIndexMismatch(self):
+        data = bytearray(self.compileSource("def f = \"foo\""))
+        offset, = struct.unpack_from("<I", data, 36)
+        struct.pack_into("<I", data, 36, offset + 1)
+        with self.assertRaises(DeserializeException):
+            Deserializer(data).deserialize()
+
+    def testUnknownFunctionId(self):
+        data = bytearray(self.compileSource("def f = 12"))
+        struct.pack_into("<i", data, 32, 5)   # entry function
+        with self.assertRaises(DeserializeException):
+            Deserializer(data).deserialize()
+
+
+class TestLazyPackage(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        sourceFilename = os.path.join(self.dir, "test.gy")
+        with open(sourceFilename, "w") as f:
+            f.write("class Box(value: i64)\n" +
+                    "  def get = value\n" +
+                    "def f(box: Box) = box.get\n" +
+                    "def g = \"foo\"\n" +
+                    "def h = \"bar\"\n")
+        self.filename = os.path.join(self.dir, "test.csp")
+        compileFile(sourceFilename, self.filename, makeOptions())
+        self.package = deserialize(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testMatchesDeserialize(self):
+        with LazyPackage(self.filename) as lazyPackage:
+            self.assertEqual(len(self.package.functions), lazyPackage.functionCount)
+            self.assertEqual(len(self.package.classes), lazyPackage.classCount)
+            for id in reversed(xrange(lazyPackage.functionCount)):
+                expected = self.package.functions[id]
+                function = lazyPackage.getFunction(id)
+                self.assertEqual(id, function.id)
+                self.assertEqual(expected.flags, function.flags)
+                self.assertEqual(expected.blocks, function.blocks)
+                self.assertEqual(len(expected.variables), len(function.variables))
+            self.assertEqual(self.package.strings,
+                             [lazyPackage.getString(id) for id in xrange(lazyPackage.stringCount)])
+
+    def testDecodesOnlyRequestedBlocks(self):
+        with LazyPackage(self.filename) as lazyPackage:
+            clas = lazyPackage.getClass(0)
+            function = lazyPackage.getFunction(lazyPackage.functionCount - 1)
+            self.assertIsNotNone(function.blocks)
+            self.assertTrue(len(clas.methods) > 0)
+            self.assertTrue(all(m.blocks is None for m in clas.methods if m.id >= 0))
+            self.assertIs(clas, lazyPackage.getClass(0))
+            self.assertIs(function, lazyPackage.getFunction(function.id))
+            field = clas.fields[-1]
+            self.assertEqual(I64Type, field.type)
+
+    def testIdsOutOfRange(self):
+        with LazyPackage(self.filename) as lazyPackage:
+            with self.assertRaises(IndexError):
+                lazyPackage.getFunction(lazyPackage.functionCount)
+            with self.assertRaises(IndexError):
+                lazyPackage.getClass(-1)
+            with self.assertRaises(IndexError):
+                lazyPackage.getString(lazyPackage.stringCount)
+
+    def testCorruptIndex(self):
+        with open(self.filename, "r+b") as f:
+            f.seek(36 + 4 * len(self.package.strings))
+            f.write(struct.pack("<I", os.path.getsize(self.filename)))
+        with LazyPackage(self.filename) as lazyPackage:
+            with self.assertRaises(DeserializeException):
+                lazyPackage.getFunction(0)
@@ -0,0 +1,139 @@
+# Copyright 2014, Jay Conrod. All rights reserved.
+#
+# This file is part of Gypsum. Use of this source code is governed by
+# the GPL license that can be found in the LICENSE.txt file.
+
+
+import argparse
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+
+from cache import CompileCache
+from driver import *
+
+
+def makeOptions(**kwargs):
+    options = argparse.Namespace(print_tokens=False,
+                                 no_layout=False,
+                                 print_layout=False,
+                                 print_ast=False,
+                                 print_scope=False,
+                                 print_types=False,
+                                 print_ir=False,
+                                 codegen_jobs=1,
+                                 peephole=frozenset())
+    for name, value in kwargs.iteritems():
+        setattr(options, name, value)
+    return options
+
+
+class TestDriver(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def writeSources(self, sources):
+        filenames = []
+        for name, text in sources:
+            filename = os.path.join(self.dir, name)
+            with open(filename, "w") as f:
+                f.write(text)
+            filenames.append(filename)
+        return filenames
+
+    def readOutputs(self, filenames):
+        contents = []
+        for filename in filenames:
+            with open(filename, "rb") as f:
+                contents.append(f.read())
+        return contents
+
+    def testOutputFilenames(self):
+        self.assertEqual(["out.csp", "out.csp"],
+                         outputFilenames(["a.gy", "b.gy"], "out.csp", None))
+        self.assertEqual([os.path.join("out", "a.csp"), os.path.join("out", "b.csp")],
+                         outputFilenames(["a.gy", os.path.join("src", "b.gy")], "out.csp", "out"))
+
+    def testOutputFilenamesConflict(self):
+        with self.assertRaises(ValueError):
+            outputFilenames(["a.gy", os.path.join("src", "a.gy")], "out.csp", "out")
+
+    def testParallelMatchesSequential(self):
+        sources = self.writeSources([("a.gy", "def f(x: i64) = x * 2\n"),
+                                     ("b.gy", "class C\n  var x = 12\n"),
+                                     ("c.gy", "def g = 1\n"),
+                                     ("d.gy", "var y = 3\n")])
+        sequentialDir = os.path.join(self.dir, "sequential")
+        parallelDir = os.path.join(self.dir, "parallel")
+        os.mkdir(sequentialDir)
+        os.mkdir(parallelDir)
+        options = makeOptions()
+        sequentialOutputs = outputFilenames(sources, None, sequentialDir)
+        parallelOutputs = outputFilenames(sources, None, parallelDir)
+        self.assertTrue(compileFiles(sources, sequentialOutputs, options, 1))
+        self.assertTrue(compileFiles(sources, parallelOutputs, options, 3))
+        self.assertEqual(self.readOutputs(sequentialOutputs),
+                         self.readOutputs(parallelOutputs))
+
+    def testParallelReportsErrorsInOrder(self):
+        sources = self.writeSources([("a.gy", "def f = 1\n"),
+                                     ("b.gy", "var = 3\n")])
+        sources.insert(1, os.path.join(self.dir, "missing.gy"))
+        outputs = outputFilenames(sources, None, self.dir)
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            self.assertFalse(compileFiles(sources, outputs, makeOptions(), 2))
+            errors = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertTrue(os.path.exists(outputs[0]))
+        self.assertTrue(errors.index("missing.gy") < errors.index("b.gy"))
+
+    def testStats(self):
+        sources = self.writeSources([("a.gy", "def f(x: i64) = x * 2\n"),
+                                     ("b.gy", "var y = 3\n")])
+        outputs = outputFilenames(sources, None, self.dir)
+        for jobs in [1, 2]:
+            stats = []
+            self.assertTrue(compileFiles(sources, outputs, makeOptions(), jobs, stats))
+            self.assertEqual(sources, [s.sourceFilename for s in stats])
+            phases = stats[0].phases
+            self.assertEqual(["lex", "layout", "parse", "analyzeDeclarations",
+                              "analyzeInheritance", "analyzeTypes", "convertClosures",
+                              "flattenClasses", "compile", "serialize"],
+                             [phase.name for phase in phases])
+            self.assertEqual(18, phases[0].counts["tokens"])
+            self.assertEqual(1, phases[8].counts["irFunctions"])
+            self.assertEqual(os.path.getsize(outputs[0]), phases[9].counts["bytes"])
+            json = stats[0].toJson()
+            self.assertEqual(sum(phase.wallTime for phase in phases),
+                             json["total"]["wallTime"])
+
+    def testCache(self):
+        sources = self.writeSources([("a.gy", "def f(x: i64) = x * 2\n"),
+                                     ("b.gy", "var y = 3\n")])
+        cache = CompileCache(os.path.join(self.dir, "cache"))
+        outputs = outputFilenames(sources, None, self.dir)
+        self.assertTrue(compileFiles(sources, outputs, makeOptions(), 1, cache=cache))
+        expected = self.readOutputs(outputs)
+        for output in outputs:
+            os.remove(output)
+        self.assertTrue(compileFiles(sources, outputs, makeOptions(), 2, cache=cache))
+        self.assertEqual(expected, self.readOutputs(outputs))
+        self.assertEqual((2, 2), (cache.hits, cache.misses))
+
+    def testCacheNotUsedWhenPrinting(self):
+        sources = self.writeSources([("a.gy", "var y = 3\n")])
+        cache = CompileCache(os.path.join(self.dir, "cache"))
+        outputs = outputFilenames(sources, None, self.dir)
+        out = StringIO()
+        compileFile(sources[0], outputs[0], makeOptions(print_ast=True), out, cache=cache)
+        self.assertTrue(out.getvalue())
+        self.assertEqual((0, 0), (cache.hits, cache.misses))
@@ -108,3 +108,41 @@ class TestInheritance(unittest.TestCase):
         info = self.analyzeFromSource(source)
         scope = info.getScope(info.ast.definitions[0])
         self.assertEquals(2, len(scope.getDefinition("typeof").overloads))
+
+    def testDeeplyInheritedDefinitionsAreBound(self):
+        source = "class A\n" + \
+                 "  var x = 12\n" + \
+                 "class B <: A\n" + \
+                 "class C <: B\n" + \
+                 "class D <: C"
+        info = self.analyzeFromSource(source)
+        scope = info.getScope(info.ast.definitions[3])
+        defnInfo = scope.getDefinition("x").getDefnInfo()
+        self.assertIs(info.package.findClass(name="A").fields[0], defnInfo.irDefn)
+        self.assertEquals(3, defnInfo.inheritanceDepth)
+        self.assertEquals([("x", defnInfo)],
+                          [(name, d) for name, d in scope.getBindings() if name == "x"])
+
+    def testIndirectlyInheritedFieldNamesConflict(self):
+        source = "class A\n" + \
+                 "  var x\n" + \
+                 "class B <: A\n" + \
+                 "class C <: B\n" + \
+                 "  var x"
+        self.assertRaises(ScopeException, self.analyzeFromSource, source)
+
+    def testInheritedDefinitionShadowsGlobal(self):
+        source = "var x = 12\n" + \
+                 "class Foo\n" + \
+                 "  var x = 34\n" + \
+                 "class Bar <: Foo\n" + \
+                 "  def f = x"
+        ast = self.parseFromSource(source)
+        info = CompileInfo(ast)
+        analyzeDeclarations(info)
+        fScope = info.getScope(ast.definitions[2].members[0])
+        globalX = info.getDefnInfo(ast.definitions[0].pattern)
+        self.assertIs(globalX, fScope.lookup("x", False, False).getDefnInfo())
+        analyzeInheritance(info)
+        fooX = info.getDefnInfo(ast.definitions[1].members[0].pattern)
+        self.assertIs(fooX.irDefn, fScope.lookup("x", False, False).getDefnInfo().irDefn)
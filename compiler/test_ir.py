@@ -30,6 +30,28 @@ class TestIntermediateRepresentation(unittest.TestCase):
         commonClass = self.A.findCommonBaseClass(self.B)
         self.assertIs(self.base, commonClass)
 
+    def testFindCommonBaseClassWithAncestor(self):
+        C = Class("C", [], [ClassType(self.A)], None, [], [], [], frozenset())
+        self.package.addClass(C)
+        self.assertIs(self.A, C.findCommonBaseClass(self.A))
+        self.assertIs(self.A, self.A.findCommonBaseClass(C))
+        self.assertIs(self.base, C.findCommonBaseClass(self.B))
+        self.assertIs(getRootClass(), C.findCommonBaseClass(getRootClass()))
+
+    def testIsSubclassOf(self):
+        self.assertTrue(self.A.isSubclassOf(self.base))
+        self.assertTrue(self.A.isSubclassOf(getRootClass()))
+        self.assertFalse(self.A.isSubclassOf(self.B))
+        self.assertFalse(self.base.isSubclassOf(self.A))
+        self.assertTrue(getNothingClass().isSubclassOf(self.A))
+        self.assertFalse(self.A.isSubclassOf(getNothingClass()))
+
+    def testHierarchyChangeInvalidatesIndex(self):
+        self.assertFalse(self.A.isSubclassOf(self.B))
+        self.A.supertypes = [ClassType(self.B)]
+        self.assertTrue(self.A.isSubclassOf(self.B))
+        self.assertIs(self.B, self.A.findCommonBaseClass(self.B))
+
     def testFunctionCanCallWithWrongArgCount(self):
         f = Function("f", UnitType, [], [UnitType], None, None, frozenset())
         self.assertFalse(f.canCallWith([], []))
@@ -71,3 +93,16 @@ class TestIntermediateRepresentation(unittest.TestCase):
         f2.clas = self.base
         self.assertFalse(f2.mayOverride(f1))
         self.assertFalse(f1.mayOverride(f2))
+
+    def testFindOrAddString(self):
+        self.assertEqual(0, self.package.findOrAddString(u"foo"))
+        self.assertEqual(1, self.package.findOrAddString(u"bar"))
+        self.assertEqual(0, self.package.findOrAddString(u"foo"))
+        self.assertEqual([u"foo", u"bar"], self.package.strings)
+
+    def testAddStrings(self):
+        self.package.findOrAddString(u"foo")
+        ids = self.package.addStrings([u"bar", u"foo", u"baz", u"bar"])
+        self.assertEqual([1, 0, 2, 1], ids)
+        self.assertEqual([u"foo", u"bar", u"baz"], self.package.strings)
+        self.assertEqual(2, self.package.findOrAddString(u"baz"))
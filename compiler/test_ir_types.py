@@ -4,7 +4,9 @@
 # the GPL license that can be found in the LICENSE.txt file.
 
 
+import gc
 import unittest
+import weakref
 
 from builtins import *
 from ir_types import *
@@ -62,3 +64,40 @@ class TestIrTypes(unittest.TestCase):
         self.assertEquals(a, VariableType(T).substitute([T], [a]))
         self.assertEquals(ClassType(self.P, (a, b)),
                           p.substitute(self.P.typeParameters, [a, b]))
+
+    def testClassTypesAreInterned(self):
+        a = ClassType(self.A)
+        self.assertIs(a, ClassType(self.A, ()))
+        self.assertIs(a, ClassType(self.A, [], frozenset()))
+        self.assertIsNot(a, ClassType(self.B))
+        self.assertIs(ClassType(self.P, (a, a)), ClassType(self.P, [ClassType(self.A), a]))
+        nullable = ClassType(self.A, (), NULLABLE_TYPE_FLAG)
+        self.assertIs(nullable, a.withFlag(NULLABLE_TYPE_FLAG))
+        self.assertIs(a, nullable.withoutFlag(NULLABLE_TYPE_FLAG))
+        self.assertNotEqual(a, nullable)
+
+    def testVariableTypesAreInterned(self):
+        T = TypeParameter("T", ClassType(self.A), ClassType(self.B), frozenset())
+        self.assertIs(VariableType(T), VariableType(T))
+        self.assertIs(VariableType(T, frozenset([NULLABLE_TYPE_FLAG])),
+                      VariableType(T).withFlag(NULLABLE_TYPE_FLAG))
+
+    def testSubtypeAfterSupertypesChange(self):
+        self.assertTrue(ClassType(self.C).isSubtypeOf(ClassType(self.A)))
+        self.C.supertypes = [getRootClassType()]
+        self.assertFalse(ClassType(self.C).isSubtypeOf(ClassType(self.A)))
+
+    def testSubtypeCacheDoesNotKeepTypes(self):
+        D = self.makeClass("D", self.C)
+        a = ClassType(self.A)
+        d = ClassType(D)
+        self.assertTrue(d.isSubtypeOf(a))
+        self.assertTrue(d.isSubtypeOf(ClassType(self.B)))
+        self.assertTrue(ClassType(self.C).isSubtypeOf(a))
+        types = weakref.WeakSet([d, ClassType(self.C)])
+        classRef = weakref.ref(D)
+        del D, d
+        gc.collect()
+        self.assertEqual(0, len(types))
+        self.assertIsNone(classRef())
+        self.assertTrue(a.isSubtypeOf(getRootClassType()))
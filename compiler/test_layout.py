@@ -4,6 +4,7 @@
 # the GPL license that can be found in the LICENSE.txt file.
 
 
+import os.path
 import unittest
 
 from lexer import *
@@ -196,3 +197,90 @@ class TestLayout(unittest.TestCase):
                          "def f =\n" +
                          "  while (a)\n" +
                          "  {}")
+
+    def testIterLayoutIsLazy(self):
+        def rawTokens():
+            for token in lex("(test)", "def f =\n  a\nb"):
+                yield token
+                if token.text == "b":
+                    raise AssertionError("read past the token being checked")
+        layoutTokens = iterLayout(rawTokens())
+        texts = [next(layoutTokens).text for _ in xrange(7)]
+        self.assertEquals(["def", "f", "=", "{", "a", ";", "}"], texts)
+
+    def testIterLayoutMatchesLayout(self):
+        text = "class C\n" + \
+               "  def f =\n" + \
+               "    if (a)\n" + \
+               "      b\n" + \
+               "    else\n" + \
+               "      c\n"
+        expected = [token.text for token in layout(lex("(test)", text))]
+        actual = [token.text for token in iterLayout(iterLex("(test)", text))]
+        self.assertEquals(expected, actual)
+
+    def checkRelayout(self, oldText, start, oldEnd, insertText):
+        newText = oldText[:start] + insertText + oldText[oldEnd:]
+        try:
+            expectedTokens, expectedCheckpoints = layoutWithCheckpoints(lex("(test)", newText))
+        except (LexException, LayoutException):
+            return None
+        oldRawTokens = lex("(test)", oldText)
+        oldTokens, oldCheckpoints = layoutWithCheckpoints(oldRawTokens)
+        rawTokens, splice = relex("(test)", oldText, oldRawTokens, newText,
+                                  start, oldEnd, start + len(insertText))
+        tokens, checkpoints = relayout(rawTokens, splice, oldTokens, oldCheckpoints)
+        self.assertEquals([(t.text, t.tag, t.location) for t in expectedTokens],
+                          [(t.text, t.tag, t.location) for t in tokens])
+        self.assertEquals([(c.rawIndex, c.outIndex) for c in expectedCheckpoints],
+                          [(c.rawIndex, c.outIndex) for c in checkpoints])
+        return oldTokens, tokens
+
+    def testLayoutWithCheckpoints(self):
+        text = "def f =\n" + \
+               "  a\n" + \
+               "var x = 1\n"
+        tokens, checkpoints = layoutWithCheckpoints(lex("(test)", text))
+        self.assertEquals([token.text for token in layout(lex("(test)", text))],
+                          [token.text for token in tokens])
+        self.assertEquals([(0, 0), (9, 5)],
+                          [(c.rawIndex, c.outIndex) for c in checkpoints])
+
+    def testRelayoutInBlock(self):
+        text = "def f =\n" + \
+               "  a\n" + \
+               "var x = 1\n" + \
+               "var y = 2\n"
+        oldTokens, tokens = self.checkRelayout(text, 11, 11, "b")
+        self.assertIs(oldTokens[-1], tokens[-1])
+
+    def testRelayoutOpensBlock(self):
+        text = "def f = a\n" + \
+               "  b\n" + \
+               "var x = 1\n"
+        self.checkRelayout(text, 8, 10, "\n  c\n")
+
+    def testRelayoutDedentsRest(self):
+        text = "class C\n" + \
+               "  def f = 1\n" + \
+               "  def g = 2\n" + \
+               "var x = 1\n"
+        self.checkRelayout(text, 0, 8, "")
+        self.checkRelayout(text, 0, 0, "  ")
+
+    def testRelayoutAddLine(self):
+        text = "var x = 1\n" + \
+               "var y = 2\n"
+        self.checkRelayout(text, 10, 10, "var z = 3\n")
+        self.checkRelayout(text, 0, 10, "")
+
+    def testRelayoutExamples(self):
+        examplesDir = os.path.join(os.path.dirname(__file__), "..", "examples")
+        for fileName in sorted(os.listdir(examplesDir)):
+            if not fileName.endswith(".gy"):
+                continue
+            with open(os.path.join(examplesDir, fileName)) as sourceFile:
+                text = sourceFile.read()
+            for start in xrange(0, len(text), 257):
+                self.checkRelayout(text, start, start, "\n")
+                self.checkRelayout(text, start, start, " ")
@@ -4,26 +4,29 @@
 # the GPL license that can be found in the LICENSE.txt file.
 
 
+import os.path
 import unittest
 
 from lexer import *
 from token import *
 
 class TestLexer(unittest.TestCase):
+    engine = MASTER_REGEX_ENGINE
+
     def checkTags(self, expected, text):
-        tokens = lex("test", text)
+        tokens = lex("test", text, self.engine)
         tags = [t.tag for t in tokens]
         self.assertEquals(len(expected), len(tags))
         for i in range(len(expected)):
             self.assertIs(expected[i], tags[i])
 
     def checkText(self, expected, text):
-        tokens = lex("test", text)
+        tokens = lex("test", text, self.engine)
         texts = [t.text for t in tokens]
         self.assertEqual(expected, texts)
 
     def checkTag(self, expected, text):
-        tokens = lex("test", text)
+        tokens = lex("test", text, self.engine)
         self.assertEqual(1, len(tokens))
         self.assertIs(expected, tokens[0].tag)
 
@@ -85,10 +88,127 @@ class TestLexer(unittest.TestCase):
 
     def testLocation(self):
         text = "a\n b"
-        tokens = lex("test", text)
+        tokens = lex("test", text, self.engine)
         self.assertEqual(4, len(tokens))
         self.assertEqual(Location("test", 2, 2, 2, 3), tokens[-1].location)
 
     def testError(self):
         with self.assertRaises(LexException):
-            lex("test", "`")
+            lex("test", "`", self.engine)
+
+    def testErrorLocation(self):
+        try:
+            lex("test", "a\n b `", self.engine)
+            self.fail("expected LexException")
+        except LexException as e:
+            self.assertEqual(Location("test", 2, 4, 2, 5), e.location)
+            self.assertEqual("`", e.char)
+
+
+class TestLexerLongestMatch(TestLexer):
+    engine = LONGEST_MATCH_ENGINE
+
+
+class TestLexerEngines(unittest.TestCase):
+    def checkSameTokens(self, text):
+        expected = lex("test", text, LONGEST_MATCH_ENGINE)
+        actual = lex("test", text, MASTER_REGEX_ENGINE)
+        self.assertEqual([(t.text, t.tag, t.location) for t in expected],
+                         [(t.text, t.tag, t.location) for t in actual])
+
+    def testKeywordsAndSymbols(self):
+        self.checkSameTokens("var variable _ __ i8 i8x public publicity class-name")
+
+    def testOperatorsAndReserved(self):
+        self.checkSameTokens("= == => =>> <: <:< : :: >: // comment\n/ -1 - 1 +.5 +")
+
+    def testNumbers(self):
+        self.checkSameTokens("0 0x1f 0b101 0e5 1.e5 1.2f32 12i8 -0xAbi32 .5 . 1f64")
+
+    def testEngineNamesAreCompared(self):
+        engine = "".join(["longest", "-match"])
+        self.assertIsNot(LONGEST_MATCH_ENGINE, engine)
+        tokens = lex("test", "var x = 1\n", engine)
+        self.assertEqual(["var", " ", "x", " ", "=", " ", "1", "\n"], [t.text for t in tokens])
+
+    def testUnknownEngine(self):
+        with self.assertRaises(ValueError):
+            lex("test", "var x = 1\n", "bogus")
+        with self.assertRaises(ValueError):
+            relex("test", "x", lex("test", "x"), "xy", 1, 1, 2, "bogus")
+
+    def testExamples(self):
+        examplesDir = os.path.join(os.path.dirname(__file__), "..", "examples")
+        for fileName in os.listdir(examplesDir):
+            if fileName.endswith(".gy"):
+                with open(os.path.join(examplesDir, fileName)) as sourceFile:
+                    self.checkSameTokens(sourceFile.read())
+
+
+class TestRelex(unittest.TestCase):
+    def tokenTuples(self, tokens):
+        return [(t.text, t.tag, t.location) for t in tokens]
+
+    def checkRelex(self, oldText, start, oldEnd, insertText):
+        newText = oldText[:start] + insertText + oldText[oldEnd:]
+        oldTokens = lex("test", oldText)
+        try:
+            expected = lex("test", newText)
+        except LexException:
+            with self.assertRaises(LexException):
+                relex("test", oldText, oldTokens, newText, start, oldEnd, start + len(insertText))
+            return None
+        tokens, splice = relex("test", oldText, oldTokens, newText,
+                               start, oldEnd, start + len(insertText))
+        self.assertEqual(self.tokenTuples(expected), self.tokenTuples(tokens))
+        return oldTokens, tokens, splice
+
+    def testInsertInToken(self):
+        oldTokens, tokens, splice = self.checkRelex("var x = 1\nvar yz = 2\nvar w\n",
+                                                    16, 16, "q")
+        self.assertEqual(8, splice.first)
+        self.assertEqual(11, splice.oldStop)
+        self.assertEqual(11, splice.newStop)
+        self.assertIs(oldTokens[-1], tokens[-1])
+
+    def testMergeTokens(self):
+        self.checkRelex("var x = 12 + 3\n", 10, 13, "")
+
+    def testNumberLookahead(self):
+        self.checkRelex("x = 1\ny = 12\n", 12, 12, ".5")
+        self.checkRelex("x = 1\ny = 0\n", 11, 11, "x1f")
+
+    def testInsertNewline(self):
+        oldTokens, tokens, splice = self.checkRelex("a b\nc d\ne f\n", 5, 5, "\n")
+        self.assertEqual(1, splice.shift.lineDelta)
+        self.assertEqual(-1, splice.shift.columnDelta)
+        self.assertEqual(4, tokens[-1].location.beginLine)
+
+    def testDeleteLine(self):
+        self.checkRelex("a\nb\nc\n", 2, 4, "")
+
+    def testEditAtEnd(self):
+        self.checkRelex("a\nb", 3, 3, "cd")
+        self.checkRelex("a\nb\n", 4, 4, "c")
+
+    def testEditFirstLine(self):
+        self.checkRelex("a\nb\n", 0, 0, "// ")
+
+    def testStringWithNewline(self):
+        self.checkRelex('x = "a\nb"\ny = 1\n', 16, 16, "2")
+
+    def testCommentToEndOfLine(self):
+        self.checkRelex("a / b\nc\n", 3, 3, "/")
+
+    def testExamples(self):
+        # Insert and delete a character at several places in each example. Every result must
+        # match lexing from scratch.
+        examplesDir = os.path.join(os.path.dirname(__file__), "..", "examples")
+        for fileName in sorted(os.listdir(examplesDir)):
+            if not fileName.endswith(".gy"):
+                continue
+            with open(os.path.join(examplesDir, fileName)) as sourceFile:
+                text = sourceFile.read()
+            for start in xrange(0, len(text), 151):
+                self.checkRelex(text, start, start, "x")
+                self.checkRelex(text, start, min(len(text), start + 1), "")
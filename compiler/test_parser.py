@@ -32,6 +32,155 @@ class TestParser(unittest.TestCase):
     def testModuleEmpty(self):
         self.checkParse(AstModule([]), module(), "")
 
+    def testParseStream(self):
+        text = "var x = 12\n" + \
+               "def f(y: i64) =\n" + \
+               "  y + x\n" + \
+               "class C\n" + \
+               "  var z = f(1)\n"
+        expected = parse("test", layout(lex("test", text)))
+        actual = parse("test", iterLayout(iterLex("test", text)))
+        self.assertEqual(expected, actual)
+
+    def testParseMemo(self):
+        text = "def f(x: i64) =\n" + \
+               "  if (x == 0)\n" + \
+               "    (1 + x) * (2 - x)\n" + \
+               "  else\n" + \
+               "    f(x - 1)\n"
+        memo = MemoTable()
+        expected = parse("test", layout(lex("test", text)))
+        actual = parse("test", layout(lex("test", text)), memo)
+        self.assertEqual(expected, actual)
+        self.assertTrue(memo.misses > 0)
+
+    def testParseStreamError(self):
+        with self.assertRaises(ParseException):
+            parse("test", iterLayout(iterLex("test", "var x = 12\nvar = 3\n")))
+
+    def testGrammarIsCached(self):
+        self.assertIs(module(), module())
+        self.assertIs(expression(), expression())
+
+    def testGrammarCacheCleared(self):
+        before = module()
+        clearGrammarCache()
+        after = module()
+        self.assertIsNot(before, after)
+        self.assertIs(after, module())
+
+    def testLazyResolvesToCachedParser(self):
+        expected = AstAssignExpression(AstVariableExpression("x"),
+                                       AstAssignExpression(AstVariableExpression("y"),
+                                                           AstVariableExpression("z")))
+        self.checkParse(expected, expression(), "x = y = z")
+        self.checkParse(expected, expression(), "x = y = z")
+        lazy = expression().next.parser.parsers[1]
+        self.assertIsInstance(lazy, Lazy)
+        self.assertIs(expression(), lazy.parser)
+
+    def testParseFromThreads(self):
+        import threading
+        text = "def f(x: i64) = x * 2\n" + \
+               "var y = f(3) + f(4)\n"
+        expected = parse("test", layout(lex("test", text)))
+        clearGrammarCache()
+        results = []
+        def parseInThread():
+            results.append(parse("test", layout(lex("test", text))))
+        threads = [threading.Thread(target=parseInThread) for _ in xrange(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([expected] * 8, results)
+
+    # Incremental parsing
+    def parseDefinitionsFromSource(self, text):
+        return parseDefinitions("test", layout(lex("test", text)))
+
+    def reparseFromSource(self, previous, text):
+        return reparse("test", layout(lex("test", text)), previous)
+
+    def testParseDefinitions(self):
+        text = "var x = 12\n" + \
+               "def f(y: i64) =\n" + \
+               "  y + x\n" + \
+               "class C\n" + \
+               "  var z = f(1)\n"
+        result = self.parseDefinitionsFromSource(text)
+        expected = parse("test", layout(lex("test", text)))
+        self.assertEqual(expected, result.ast)
+        self.assertEqual([(0, 5), (5, 20), (20, 33)], result.spans)
+        self.assertEqual(addNodeIds(expected), result.nextId)
+
+    def testReparseReusesUnchangedDefinitions(self):
+        previous = self.parseDefinitionsFromSource("var x = 1\n" +
+                                                   "var y = 2\n" +
+                                                   "var z = 3\n")
+        result = self.reparseFromSource(previous, "var x = 1\n" +
+                                                  "var y = 20 + 3\n" +
+                                                  "var z = 3\n")
+        expected = parse("test", layout(lex("test", "var x = 1\n" +
+                                                    "var y = 20 + 3\n" +
+                                                    "var z = 3\n")))
+        addNodeIds(result.ast)
+        self.assertEqual(expected, result.ast)
+        self.assertIs(previous.ast.definitions[0], result.ast.definitions[0])
+        self.assertIs(previous.ast.definitions[2], result.ast.definitions[2])
+        self.assertIsNot(previous.ast.definitions[1], result.ast.definitions[1])
+        self.assertEqual([(0, 5), (5, 12), (12, 17)], result.spans)
+
+    def testReparseIdsAreStable(self):
+        previous = self.parseDefinitionsFromSource("var x = 1\n" +
+                                                   "var y = 2\n" +
+                                                   "var z = 3\n")
+        oldIds = [d.id for d in previous.ast.definitions]
+        result = self.reparseFromSource(previous, "var x = 1\n" +
+                                                  "var y = f(2)\n" +
+                                                  "var z = 3\n")
+        newIds = [d.id for d in result.ast.definitions]
+        self.assertEqual(oldIds[0], newIds[0])
+        self.assertEqual(oldIds[2], newIds[2])
+        self.assertEqual(previous.nextId, newIds[1])
+        self.assertEqual(previous.ast.id, result.ast.id)
+        self.assertTrue(result.nextId > previous.nextId)
+
+    def testReparseAddAndRemoveDefinitions(self):
+        previous = self.parseDefinitionsFromSource("var x = 1\n" +
+                                                   "var z = 3\n")
+        text = "var x = 1\n" + \
+               "def f = 2\n" + \
+               "var z = 3\n"
+        result = self.reparseFromSource(previous, text)
+        self.assertEqual(3, len(result.ast.definitions))
+        self.assertIs(previous.ast.definitions[1], result.ast.definitions[2])
+        self.assertEqual(self.parseDefinitionsFromSource(text).spans, result.spans)
+        result = self.reparseFromSource(result, "var x = 1\n" +
+                                                "var z = 3\n")
+        self.assertEqual(2, len(result.ast.definitions))
+        self.assertIs(previous.ast.definitions[0], result.ast.definitions[0])
+        self.assertIs(previous.ast.definitions[1], result.ast.definitions[1])
+        self.assertEqual([(0, 5), (5, 10)], result.spans)
+
+    def testReparseUnchanged(self):
+        text = "var x = 1\n"
+        previous = self.parseDefinitionsFromSource(text)
+        result = self.reparseFromSource(previous, text)
+        self.assertIs(previous.ast.definitions[0], result.ast.definitions[0])
+        self.assertEqual(previous.nextId, result.nextId)
+
+    def testReparseError(self):
+        previous = self.parseDefinitionsFromSource("var x = 1\n" +
+                                                   "var y = 2\n")
+        text = "var x = 1\n" + \
+               "var = 2\n"
+        with self.assertRaises(ParseException) as expected:
+            parse("test", layout(lex("test", text)))
+        with self.assertRaises(ParseException) as actual:
+            self.reparseFromSource(previous, text)
+        self.assertEqual(str(expected.exception), str(actual.exception))
+
     # Definitions
     def testVarDefnEmpty(self):
         self.checkParse(AstVariableDefinition([], AstVariablePattern("x", None), None),
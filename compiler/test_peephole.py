@@ -0,0 +1,140 @@
+# Copyright 2014, Jay Conrod. All rights reserved.
+#
+# This file is part of Gypsum. Use of this source code is governed by
+# the GPL license that can be found in the LICENSE.txt file.
+
+
+import unittest
+
+from builtins import *
+from ir import *
+from ir_instructions import *
+from ir_types import *
+from peephole import *
+
+
+class TestPeephole(unittest.TestCase):
+    def makeFunction(self, blocks):
+        blocks = [BasicBlock(id, instructions) for id, instructions in enumerate(blocks)]
+        return Function("f", UnitType, [], [], [], blocks, frozenset())
+
+    def checkOptimize(self, expected, blocks, expectedCounts, rules=RULES):
+        function = self.makeFunction(blocks)
+        counts = {}
+        optimize(function, rules, counts)
+        self.assertEqual(self.makeFunction(expected).blocks, function.blocks)
+        self.assertEqual([block.id for block in function.blocks], range(len(expected)))
+        self.assertEqual(expectedCounts, counts)
+
+    def testParseRules(self):
+        self.assertEqual(frozenset(RULES), parseRules("all"))
+        self.assertEqual(frozenset(), parseRules("none"))
+        self.assertEqual(frozenset([PUSH_DROP, MERGE_BLOCKS]),
+                         parseRules("pushDrop, mergeBlocks"))
+        with self.assertRaises(ValueError):
+            parseRules("pushDrop,bogus")
+
+    def testPushDrop(self):
+        self.checkOptimize([[ldlocal(0), ret()]],
+                           [[ldlocal(0), i64(12), drop(), unit(), dup(), drop(), drop(),
+                             ret()]],
+                           {PUSH_DROP: 3})
+
+    def testDropAfterCallIsKept(self):
+        blocks = [[callg(0, 1), drop(), unit(), ret()]]
+        self.checkOptimize(blocks, blocks, {})
+
+    def testLoadStore(self):
+        self.checkOptimize([[ldlocal(-2), stlocal(-1), unit(), ret()]],
+                           [[ldlocal(-1), stlocal(-1), ldlocal(-2), stlocal(-1), unit(), ret()]],
+                           {LOAD_STORE: 1})
+
+    def testSwapSwap(self):
+        self.checkOptimize([[ldlocal(0), ldlocal(1), swap(), drop(), ret()]],
+                           [[ldlocal(0), ldlocal(1), swap(), swap(), swap(), drop(), ret()]],
+                           {SWAP_SWAP: 1})
+
+    def testNotBranch(self):
+        self.checkOptimize([[ldlocal(0), branchif(2, 1)],
+                            [unit(), ret()],
+                            [unit(), throw()]],
+                           [[ldlocal(0), notb(), branchif(1, 2)],
+                            [unit(), ret()],
+                            [unit(), throw()]],
+                           {NOT_BRANCH: 1})
+
+    def testConstantBranch(self):
+        self.checkOptimize([[unit(), throw()]],
+                           [[false(), branchif(1, 2)],
+                            [unit(), ret()],
+                            [unit(), throw()]],
+                           {CONSTANT_BRANCH: 1, MERGE_BLOCKS: 1})
+
+    def testConstantFold(self):
+        self.checkOptimize([[i64(3), ldlocal(0), addi64(), ret()]],
+                           [[i64(1), i64(2), addi64(), ldlocal(0), addi64(), ret()]],
+                           {CONSTANT_FOLD: 1})
+
+    def testConstantFoldExposesConstantBranch(self):
+        self.checkOptimize([[unit(), ret()]],
+                           [[i64(1), i64(2), lti64(), notb(), branchif(1, 2)],
+                            [unit(), throw()],
+                            [unit(), ret()]],
+                           {CONSTANT_FOLD: 2, CONSTANT_BRANCH: 1, MERGE_BLOCKS: 1})
+
+    def testConstantPropagation(self):
+        self.checkOptimize([[i64(2), stlocal(-1), i64(4), stlocal(-2),
+                             ldlocal(0), stlocal(-1), ldlocal(-1), ret()]],
+                           [[i64(2), stlocal(-1), ldlocal(-1), ldlocal(-1), muli64(), stlocal(-2),
+                             ldlocal(0), stlocal(-1), ldlocal(-1), ret()]],
+                           {CONSTANT_PROPAGATION: 2, CONSTANT_FOLD: 1})
+
+    def testConstantPropagationStopsAtBlocks(self):
+        blocks = [[i64(2), stlocal(-1), ldlocal(0), branchif(1, 2)],
+                  [ldlocal(-1), ret()],
+                  [unit(), ret()]]
+        self.checkOptimize(blocks, blocks, {})
+
+    def testThreadBranch(self):
+        self.checkOptimize([[ldlocal(0), branchif(1, 2)],
+                            [unit(), ret()],
+                            [unit(), throw()]],
+                           [[ldlocal(0), branchif(1, 2)],
+                            [branch(3)],
+                            [branch(4)],
+                            [unit(), ret()],
+                            [unit(), throw()]],
+                           {THREAD_BRANCH: 2})
+
+    def testThreadBranchLoop(self):
+        blocks = [[branch(1)], [branch(2)], [branch(1)]]
+        self.checkOptimize([[branch(1)], [branch(2)], [branch(1)]], blocks, {},
+                           rules=[THREAD_BRANCH])
+
+    def testMergeBlocks(self):
+        self.checkOptimize([[ldlocal(0), branchif(1, 2)],
+                            [i64(1), branch(3)],
+                            [i64(2), branch(3)],
+                            [ldlocal(1), addi64(), ret()]],
+                           [[ldlocal(0), branchif(1, 2)],
+                            [i64(1), branch(3)],
+                            [i64(2), branch(3)],
+                            [ldlocal(1), branch(4)],
+                            [addi64(), ret()]],
+                           {MERGE_BLOCKS: 1})
+
+    def testMergeExposesPushDrop(self):
+        self.checkOptimize([[unit(), ret()]],
+                           [[i64(1), branch(1)],
+                            [drop(), unit(), ret()]],
+                           {MERGE_BLOCKS: 1, PUSH_DROP: 1})
+
+    def testLoopHeaderIsNotMerged(self):
+        blocks = [[branch(1)],
+                  [ldlocal(0), branchif(1, 2)],
+                  [unit(), ret()]]
+        self.checkOptimize(blocks, blocks, {}, rules=[MERGE_BLOCKS])
+
+    def testDisabledRules(self):
+        blocks = [[i64(1), drop(), notb(), branchif(1, 1)], [branch(2)], [unit(), ret()]]
+        self.checkOptimize(blocks, blocks, {}, rules=[])
@@ -0,0 +1,49 @@
+# Copyright 2014, Jay Conrod. All rights reserved.
+#
+# This file is part of Gypsum. Use of this source code is governed by
+# the GPL license that can be found in the LICENSE.txt file.
+
+
+import struct
+import unittest
+
+from builtins import *
+from ir import *
+from serialize import Serializer, _encodeVbn, _MIN_TABLE_VBN, _MAX_TABLE_VBN
+
+
+class TestSerialize(unittest.TestCase):
+    def encode(self, value):
+        buf = bytearray()
+        Serializer(Package()).encodeVbn(value, buf)
+        return bytes(buf)
+
+    def testEncodeSmallVbn(self):
+        self.assertEqual("\x00", self.encode(0))
+        self.assertEqual("\x01", self.encode(1))
+        self.assertEqual("\x7f", self.encode(-1))
+        self.assertEqual("\xc0\x00", self.encode(64))
+        self.assertEqual("\xbf\x7f", self.encode(-65))
+
+    def testEncodeVbnAtTableBounds(self):
+        for value in (_MIN_TABLE_VBN - 1, _MIN_TABLE_VBN, _MAX_TABLE_VBN - 1, _MAX_TABLE_VBN,
+                      1 << 40, -(1 << 40)):
+            self.assertEqual(_encodeVbn(value), self.encode(value))
+
+    def testHeaderCounts(self):
+        package = Package()
+        package.findOrAddString(u"foo")
+        serializer = Serializer(package)
+        serializer.writeHeader()
+        self.assertEqual("spkg", bytes(serializer.buf[:4]))
+        self.assertEqual(36, len(serializer.buf))
+        self.assertEqual((1, 0, 0, 0, -1), struct.unpack_from("<iiiii", serializer.buf, 16))
+
+    def testIndex(self):
+        package = Package()
+        package.findOrAddString(u"foo")
+        package.findOrAddString(u"barbaz")
+        serializer = Serializer(package)
+        serializer.serialize()
+        self.assertEqual((44, 49), struct.unpack_from("<II", serializer.buf, 36))
+        self.assertEqual("\x03\x03foo\x06\x06barbaz", bytes(serializer.buf[44:]))
@@ -561,6 +561,20 @@ class TestTypeAnalysis(unittest.TestCase):
         self.assertEquals(len(fooClass.methods), len(barClass.methods))
         self.assertIs(barClass, barClass.methods[-1].clas)
 
+    def testOverrideInDeepHierarchy(self):
+        source = "class A\n" + \
+                 "  def m = 12\n" + \
+                 "class B <: A\n" + \
+                 "class C <: B\n" + \
+                 "  def m = 34\n" + \
+                 "class D <: C\n" + \
+                 "def f(d: D) = d.m"
+        info = self.analyzeFromSource(source)
+        aClass = info.package.findClass(name="A")
+        cClass = info.package.findClass(name="C")
+        self.assertIs(aClass.methods[-1], cClass.methods[-1].override)
+        self.assertEquals(I64Type, info.package.findFunction(name="f").returnType)
+
     def testOverrideCovariantParameters(self):
         source = "class A\n" + \
                  "class B <: A\n" + \
@@ -650,6 +664,24 @@ class TestTypeAnalysis(unittest.TestCase):
         self.assertEquals(I32Type, info.getType(statements[0]))
         self.assertEquals(F32Type, info.getType(statements[1]))
 
+    def testOverloadsWithDifferentArity(self):
+        source = "def f = 1i8\n" + \
+                 "def f(x: i32) = 2i32 * x\n" + \
+                 "def f(x: f32) = 2.f32 * x\n" + \
+                 "def f(x: i32, y: i32) = 3i64\n" + \
+                 "def g =\n" + \
+                 "  f(1i32)\n" + \
+                 "  f(1f32)\n" + \
+                 "  f(1i32)\n" + \
+                 "  f(1i32, 2i32)\n" + \
+                 "  f\n"
+        info = self.analyzeFromSource(source)
+        statements = info.ast.definitions[4].body.statements
+        self.assertEquals([I32Type, F32Type, I32Type, I64Type, I8Type],
+                          [info.getType(stmt) for stmt in statements])
+        self.assertIs(info.getUseInfo(statements[0]).defnInfo,
+                      info.getUseInfo(statements[2]).defnInfo)
+
     def testOverloadWithTypeParameter(self):
         source = "def f[static T] = {}\n" + \
                  "def f = {}\n" + \
@@ -0,0 +1,71 @@
+# Copyright 2014, Jay Conrod. All rights reserved.
+#
+# This file is part of Gypsum. Use of this source code is governed by
+# the GPL license that can be found in the LICENSE.txt file.
+
+
+import unittest
+
+from visitor import *
+
+
+class Foo(object):
+    pass
+
+
+class Bar(object):
+    pass
+
+
+class NameVisitor(Visitor):
+    def visitFoo(self, obj, suffix=""):
+        return "foo" + suffix
+
+    def visitDefault(self, obj, suffix=""):
+        return "default" + suffix
+
+
+class HookVisitor(NameVisitor):
+    def __init__(self):
+        self.events = []
+
+    def preVisit(self, obj, *args):
+        self.events.append("pre")
+
+    def postVisit(self, obj, *args):
+        self.events.append("post")
+
+    def handleResult(self, obj, result, *args):
+        self.events.append(result)
+        return result.upper()
+
+
+class OverrideVisitor(NameVisitor):
+    def visitBar(self, obj, suffix=""):
+        return "bar" + suffix
+
+
+class TestVisitor(unittest.TestCase):
+    def testDispatch(self):
+        visitor = NameVisitor()
+        self.assertEqual("foo", visitor.visit(Foo()))
+        self.assertEqual("default", visitor.visit(Bar()))
+        self.assertEqual("foo!", visitor.visit(Foo(), "!"))
+
+    def testHooks(self):
+        visitor = HookVisitor()
+        self.assertEqual("FOO", visitor.visit(Foo()))
+        self.assertEqual(["pre", "foo", "post"], visitor.events)
+
+    def testSubclassesDispatchSeparately(self):
+        self.assertEqual("default", NameVisitor().visit(Bar()))
+        self.assertEqual("bar", OverrideVisitor().visit(Bar()))
+        self.assertEqual("default", NameVisitor().visit(Bar()))
+
+    def testClearDispatchCache(self):
+        class LateVisitor(NameVisitor):
+            pass
+        self.assertEqual("default", LateVisitor().visit(Bar()))
+        LateVisitor.visitBar = lambda self, obj: "late"
+        clearDispatchCache()
+        self.assertEqual("late", LateVisitor().visit(Bar()))
@@ -73,3 +73,81 @@ class Location:
                         self.beginColumn, \
                         other.endLine, \
                         other.endColumn)
+
+
+class LocationShift(object):
+    """Moves the locations of tokens which follow an edit.
+
+    Tokens beginning on line `line` at or after `column` are moved by both deltas. Tokens on
+    later lines are only moved by lineDelta. Tokens which don't move are returned as they are,
+    so nothing is copied after the edited line if the number of lines didn't change.
+
+    Moved tokens and locations are remembered, so raw tokens and the layout tokens which
+    share them are moved to the same new objects."""
+
+    def __init__(self, line, column, lineDelta, columnDelta):
+        self.line = line
+        self.column = column
+        self.lineDelta = lineDelta
+        self.columnDelta = columnDelta
+        self.shiftedTokens = {}
+        self.shiftedLocations = {}
+
+    def isIdentity(self):
+        return self.lineDelta == 0 and self.columnDelta == 0
+
+    def shiftLocation(self, loc):
+        # Entries keep the original object, so its id can't be reused while it's cached.
+        entry = self.shiftedLocations.get(id(loc))
+        if entry is None:
+            entry = (loc, self.moveLocation(loc))
+            self.shiftedLocations[id(loc)] = entry
+        return entry[1]
+
+    def shiftToken(self, token):
+        entry = self.shiftedTokens.get(id(token))
+        if entry is None:
+            entry = (token, Token(token.text, token.tag, self.shiftLocation(token.location)))
+            self.shiftedTokens[id(token)] = entry
+        return entry[1]
+
+    def moveLocation(self, loc):
+        if loc.beginLine == self.line:
+            beginColumn = loc.beginColumn + self.columnDelta
+        else:
+            beginColumn = loc.beginColumn
+        if loc.endLine == self.line:
+            endColumn = loc.endColumn + self.columnDelta
+        else:
+            endColumn = loc.endColumn
+        return Location(loc.filename,
+                        loc.beginLine + self.lineDelta, beginColumn,
+                        loc.endLine + self.lineDelta, endColumn)
+
+    def shiftTokens(self, tokens):
+        """Returns a list of tokens with shifted locations. Tokens must follow the edit."""
+        if self.isIdentity():
+            return list(tokens)
+        shifted = []
+        for i, token in enumerate(tokens):
+            if self.lineDelta == 0 and token.location.beginLine > self.line:
+                shifted.extend(tokens[i:])
+                break
+            shifted.append(self.shiftToken(token))
+        return shifted
+
+
+class TokenSplice(object):
+    """Describes how a token list changed after an edit.
+
+    Tokens [first, oldStop) of the old list were replaced by tokens [first, newStop) of the new
+    list. Tokens after that were moved by shift."""
+
+    def __init__(self, first, oldStop, newStop, shift):
+        self.first = first
+        self.oldStop = oldStop
+        self.newStop = newStop
+        self.shift = shift
+
+    def __repr__(self):
+        return "TokenSplice(%d, %d, %d)" % (self.first, self.oldStop, self.newStop)
@@ -5,17 +5,37 @@
 
 
 class Visitor(object):
+    """Calls a method named after the class of each object visited.
+
+    For an object of class Foo, visit calls visitFoo if the visitor has it, or visitDefault
+    otherwise. preVisit, handleResult, and postVisit are called around it.
+
+    Looking up methods by name on every visit is slow, so the method for each class of object
+    is looked up once per visitor class and remembered. Hooks which aren't overridden are not
+    called at all. Because of this, methods must be defined on the visitor class, not
+    assigned to instances, and a class must not be changed after it has visited something
+    (or clearDispatchCache must be called)."""
+
     def visit(self, obj, *args):
-        self.preVisit(obj, *args)
-        className = obj.__class__.__name__
-        methodName = self.getMethodName(className)
-        if hasattr(self, methodName):
-            result = getattr(self, methodName)(obj, *args)
-        else:
-            result = self.visitDefault(obj, *args)
-
-        result = self.handleResult(obj, result, *args)
-        self.postVisit(obj, *args)
+        try:
+            table = _dispatchTables[self.__class__]
+        except KeyError:
+            table = _DispatchTable(self.__class__)
+            _dispatchTables[self.__class__] = table
+        try:
+            method = table[obj.__class__]
+        except KeyError:
+            method = table.addMethod(self, obj.__class__)
+        if not table.hasHooks:
+            return method(self, obj, *args)
+
+        if table.hasPreVisit:
+            self.preVisit(obj, *args)
+        result = method(self, obj, *args)
+        if table.hasHandleResult:
+            result = self.handleResult(obj, result, *args)
+        if table.hasPostVisit:
+            self.postVisit(obj, *args)
         return result
 
     def getMethodName(self, className):
@@ -32,3 +52,35 @@ class Visitor(object):
 
     def handleResult(self, obj, result, *args):
         return result
+
+
+def clearDispatchCache():
+    """Forgets the methods looked up by visitors, so changes to visitor classes take effect."""
+    _dispatchTables.clear()
+
+
+class _DispatchTable(dict):
+    """Maps classes of visited objects to unbound methods of one visitor class."""
+
+    def __init__(self, visitorClass):
+        super(_DispatchTable, self).__init__()
+        self.visitorClass = visitorClass
+        self.hasPreVisit = _isOverridden(visitorClass, "preVisit")
+        self.hasPostVisit = _isOverridden(visitorClass, "postVisit")
+        self.hasHandleResult = _isOverridden(visitorClass, "handleResult")
+        self.hasHooks = self.hasPreVisit or self.hasPostVisit or self.hasHandleResult
+
+    def addMethod(self, visitor, objClass):
+        methodName = visitor.getMethodName(objClass.__name__)
+        method = getattr(self.visitorClass, methodName, None)
+        if method is None:
+            method = self.visitorClass.visitDefault
+        self[objClass] = method.__func__
+        return method.__func__
+
+
+def _isOverridden(visitorClass, name):
+    return getattr(visitorClass, name).__func__ is not Visitor.__dict__[name]
+
+
+_dispatchTables = {}
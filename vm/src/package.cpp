@@ -59,6 +59,7 @@ class PackageLoader {
   Local<Field> readField();
   void readTypeParameter(const Local<TypeParameter>& typeParam);
   Local<Type> readType();
+  void checkRecordOffset(u32 offset);
   template <typename T>
   T readValue();
   length_t readLength();
@@ -173,7 +174,7 @@ Local<Package> PackageLoader::load() {
       throw Error("package file is corrupt");
     auto majorVersion = readValue<u16>();
     auto minorVersion = readValue<u16>();
-    if (majorVersion != 0 || minorVersion != 7)
+    if (majorVersion != 0 || minorVersion != 8)
       throw Error("package file has wrong format version");
 
     package_ = handleScope.escape(*Package::create(heap()));
@@ -212,19 +213,33 @@ Local<Package> PackageLoader::load() {
     auto entryFunctionIndex = readLength();
     package_->setEntryFunctionIndex(entryFunctionIndex);
 
+    // The index holds the offset of every string, function, class, and type parameter record
+    // from the start of the package, so a record can be found without reading the ones
+    // before it. We read all the records in order, so we only check that the index is right.
+    word_t recordCount = static_cast<word_t>(stringCount) + functionCount +
+                         classCount + typeParameterCount;
+    vector<u32> recordOffsets(recordCount);
+    for (auto& offset : recordOffsets)
+      offset = readValue<u32>();
+    auto recordOffset = recordOffsets.begin();
+
     for (length_t i = 0; i < stringCount; i++) {
+      checkRecordOffset(*recordOffset++);
       auto string = readString();
       stringArray->set(i, *string);
     }
     for (length_t i = 0; i < functionCount; i++) {
+      checkRecordOffset(*recordOffset++);
       auto function = readFunction();
       functionArray->set(i, *function);
     }
     for (length_t i = 0; i < classCount; i++) {
+      checkRecordOffset(*recordOffset++);
       auto clas = handle(block_cast<Class>(classArray->get(i)));
       readClass(clas);
     }
     for (length_t i = 0; i < typeParameterCount; i++) {
+      checkRecordOffset(*recordOffset++);
       auto param = handle(block_cast<TypeParameter>(typeParametersArray->get(i)));
       readTypeParameter(param);
     }
@@ -372,6 +387,12 @@ Local<Type> PackageLoader::readType() {
 }
 
 
+void PackageLoader::checkRecordOffset(u32 offset) {
+  if (stream_.tellg() != static_cast<streampos>(offset))
+    throw Error("package index is corrupt");
+}
+
+
 template <typename T>
 T PackageLoader::readValue() {
   T value;